@@ -0,0 +1,23 @@
+"""Benchmarks for collecting SEDs in a catalog"""
+from sedkit import catalog
+
+from .bench_sed import synthetic_sed
+
+
+class TimeCatalog:
+    """Add different numbers of SEDs to a catalog"""
+    params = [1, 10, 100]
+    param_names = ['sources']
+    number = 1
+    repeat = 3
+    timeout = 300
+
+    def setup(self, sources):
+        self.seds = [synthetic_sed() for _ in range(sources)]
+        for n, s in enumerate(self.seds):
+            s._name = 'Synthetic {}'.format(n)
+
+    def time_add_SED(self, sources):
+        cat = catalog.Catalog(verbose=False)
+        for s in self.seds:
+            cat.add_SED(s)
@@ -0,0 +1,46 @@
+"""Benchmarks for loading the packaged data files"""
+import os
+from pkg_resources import resource_filename
+import shutil
+import tempfile
+
+from sedkit import isochrone as iso
+from sedkit import relations as rel
+from sedkit import spectrum as sp
+from sedkit import utilities as u
+
+
+LOADERS = {'AFGK_radii': lambda: u.read_table(resource_filename('sedkit', 'data/AFGK_radii.txt'), format='csv', comment='#'),
+           'DwarfSequence': lambda: rel.DwarfSequence(),
+           'Isochrone': lambda: iso.Isochrone('dmestar_solar', verbose=False),
+           'Vega': lambda: sp.Vega()}
+
+
+class TimeColdLoad:
+    """Load the packaged data with an empty cache directory"""
+    params = sorted(LOADERS)
+    param_names = ['data']
+    number = 1
+    repeat = 10
+
+    def setup(self, data):
+        self.old_cache = os.environ.get('SEDKIT_CACHE')
+        self.tmpdir = tempfile.mkdtemp()
+        os.environ['SEDKIT_CACHE'] = self.tmpdir
+
+    def teardown(self, data):
+        if self.old_cache is None:
+            del os.environ['SEDKIT_CACHE']
+        else:
+            os.environ['SEDKIT_CACHE'] = self.old_cache
+        shutil.rmtree(self.tmpdir)
+
+    def time_load(self, data):
+        LOADERS[data]()
+
+
+class TimeWarmLoad(TimeColdLoad):
+    """Load the packaged data from the binary cache"""
+    def setup(self, data):
+        super().setup(data)
+        LOADERS[data]()
@@ -0,0 +1,11 @@
+"""Benchmarks for importing sedkit"""
+
+
+def timeraw_import():
+    """Import sedkit in a fresh interpreter"""
+    return "import sedkit"
+
+
+def timeraw_import_catalog():
+    """Import the catalog module in a fresh interpreter"""
+    return "from sedkit import catalog"
@@ -0,0 +1,22 @@
+"""Benchmarks for interpolating the evolutionary models"""
+import astropy.units as q
+
+from sedkit import isochrone as iso
+
+
+# Luminosities and ages inside each model grid
+INPUTS = {'DUSTY00': ((-4.0, 0.1), (0.5 * q.Gyr, 0.1 * q.Gyr)),
+          'dmestar_solar': ((-1.0, 0.1), (5 * q.Gyr, 1 * q.Gyr))}
+
+
+class TimeIsochrone:
+    """Evaluate the evolutionary models"""
+    params = [list(INPUTS), ['radius', 'mass', 'logg']]
+    param_names = ['model', 'yparam']
+
+    def setup(self, model, yparam):
+        self.isochrone = iso.Isochrone(model, verbose=False)
+        self.lbol, self.age = INPUTS[model]
+
+    def time_evaluate(self, model, yparam):
+        self.isochrone.evaluate(self.lbol, self.age, 'Lbol', yparam, plot=False)
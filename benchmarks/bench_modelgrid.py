@@ -0,0 +1,23 @@
+"""Benchmarks for loading and fitting the packaged model grid"""
+from pkg_resources import resource_filename
+
+import astropy.units as q
+
+from sedkit import modelgrid as mg
+from sedkit import spectrum as sp
+
+
+class TimeModelGrid:
+    """Load the SpeX Prism Library and fit a spectrum to it"""
+    number = 1
+    repeat = 5
+
+    def setup(self):
+        self.grid = mg.SpexPrismLibrary()
+        self.spec = sp.FileSpectrum(resource_filename('sedkit', 'data/Gl752B_NIR.fits'), wave_units=q.um, flux_units=q.erg / q.s / q.cm**2 / q.AA)
+
+    def time_best_fit_model(self):
+        self.spec.best_fit_model(self.grid)
+
+    def time_load(self):
+        mg.SpexPrismLibrary()
@@ -0,0 +1,75 @@
+"""Benchmarks for constructing SEDs from synthetic data"""
+import astropy.units as q
+import numpy as np
+
+from sedkit import fitting
+from sedkit import sed
+from sedkit import spectrum as sp
+
+from .bench_spectrum import synthetic_spectrum
+
+
+PHOTOMETRY = [('2MASS.J', 14.0), ('2MASS.H', 13.4), ('2MASS.Ks', 13.0),
+              ('WISE.W1', 12.7), ('WISE.W2', 12.4), ('WISE.W3', 12.1)]
+
+
+def synthetic_sed(photometry=True, spectra=0):
+    """Make an SED of a nearby brown dwarf which needs no catalog queries
+
+    Parameters
+    ----------
+    photometry: bool
+        Add photometry
+    spectra: int
+        The number of spectra to add
+
+    Returns
+    -------
+    sedkit.sed.SED
+        The SED, which has not been made
+    """
+    s = sed.SED(verbose=False)
+    s._name = 'Synthetic'
+    s.parallax = 50 * q.mas, 1 * q.mas
+    s.age = 0.5 * q.Gyr, 0.1 * q.Gyr
+    if photometry:
+        for band, mag in PHOTOMETRY:
+            s.add_photometry(band, mag, 0.05)
+    for n in range(spectra):
+        s.add_spectrum(sp.Spectrum(*synthetic_spectrum(1000 * (n + 1), 0.9 + n, 2.4 + n, teff=1500)))
+
+    return s
+
+
+class TimeMakeSED:
+    """Make SEDs with different data"""
+    params = ['photometry', 'spectrum', 'both']
+    param_names = ['data']
+    number = 1
+    repeat = 10
+
+    def setup(self, data):
+        self.sed = synthetic_sed(photometry=data != 'spectrum', spectra=0 if data == 'photometry' else 2)
+
+    def time_make_sed(self, data):
+        self.sed.make_sed()
+
+
+class TimeFitBlackbody:
+    """Fit blackbodies to SEDs one at a time and all at once"""
+    params = [1, 100]
+    param_names = ['sources']
+    number = 1
+    repeat = 10
+
+    def setup(self, sources):
+        self.sed = synthetic_sed()
+        self.sed.make_sed()
+        wave, flux, unc = self.sed.app_phot_SED.data
+        self.data = wave, np.tile(flux, (sources, 1)), np.tile(unc, (sources, 1))
+
+    def time_fit_blackbody(self, sources):
+        self.sed.fit_blackbody()
+
+    def time_fit_many(self, sources):
+        fitting.fit_blackbody(*self.data)
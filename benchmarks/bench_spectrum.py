@@ -0,0 +1,85 @@
+"""Benchmarks for making, combining and resampling spectra"""
+import astropy.units as q
+import numpy as np
+from svo_filters import svo
+
+from sedkit import spectrum as sp
+from sedkit import utilities as u
+
+
+FLUX_UNITS = q.erg / q.s / q.cm**2 / q.AA
+
+
+def synthetic_spectrum(n, wave_min=0.8, wave_max=2.5, teff=3000):
+    """Make a noisy blackbody spectrum
+
+    Parameters
+    ----------
+    n: int
+        The number of points
+    wave_min: float
+        The minimum wavelength [um]
+    wave_max: float
+        The maximum wavelength [um]
+    teff: float
+        The temperature [K]
+
+    Returns
+    -------
+    list
+        The wavelength, flux and uncertainty arrays
+    """
+    rng = np.random.RandomState(n)
+    wave = np.linspace(wave_min, wave_max, n) * q.um
+    planck = 1. / (wave.value**5 * (np.exp(14387.77 / (wave.value * teff)) - 1.))
+    flux = planck / planck.max() * 1E-14 * (1 + rng.normal(scale=0.01, size=n))
+
+    return [wave, flux * FLUX_UNITS, flux * FLUX_UNITS / 100.]
+
+
+class TimeSpectrum:
+    """Make and combine spectra of different sizes"""
+    params = [1000, 10000, 100000]
+    param_names = ['points']
+
+    def setup(self, points):
+        self.data = synthetic_spectrum(points)
+        self.spec = sp.Spectrum(*self.data)
+        self.other = sp.Spectrum(*synthetic_spectrum(points, 2.0, 4.0))
+        self.new_wave = np.linspace(1.0, 2.0, points // 10)
+        self.bandpass = svo.Filter('2MASS.J')
+
+    def time_add(self, points):
+        self.spec + self.other
+
+    def time_construct(self, points):
+        sp.Spectrum(*self.data)
+
+    def time_spectres(self, points):
+        u.spectres(self.new_wave, self.data[0].value, self.data[1].value, self.data[2].value)
+
+    def time_synthetic_flux(self, points):
+        self.spec.synthetic_flux(self.bandpass)
+
+
+class TimeBlackbodyGrid:
+    """Evaluate and measure blackbodies of many temperatures"""
+    params = [10, 1000]
+    param_names = ['temperatures']
+    number = 1
+    repeat = 10
+
+    def setup(self, temperatures):
+        self.wave = np.linspace(0.3, 30, 2000) * q.um
+        self.teff = np.linspace(500, 10000, temperatures) * q.K
+        self.grid = sp.BlackbodyGrid(self.wave, self.teff)
+        self.bandpass = svo.Filter('2MASS.J')
+
+    def time_evaluate(self, temperatures):
+        sp.BlackbodyGrid(self.wave, self.teff)
+
+    def time_integrate(self, temperatures):
+        self.grid.integrate()
+
+    def time_synthetic_flux(self, temperatures):
+        self.grid.synthetic_flux(self.bandpass)
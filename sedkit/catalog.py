@@ -5,25 +5,68 @@
 """
 A module to produce a catalog of spectral energy distributions
 """
+from collections import OrderedDict
+import hashlib
+import io
 import os
 import pickle
-from copy import copy
+from copy import copy, deepcopy
+from functools import partial
+from itertools import islice
+import json
 import shutil
+import zipfile
 
 from astropy.io import ascii
 import astropy.table as at
 import astropy.units as q
 import astropy.constants as ac
+from astropy.coordinates import SkyCoord, match_coordinates_sky
 import numpy as np
-from bokeh.layouts import gridplot
-from bokeh.models import HoverTool, ColumnDataSource, LabelSet
-from bokeh.plotting import figure, show
-from bokeh.models.glyphs import Patch
 
 from .sed import SED
+from . import dustmap
+from . import fitting
+from . import isochrone as iso
+from . import metrics
+from . import parallel
+from .tablequery import Query, SortedIndex
 from . import utilities as u
 
 
+# Plotting packages are imported on first use
+gridplot = u.LazyImport('bokeh.layouts', 'gridplot')
+HoverTool = u.LazyImport('bokeh.models', 'HoverTool')
+ColumnDataSource = u.LazyImport('bokeh.models', 'ColumnDataSource')
+LabelSet = u.LazyImport('bokeh.models', 'LabelSet')
+LogColorMapper = u.LazyImport('bokeh.models', 'LogColorMapper')
+Patch = u.LazyImport('bokeh.models.glyphs', 'Patch')
+figure = u.LazyImport('bokeh.plotting', 'figure')
+
+# File and table packages are imported on first use
+h5py = u.LazyImport('h5py')
+pd = u.LazyImport('pandas')
+show = u.show
+
+
+# Bump this when saved catalog files are no longer compatible
+CATALOG_VERSION = 1
+
+# The number of rows above which numeric filters use sorted indexes
+INDEX_SIZE = 1000
+
+# The results which depend directly on each catalog setting or result
+DEPENDENCIES = {'evo_model': ['radius', 'logg', 'mass', 'Teff_evo'],
+                'flux_units': [],
+                'radius': ['Teff'],
+                'wave_units': []}
+
+# The SED methods which recalculate each result, in order
+RECALCULATE = OrderedDict([('radius', 'radius_from_age'), ('logg', 'logg_from_age'),
+                           ('mass', 'mass_from_age'), ('Teff_evo', 'teff_from_age'),
+                           ('Teff', 'get_Teff')])
+
+
 class Catalog:
     """An object to collect SED results for plotting and analysis"""
     def __init__(self, name='SED Catalog', marker='circle', color='blue', verbose=True,  **kwargs):
@@ -33,11 +76,12 @@ class Catalog:
         self.name = name
         self.marker = marker
         self.color = color
-        self.wave_units = q.um
-        self.flux_units = q.erg/q.s/q.cm**2/q.AA
+        self._wave_units = q.um
+        self._flux_units = q.erg/q.s/q.cm**2/q.AA
+        self._evo_model = None
 
         # List all the results columns
-        self.cols = ['name', 'age', 'age_unc', 'distance', 'distance_unc',
+        self.cols = ['name', 'ra', 'dec', 'age', 'age_unc', 'distance', 'distance_unc',
                      'parallax', 'parallax_unc', 'radius', 'radius_unc',
                      'spectral_type', 'spectral_type_unc', 'SpT',
                      'membership', 'reddening', 'fbol', 'fbol_unc', 'mbol',
@@ -46,35 +90,31 @@ class Catalog:
                      'mass', 'mass_unc', 'Teff', 'Teff_unc', 'Teff_evo',
                      'Teff_evo_unc', 'Teff_bb', 'SED']
 
-        # A master table of all SED results
-        self.results = at.QTable(names=self.cols, dtype=['O']*len(self.cols))
-        self.results.add_index('name')
-
-        # Set the units
-        self.results['age'].unit = q.Gyr
-        self.results['age_unc'].unit = q.Gyr
-        self.results['distance'].unit = q.pc
-        self.results['distance_unc'].unit = q.pc
-        self.results['parallax'].unit = q.mas
-        self.results['parallax_unc'].unit = q.mas
-        self.results['radius'].unit = q.Rsun
-        self.results['radius_unc'].unit = q.Rsun
-        self.results['fbol'].unit = q.erg/q.s/q.cm**2
-        self.results['fbol_unc'].unit = q.erg/q.s/q.cm**2
-        self.results['Lbol'].unit = q.erg/q.s
-        self.results['Lbol_unc'].unit = q.erg/q.s
-        self.results['mass'].unit = q.Msun
-        self.results['mass_unc'].unit = q.Msun
-        self.results['Teff'].unit = q.K
-        self.results['Teff_unc'].unit = q.K
-        self.results['Teff_bb'].unit = q.K
-        self.results['Teff_evo'].unit = q.K
-        self.results['Teff_evo_unc'].unit = q.K
+        # The units of the results columns
+        units = {'ra': q.deg, 'dec': q.deg, 'age': q.Gyr, 'distance': q.pc, 'parallax': q.mas, 'radius': q.Rsun,
+                 'fbol': q.erg/q.s/q.cm**2, 'Lbol': q.erg/q.s, 'mass': q.Msun,
+                 'Teff': q.K, 'Teff_bb': q.K, 'Teff_evo': q.K}
+        units.update({'{}_unc'.format(col): unit for col, unit in units.items() if '{}_unc'.format(col) in self.cols})
+
+        # A master store of all SED results
+        dtypes = {col: 'O' if col in ['name', 'SpT', 'membership', 'SED'] else float for col in self.cols}
+        self._store = ResultsStore([(col, dtypes[col]) for col in self.cols], units=units)
+
+        # A list of sources that could not be added
+        self.failures = []
 
         # Try to set attributes from kwargs
         for k, v in kwargs.items():
             setattr(self, k, v)
 
+    def __copy__(self):
+        """Copy the catalog without sharing the results store"""
+        new_cat = Catalog.__new__(Catalog)
+        new_cat.__dict__.update(self.__dict__)
+        new_cat._store = self._store.copy()
+
+        return new_cat
+
     def __add__(self, other, name=None):
         """Add two catalogs together
 
@@ -91,13 +131,7 @@ class Catalog:
         if not type(other) == type(self):
             raise TypeError('Cannot add object of type', type(other))
 
-        # Make a new catalog
-        new_cat = Catalog(name=name or self.name)
-
-        # Combine results
-        new_cat.results = at.vstack([self.results, other.results])
-
-        return new_cat
+        return self.merge(other, duplicates='keep', name=name)
 
     def add_SED(self, sed):
         """Add an SED to the catalog
@@ -107,74 +141,24 @@ class Catalog:
         sed: sedkit.sed.SED
             The SED object to add
         """
-        # Turn off print statements
-        sed.verbose = False
-
-        # Check the units
-        sed.wave_units = self.wave_units
-        sed.flux_units = self.flux_units
-
-        # Run the SED
-        sed.make_sed()
-
-        # Add the values and uncertainties if applicable
-        results = []
-        for col in self.cols[:-1]:
-
-            if col+'_unc' in self.cols:
-                if isinstance(getattr(sed, col), tuple):
-                    val = getattr(sed, col)[0]
-                else:
-                    val = None
-            elif col.endswith('_unc'):
-                if isinstance(getattr(sed, col.replace('_unc', '')), tuple):
-                    val = getattr(sed, col.replace('_unc', ''))[1]
-                else:
-                    val = None
-            else:
-                val = getattr(sed, col)
-
-            val = val.to(self.results[col.replace('_unc','')].unit).value if hasattr(val, 'unit') else val
-
-            results.append(val)
+        # Store the SED itself rather than a view of one in a catalog
+        if isinstance(sed, SEDProxy):
+            sed = sed._own()
 
-        # Add the SED
-        results.append(sed)
+        # Run the SED and get the results
+        row = sed_results(sed, self.cols, wave_units=self.wave_units, flux_units=self.flux_units)
 
-        # Make the table
-        cat = Catalog()
-        table = cat.results
-        table.add_row(results)
-        table = at.Table(table)
-
-        # Append apparent and absolute photometry
-        for row in sed.photometry:
-
-            # Add the apparent magnitude
-            table.add_column(at.Column([row['app_magnitude']], name=row['band']))
-
-            # Add the apparent uncertainty
-            table.add_column(at.Column([row['app_magnitude_unc']], name=row['band']+'_unc'))
-
-            # Add the absolute magnitude
-            table.add_column(at.Column([row['abs_magnitude']], name='M_'+row['band']))
-
-            # Add the absolute uncertainty
-            table.add_column(at.Column([row['abs_magnitude_unc']], name='M_'+row['band']+'_unc'))
-
-        # Stack with current table
-        if len(self.results) == 0:
-            self.results = table
-        else:
-            self.results = at.vstack([self.results, table])
+        # Append to the store
+        self._store.append(row)
 
         if self.verbose:
             print("Successfully added SED '{}'".format(sed.name))
 
     def export(self, parentdir='.', dirname=None, format='ipac',
-               sources=True, zipped=False):
+               sources=True, zipped=False, plots=False, processes=None):
         """
-        Exports the results table and a directory of all SEDs
+        Exports the results table and a directory of all SEDs, only
+        rewriting the sources which changed since a previous export
 
         Parameters
         ----------
@@ -188,7 +172,14 @@ class Catalog:
             Export a directory of all source SEDs too
         zipped: bool
             Zip the directory
+        plots: bool
+            Render a PNG of each SED plot, unless running headless
+        processes: int (optional)
+            The number of processes to export the SEDs with, default is the
+            sedkit.parallel backend
         """
+        plots = plots and not u.headless()
+
         # Check the parent directory
         if not os.path.exists(parentdir):
             raise IOError('No such target directory', parentdir)
@@ -198,41 +189,98 @@ class Catalog:
         dirname = dirname or name
         dirpath = os.path.join(parentdir, dirname)
 
-        # Remove '.' from column names
-        final = self.results.filled(np.nan)
+        # Remove the SEDs and '.' from column names
+        final = self.results
+        final = final[[col for col in final.colnames if col != 'SED']].filled(np.nan)
         for col in final.colnames:
             final.rename_column(col, col.replace('.', '_'))
 
-        # Write a directory of results and all SEDs...
-        if sources:
+        # Just write the results table...
+        if not sources:
+            final.write(dirpath + '_results.txt', format=format)
+            return
 
-            # Make a directory
-            if not os.path.exists(dirpath):
-                os.system('mkdir {}'.format(dirpath))
-            else:
-                raise IOError('Directory already exists:', dirpath)
+        # ...or a directory of results and all SEDs, updating a previous export
+        target = dirpath + '.zip' if zipped else dirpath
+        previous = read_manifest(target)
+        if previous is None and os.path.exists(target):
+            raise IOError('Directory already exists:', target)
+
+        # Export the results table
+        buf = io.StringIO()
+        final.write(buf, format=format)
+        files = OrderedDict([('{}_results.txt'.format(name), buf.getvalue().encode('utf-8'))])
+
+        # Hash the sources to find the ones which changed
+        manifest, changed = OrderedDict(), []
+        for idx, sed in enumerate(self._store.column('SED')):
+            if sed is None:
+                continue
+
+            state = sed.get_state()
+            source = state['name'].replace(' ', '_')
+            if source in manifest:
+                source = '{}_{}'.format(source, idx)
+
+            digest = state_hash(state, plots)
+            old = (previous or {}).get(source, {})
+            manifest[source] = {'hash': digest, 'files': old.get('files', [])}
+            if old.get('hash') != digest:
+                changed.append((source, sed))
+
+        # Export the changed SEDs
+        exported = {}
+        with parallel.get_executor(processes) as executor:
+            for (source, _), sed_files in zip(changed, executor.imap(partial(export_source, plots=plots), [sed for _, sed in changed])):
+                exported[source] = sed_files
+
+        for source, sed_files in exported.items():
+            manifest[source]['files'] = list(sed_files)
 
-            # Export the results table
-            resultspath = os.path.join(dirpath,'{}_results.txt'.format(name))
-            final.write(resultspath, format=format)
+        if self.verbose:
+            print('Exporting {} of {} sources to {}'.format(len(changed), len(manifest), target))
+
+        # Write the zip file, copying unchanged sources from the old one...
+        if zipped:
+            tmpfile = '{}.{}.tmp'.format(target, os.getpid())
+            old = zipfile.ZipFile(target, 'r') if previous is not None else None
+            try:
+                with zipfile.ZipFile(tmpfile, 'w', zipfile.ZIP_DEFLATED) as archive:
+                    for filename, data in files.items():
+                        archive.writestr(filename, data)
 
-            # Make a sources directory
-            sourcedir = os.path.join(dirpath,'sources')
-            os.system('mkdir {}'.format(sourcedir))
+                    for source, entry in manifest.items():
+                        for filename in entry['files']:
+                            arcname = '/'.join(['sources', source, filename])
+                            data = exported[source][filename] if source in exported else old.read(arcname)
+                            archive.writestr(arcname, data)
 
-            # Export all SEDs
-            for source in self.results['SED']:
-                source.export(sourcedir)
+                    archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+            finally:
+                if old is not None:
+                    old.close()
 
-            # zip if desired
-            if zipped:
-                shutil.make_archive(dirpath, 'zip', dirpath)
-                os.system('rm -R {}'.format(dirpath))
+            os.replace(tmpfile, target)
 
-        # ...or just write the results table
+        # ...or update the directory
         else:
-            resultspath = dirpath+'_results.txt'
-            final.write(resultspath, format=format)
+            sourcedir = os.path.join(dirpath, 'sources')
+            os.makedirs(sourcedir, exist_ok=True)
+
+            # Remove sources which are gone or changed
+            for source in os.listdir(sourcedir):
+                if source not in manifest or source in exported:
+                    shutil.rmtree(os.path.join(sourcedir, source))
+
+            for source, sed_files in exported.items():
+                os.makedirs(os.path.join(sourcedir, source))
+                files.update((os.path.join('sources', source, filename), data) for filename, data in sed_files.items())
+
+            # Write the manifest last so an interrupted export is redone
+            files['manifest.json'] = json.dumps(manifest, indent=2).encode('utf-8')
+            for filename, data in files.items():
+                with open(os.path.join(dirpath, filename), 'wb') as f:
+                    f.write(data)
 
     def filter(self, param, value):
         """Retrieve the filtered rows
@@ -244,21 +292,81 @@ class Catalog:
         value: str, float, int, sequence
             The criteria to filter by, 
             which can be single valued like 1400
-            or a range with operators [<,<=,>,>=],
-            e.g. (>1200,<1400), ()
+            or a range with operators [<,<=,>,>=,==,!=],
+            e.g. ('>1200', '<1400'), a wildcard like 'M*',
+            or alternatives like '<1200|>1400'
 
         Returns
         -------
         sedkit.sed.Catalog
             The filtered catalog
         """
+        # Get the rows, using the sorted indexes of large catalogs
+        query = Query(**{param: value})
+        indexes = self._store.index if len(self._store) >= INDEX_SIZE else None
+        mask = query.mask(self._store, indexes=indexes)
+
         # Make a new catalog
         cat = Catalog()
-        cat.results = u.filter_table(self.results, **{param: value})
+        cat._store = self._store.select(mask)
 
         return cat
 
-    def from_file(self, filepath, run_methods=['find_2MASS'], delimiter=','):
+    def fit_blackbody(self, fit_to='app_phot_SED', teff_grid=fitting.BLACKBODY_TEFFS):
+        """Fit blackbodies to all the SEDs in one vectorized call and store
+        the temperatures in the Teff_bb column
+
+        Parameters
+        ----------
+        fit_to: str
+            The attribute name of the [W, F, E] of each SED to fit
+        teff_grid: array-like
+            The temperatures [K] to search
+
+        Returns
+        -------
+        sequence
+            The temperature [K] and its uncertainty [K] of each source,
+            which are NaN if it could not be fit
+        """
+        # Get the data of each SED
+        idxs, data = [], []
+        seds = self._store.column('SED')
+        for idx, sed in enumerate(seds):
+            if sed is None:
+                continue
+            if isinstance(sed, LazySED):
+                sed = seds[idx] = sed.load()
+            if not sed.calculated:
+                sed.make_sed()
+
+            spec = getattr(sed, fit_to)
+            if spec is not None:
+                w, f, e = u.scrub(spec.data)[:3]
+                idxs.append(idx)
+                data.append([w * sed.wave_units.to(q.um), f, e])
+
+        teff = np.full(len(self._store), np.nan)
+        teff_unc = np.full(len(self._store), np.nan)
+        if len(data) == 0:
+            return teff, teff_unc
+
+        # Pad the data with NaNs to fit them as arrays
+        arrays = np.full((3, len(data), max(len(w) for w, f, e in data)), np.nan)
+        for n, row in enumerate(data):
+            arrays[:, n, :len(row[0])] = row
+        fit = fitting.fit_blackbody(*arrays, teff_grid=teff_grid)
+
+        # Store the results
+        for n, idx in enumerate(idxs):
+            sed = seds[idx]
+            sed.set_blackbody(*[i[n] for i in fit[:3]], fit_to=fit_to)
+            teff[idx], teff_unc[idx] = fit[0][n], fit[1][n]
+            self._store.update(idx, {'Teff_bb': sed.Teff_bb})
+
+        return teff, teff_unc
+
+    def from_file(self, filepath, run_methods=['find_2MASS'], delimiter=',', processes=None, checkpoint=None, checkpoint_every=100):
         """Generate a catalog from a file of source names and coordinates
 
         Parameters
@@ -269,26 +377,68 @@ class Catalog:
             A list of methods to run
         delimiter: str
             The column delimiter of the ASCII file
+        processes: int (optional)
+            The number of processes to build the SEDs on. The default is
+            the shared sedkit.parallel executor, which uses a pool of
+            processes unless configured otherwise, so pass 1 to build them
+            serially as before
+        checkpoint: str
+            The path to a checkpoint file, which is resumed from if it exists
+            and removed when all the rows have been processed
+        checkpoint_every: int
+            The number of finished sources between checkpoints
         """
         # Get the table of sources
-        data = ascii.read(filepath, delimiter=delimiter)
+        rows = [row for chunk in read_sources(filepath, delimiter=delimiter) for row in chunk]
+
+        # Resume from the checkpoint, skipping the rows already processed
+        # by their index as names may be repeated
+        done = set()
+        if checkpoint is not None and os.path.isfile(checkpoint):
+            for batch in read_checkpoint(checkpoint):
+                for row in batch['rows']:
+                    self._store.append(row)
+                self.failures += batch['failures']
+                done.update(batch['done'])
+
+            if self.verbose:
+                print("Resuming from {} with {} sources processed".format(checkpoint, len(done)))
+
+        rows = [(idx, row) for idx, row in enumerate(rows) if idx not in done]
 
         if self.verbose:
-            print("Generating SEDs for {} sources from {}".format(len(data), filepath))
+            print("Generating SEDs for {} sources from {}".format(len(rows), filepath))
 
-        # Iterate over table
-        for row in data:
+        # Build the SEDs
+        func = partial(process_row, run_methods=run_methods, cols=self.cols,
+                       wave_units=self.wave_units, flux_units=self.flux_units)
 
-            # Make the SED
-            s = SED(row['name'], verbose=False)
-            if 'ra' in row and 'dec' in row:
-                s.sky_coords = row['ra']*q.deg, row['dec']*q.deg
+        # Add each SED as it finishes
+        batch = {'rows': [], 'failures': [], 'done': []}
+        with parallel.get_executor(processes) as executor:
+            for idx, name, row, error in executor.imap(func, rows, ordered=False):
 
-            # Run the desired methods
-            s.run_methods(run_methods)
+                if error is None:
+                    self._store.append(row)
+                    batch['rows'].append(row)
+                else:
+                    self.failures.append({'name': name, 'error': error})
+                    batch['failures'].append(self.failures[-1])
+                    if self.verbose:
+                        print("Could not add SED '{}': {}".format(name, error))
+                batch['done'].append(idx)
+
+                # Write a checkpoint
+                if checkpoint is not None and len(batch['done']) >= checkpoint_every:
+                    write_checkpoint(checkpoint, batch)
+                    batch = {'rows': [], 'failures': [], 'done': []}
 
-            # Add it to the catalog
-            self.add_SED(s)
+        # Remove the finished checkpoint
+        if checkpoint is not None and os.path.isfile(checkpoint):
+            os.remove(checkpoint)
+
+        if self.verbose:
+            print("Added {} SEDs with {} failures".format(len(self._store), len(self.failures)))
 
     def get_data(self, *args):
         """Fetch the data for the given columns
@@ -316,48 +466,236 @@ class Catalog:
 
         return results
 
+    def get_metrics(self, per_source=False):
+        """Get the time spent in each stage of the pipeline by the SEDs in
+        the catalog, which are recorded when sedkit.metrics is enabled
+
+        Parameters
+        ----------
+        per_source: bool
+            Give the metrics of each source rather than the totals
+
+        Returns
+        -------
+        astropy.table.Table
+            The calls, time and array size of each stage
+        """
+        # Get the metrics of the SEDs which were built in this session
+        names = self._store.column('name')
+        recorded = [(name, getattr(sed, 'metrics', None)) for name, sed in zip(names, self._store.column('SED'))]
+        recorded = [(name, rec) for name, rec in recorded if rec is not None and len(rec) > 0]
+
+        # Totals of each stage
+        if not per_source:
+            total = metrics.Metrics()
+            for name, rec in recorded:
+                total.merge(rec)
+            table = total.to_table()
+            table['sources'] = [sum(stage in rec.stages for _, rec in recorded) for stage in table['stage']]
+
+            return table
+
+        # A row for each stage of each source
+        tables = []
+        for name, rec in recorded or [('', metrics.Metrics())]:
+            table = rec.to_table()
+            table.add_column(at.Column([name] * len(table), name='name', dtype='O'), index=0)
+            tables.append(table)
+
+        return at.vstack(tables)
+
+    def get_reddening(self):
+        """Look up the reddening of every source with coordinates and a
+        distance in one vectorized query of the sedkit.dustmap
+
+        Returns
+        -------
+        np.ndarray
+            The E(B-V) of each source, which is NaN if it could not be found
+        """
+        ra, dec, dist = [self._store.column(col) for col in ['ra', 'dec', 'distance']]
+        red = np.full(len(self._store), np.nan)
+
+        valid = np.isfinite(ra) & np.isfinite(dec) & np.isfinite(dist)
+        if np.any(valid):
+            coords = SkyCoord(ra=ra[valid] * q.deg, dec=dec[valid] * q.deg, frame='icrs')
+            red[valid] = dustmap.query(coords, dist[valid] * self._store.units['distance'])
+
+        return red
+
     def get_SED(self, name_or_idx):
-        """Retrieve the SED for the given object
+        """Retrieve the SED for the given object, rebuilding it from the
+        catalog file if it was loaded lazily
 
         Parameters
         ----------
         idx_or_name: str, int
             The name or index of the SED to get
         """
-        # Add the index
-        self.results.add_index('name')
+        # Get the row
+        idx = None
+        if isinstance(name_or_idx, str):
+            rows = self._store.rows(name_or_idx)
+            if len(rows) > 0:
+                idx = rows[0]
 
-        # Get the rows
-        if isinstance(name_or_idx, str) and name_or_idx in self.results['name']:
-            return copy(self.results.loc[name_or_idx]['SED'])
-
-        elif isinstance(name_or_idx, int) and name_or_idx <= len(self.results):
-            return copy(self.results[name_or_idx]['SED'])
+        elif isinstance(name_or_idx, (int, np.integer)) and 0 <= name_or_idx < len(self._store):
+            idx = name_or_idx
 
-        else:
+        if idx is None:
             if self.verbose:
                 print('Could not retrieve SED', name_or_idx)
 
             return
 
-    def load(self, file):
-        """Load a saved Catalog"""
-        if os.path.isfile(file):
+        # Rebuild a saved SED once
+        seds = self._store.column('SED')
+        if isinstance(seds[idx], LazySED):
+            seds[idx] = seds[idx].load()
+
+        return SEDProxy(seds[idx])
+
+    def load(self, file, columns=None):
+        """Load a saved Catalog
+
+        Parameters
+        ----------
+        file: str
+            The path to the catalog file
+        columns: sequence (optional)
+            The names of the result columns to read, which are all read by
+            default. The SEDs are only rebuilt by get_SED.
+        """
+        if not os.path.isfile(file):
+            raise IOError('No such file:', file)
+
+        # Catalogs saved before the HDF5 format are a pickled results table
+        if not h5py.is_hdf5(file):
+            with open(file, 'rb') as f:
+                self.results = pickle.load(f)
+
+            return
+
+        filepath = os.path.abspath(file)
+        with h5py.File(filepath, 'r') as f:
+
+            # Check the version
+            if f.attrs['version'] > CATALOG_VERSION:
+                raise IOError("Catalog file version {} is newer than the supported version {}".format(f.attrs['version'], CATALOG_VERSION))
+
+            # Set the metadata
+            meta = json.loads(f.attrs['metadata'])
+            self.name = meta['name']
+            self.marker = meta['marker']
+            self.color = meta['color']
+            self._wave_units = q.Unit(meta['wave_units'])
+            self._flux_units = q.Unit(meta['flux_units'])
+            self._evo_model = meta.get('evo_model', self._evo_model)
+            self.failures = json.loads(f.attrs.get('failures', '[]'))
+
+            # Read only the requested columns
+            results = f['results']
+            size = int(f.attrs['size'])
+            store = ResultsStore(capacity=max(16, size))
+            for name in json.loads(f.attrs['columns']):
+                if columns is not None and name not in columns and name not in ['name', 'SED']:
+                    continue
+
+                # Get the saved SEDs
+                if name == 'SED':
+                    keys = set(f['SEDs'].keys())
+                    vals = [LazySED(filepath, str(n)) if str(n) in keys else None for n in range(size)]
+                    store.add_column(name, 'O')
+
+                # Get the results
+                else:
+                    data = results[name]
+                    unit = data.attrs.get('unit')
+                    if data.attrs['dtype'] == 'O':
+                        vals = [v.decode('utf-8') if isinstance(v, bytes) else v for v in data[()]]
+                        vals = [None if v == '' else v for v in vals]
+                    else:
+                        vals = data[()]
+                    store.add_column(name, data.attrs['dtype'], unit=q.Unit(unit) if unit else None)
+
+                store._columns[name][:size] = vals
+
+            store._size = size
+            store._index_names()
+
+        self._store = store
+
+        if self.verbose:
+            print('Catalog loaded from', file)
+
+    def merge(self, other, on='name', duplicates='keep', radius=1*q.arcsec, name=None):
+        """Merge another catalog into a copy of this one, aligning the
+        columns and joining the sources which appear in both
+
+        Parameters
+        ----------
+        other: sedkit.catalog.Catalog
+            The Catalog to merge
+        on: str
+            Match sources by 'name' or sky 'position'
+        duplicates: str
+            Keep the rows of matched sources from both catalogs ('keep'),
+            only this one ('first') or only the other ('last'), or keep this
+            one and fill its missing values from the other ('fill')
+        radius: astropy.units.quantity.Quantity
+            The largest separation of sources matched by position
+        name: str
+            The name of the merged catalog
+
+        Returns
+        -------
+        sedkit.catalog.Catalog
+            The merged catalog
+        """
+        if not type(other) == type(self):
+            raise TypeError('Cannot merge object of type', type(other))
+
+        if duplicates not in ['keep', 'first', 'last', 'fill']:
+            raise ValueError("{}: Please use 'keep', 'first', 'last' or 'fill' duplicates.".format(duplicates))
+
+        # Match the rows of the sources in both catalogs
+        left, right = self._store, other._store
+        if duplicates == 'keep':
+            lrows = rrows = np.array([], dtype=int)
+        else:
+            lrows, rrows = match_rows(left, right, on=on, radius=radius)
+
+        # Drop the rows of duplicates from one catalog
+        lkeep = np.ones(len(left), dtype=bool)
+        rkeep = np.ones(len(right), dtype=bool)
+        if duplicates == 'last':
+            lkeep[lrows] = False
+        elif duplicates in ['first', 'fill']:
+            rkeep[rrows] = False
+
+        store = ResultsStore.concat([left, right], rows=[lkeep, rkeep])
+
+        # Fill missing values of kept rows, which did not move
+        if duplicates == 'fill' and len(lrows) > 0:
+            lrows, first = np.unique(lrows, return_index=True)
+            store.fill(lrows, right, rrows[first])
 
-            f = open(file)
-            cat = pickle.load(f)
-            f.close()
+        # Make a new catalog with the same settings
+        new_cat = Catalog.__new__(Catalog)
+        new_cat.__dict__.update(self.__dict__)
+        new_cat.name = name or self.name
+        new_cat.failures = self.failures + other.failures
+        new_cat._store = store
 
-            f = open(file, 'rb')
-            cat = pickle.load(f)
-            f.close()
+        if self.verbose and duplicates != 'keep':
+            print('Matched {} of {} sources in {}'.format(len(rrows), len(right), other.name))
 
-            self.results = cat
+        return new_cat
 
     def plot(self, x, y, marker=None, color=None, scale=['linear','linear'],
              xlabel=None, ylabel=None, fig=None, order=None, data=None,
              identify=None, id_color='red', label_points=False, exclude=None,
-             **kwargs):
+             mode='auto', max_points=5000, bins=100, **kwargs):
         """Plot parameter x versus parameter y
 
         Parameters
@@ -378,8 +716,9 @@ class Catalog:
              The label for the y-axis 
         fig: bokeh.plotting.figure (optional)
              The figure to plot on
-        order: int
-             The polynomial order to fit
+        order: int, str
+             The polynomial order to fit, or 'best' to choose the best
+             polynomial or spline by cross-validation
         data: dict
              Additional data to add to the plot
         identify: idx, str, sequence
@@ -388,47 +727,50 @@ class Catalog:
              The color of the identified points
         label_points: bool
              Print the name of the object next to the point
+        mode: str
+             Plot every point with 'points', a random subset of max_points
+             with 'downsample', a 2D histogram with 'binned', or 'auto' to
+             bin when there are more than max_points
+        max_points: int
+             The maximum number of points to send to the browser
+        bins: int
+             The number of bins along each axis in 'binned' mode
 
         Returns
         -------
         bokeh.plotting.figure.Figure
              The figure object
         """
-        # Grab the source and valid params
-        source = copy(self.source)
-        params = [k for k in source.column_names if not k.endswith('_unc')]
-
-        # Check if the x parameter is a color
-        if '-' in x and all([i in params for i in x.split('-')]):
-            colordata = self.get_data(x)[0]
-            if len(colordata) == 3:
-                _ = source.add(colordata[0], x)
-                _ = source.add(colordata[1], '{}_unc'.format(x))
-                params.append(x)
-
-        # Check if the y parameter is a color
-        if '-' in y and all([i in params for i in y.split('-')]):
-            colordata = self.get_data(y)[0]
-            if len(colordata) == 3:
-                _ = source.add(colordata[0], y)
-                _ = source.add(colordata[1], '{}_unc'.format(y))
-                params.append(y)
-
         # Check the params are in the table
+        params = [k for k in self._store.colnames if not k.endswith('_unc') and k != 'SED']
+        params += [p for p in [x, y] if '-' in p and all([i in params for i in p.split('-')])]
         if x not in params:
             raise ValueError("'{}' is not a valid x parameter. Please choose from {}".format(x, params))
         if y not in params:
             raise ValueError("'{}' is not a valid y parameter. Please choose from {}".format(y, params))
 
+        # Get the data
+        names = self._store.column('name')
+        xval, xerr, xunit = self._plot_data(x)
+        yval, yerr, yunit = self._plot_data(y)
+        valid, = np.where(np.isfinite(xval) & np.isfinite(yval))
+
+        # Choose how to render the points
+        if mode == 'auto':
+            mode = 'points' if len(valid) <= max_points else 'binned'
+        if mode not in ['points', 'downsample', 'binned']:
+            raise ValueError("'{}' is not a valid mode. Please choose from ['auto', 'points', 'downsample', 'binned']".format(mode))
+        if mode == 'downsample' and len(valid) > max_points:
+            valid = np.sort(np.random.RandomState(0).choice(valid, max_points, replace=False))
+
         # Make the figure
         if fig is None:
 
-            # Tooltip names can't have '.' or '-'
-            xname = source.add(source.data[x], x.replace('.', '_').replace('-', '_'))
-            yname = source.add(source.data[y], y.replace('.', '_').replace('-', '_'))
-
             # Set up hover tool
-            tips = [('Name', '@name'), (x, '@{}'.format(xname)), (y, '@{}'.format(yname))]
+            if mode == 'binned':
+                tips = [('Sources', '@count')]
+            else:
+                tips = [('Name', '@name'), (x, '@x'), (y, '@y')]
             hover = HoverTool(tooltips=tips, names=['points'])
 
             # Make the plot
@@ -438,76 +780,72 @@ class Catalog:
                          y_axis_type=scale[1], x_axis_type=scale[0], 
                          tools=TOOLS)
 
-        # # Exclude sources
-        # if exclude is not None:
-        #     exc_idx = [i for i, v in enumerate(source.data['name']) if v in exclude]
-        #     patches = {x : [(i, np.nan) for i in exc_idx],
-        #                y : [(i, np.nan) for i in exc_idx]}
-        #
-        #     source.patch(patches)
-
-        # Get marker class
         size = kwargs.get('size', 8)
         kwargs['size'] = size
-        marker = getattr(fig, marker or self.marker)
         color = color or self.color
-        marker(x, y, source=source, color=color, fill_alpha=0.7, name='points', **kwargs)
-
-        # Plot y errorbars
-        yval, yerr = source.data[y], source.data['{}_unc'.format(y)]
-        yval[yval == None] = np.nan
-        yerr[yerr == None] = np.nan
-        y_err_x = [(i, i) for i in source.data[x]]
-        y_err_y = [(i, j) for i, j in zip(yval - yerr, yval + yerr)]
-        fig.multi_line(y_err_x, y_err_y, color=color)
-
-        # Plot x errorbars
-        xval, xerr = source.data[x], source.data['{}_unc'.format(x)]
-        xval[xval == None] = np.nan
-        xerr[xerr == None] = np.nan
-        x_err_y = [(i, i) for i in source.data[y]]
-        x_err_x = [(i, j) for i, j in zip(xval - xerr, xval + xerr)]
-        fig.multi_line(x_err_x, x_err_y, color=color)
-
-        # Label points
-        if label_points:
-            labels = LabelSet(x=x, y=y, text='name', level='glyph', x_offset=5, y_offset=5, source=source, render_mode='canvas')
-            fig.add_layout(labels)
+
+        # Plot the number of sources in each bin
+        if mode == 'binned':
+            xedges = bin_edges(xval[valid], bins, scale[0])
+            yedges = bin_edges(yval[valid], bins, scale[1])
+            counts, _, _ = np.histogram2d(xval[valid], yval[valid], bins=[xedges, yedges])
+            i, j = np.nonzero(counts)
+            bin_source = ColumnDataSource(dict(left=xedges[i], right=xedges[i + 1], bottom=yedges[j], top=yedges[j + 1], count=counts[i, j]))
+            mapper = LogColorMapper(palette='Viridis256', low=1, high=max(counts.max(), 2))
+            fig.quad(left='left', right='right', bottom='bottom', top='top', source=bin_source,
+                     fill_color={'field': 'count', 'transform': mapper}, line_color=None, name='points')
+
+        # Plot the points
+        else:
+            xv, xe, yv, ye = xval[valid], xerr[valid], yval[valid], yerr[valid]
+            source = ColumnDataSource(dict(name=list(names[valid]), x=xv, y=yv))
+            marker = getattr(fig, marker or self.marker)
+            marker('x', 'y', source=source, color=color, fill_alpha=0.7, name='points', **kwargs)
+
+            # Plot y and x errorbars
+            fig.segment(xv, yv - ye, xv, yv + ye, color=color)
+            fig.segment(xv - xe, yv, xv + xe, yv, color=color)
+
+            # Label points
+            if label_points:
+                labels = LabelSet(x='x', y='y', text='name', level='glyph', x_offset=5, y_offset=5, source=source, render_mode='canvas')
+                fig.add_layout(labels)
 
         # Fit polynomial
-        if isinstance(order, int):
+        if isinstance(order, int) or order == 'best':
 
             # Only fit valid values
-            idx = [n for n, (i, j) in enumerate(zip(xval, yval)) if not hasattr(i, 'mask') and not np.isnan(i) and not hasattr(j, 'mask') and not np.isnan(j)]
-            xd = np.array(xval, dtype=float)[idx]
-            yd = np.array(yval, dtype=float)[idx]
-            ye = np.array(yerr, dtype=float)[idx]
+            fit, = np.where(np.isfinite(xval) & np.isfinite(yval))
+            xd, yd, ye = xval[fit], yval[fit], yerr[fit]
 
             # Plot data
             label = 'Order {} fit'.format(order)
             xaxis = np.linspace(min(xd), max(xd), 100)
-            coeffs = None
+            model = None
 
-            # Fit the polynomial
+            # Fit the polynomial or choose the best model
             try:
-                coeffs, cov = np.polyfit(x=xd, y=yd, deg=order, w=1./ye, cov=True)
+                if order == 'best':
+                    model = fitting.fit_relation(xd, yd, ye)
+                    label = 'Best fit ({} {})'.format(model.kind, model.param)
+                else:
+                    try:
+                        coeffs, cov = np.polyfit(x=xd, y=yd, deg=order, w=1./ye, cov=True)
+                    except Exception:
+                        coeffs, cov = np.polyfit(x=xd, y=yd, deg=order, cov=True)
+                    if not any([np.isnan(i) for i in coeffs]):
+                        model = fitting.RelationFit('polynomial', order, coeffs, C_p=cov)
             except Exception:
-                try:
-                    coeffs, cov = np.polyfit(x=xd, y=yd, deg=order, cov=True)
-                except:
-                    pass
+                pass
 
             # Plot the line
-            if coeffs is None or any([np.isnan(i) for i in coeffs]):
+            if model is None:
                 if self.verbose:
                     print("Could not fit that data with an order {} polynomial".format(order))
             else:
 
                 # Calculate values and 1-sigma
-                TT = np.vstack([xaxis**(order-i) for i in range(order+1)]).T
-                yaxis = np.dot(TT, coeffs)
-                C_yi = np.dot(TT, np.dot(cov, TT.T))
-                sig = np.sqrt(np.diag(C_yi))
+                yaxis, sig = model.evaluate(xaxis)
 
                 # Plot the line and shaded error
                 fig.line(xaxis, yaxis, legend=label, color=color, line_alpha=0.3)
@@ -518,25 +856,20 @@ class Catalog:
                 fig.add_glyph(err_source, glyph)
 
         # Set axis labels
-        xunit = source.data[x].unit
-        yunit = source.data[y].unit
         fig.xaxis.axis_label = '{}{}'.format(x, ' [{}]'.format(xunit) if xunit else '')
         fig.yaxis.axis_label = '{}{}'.format(y, ' [{}]'.format(yunit) if yunit else '')
 
         # Formatting
         fig.legend.location = "top_right"
 
-        # Identify sources
-        if isinstance(identify, list):
-            id_cat = Catalog('Identified')
-            for obj_id in identify:
-                obj_result = self.get_SED(obj_id)
-                if str(type(obj_result)) != "<class 'astropy.table.column.Column'>":
-                    obj_result = [obj_result]
-                for obj in obj_result:
-                    id_cat.add_SED(obj)
-            fig = id_cat.plot(x, y, fig=fig, size=size+5, marker='circle', line_color=id_color, fill_color=None, line_width=2, label_points=True)
-            del id_cat
+        # Identify sources from the existing results
+        if identify is not None:
+            ids = identify if isinstance(identify, (list, tuple)) else [identify]
+            rows = [row for obj_id in ids for row in (self._store.rows(obj_id) if isinstance(obj_id, str) else [obj_id])]
+            id_source = ColumnDataSource(dict(name=list(names[rows]), x=xval[rows], y=yval[rows]))
+            fig.circle('x', 'y', source=id_source, size=size+5, line_color=id_color, fill_color=None, line_width=2)
+            labels = LabelSet(x='x', y='y', text='name', level='glyph', x_offset=5, y_offset=5, source=id_source, render_mode='canvas')
+            fig.add_layout(labels)
 
         return fig
 
@@ -587,15 +920,12 @@ class Catalog:
         name_or_idx: str, int
             The name or index of the SED to remove
         """
-        # Add the index
-        self.results.add_index('name')
-
         # Get the rows
-        if isinstance(name_or_idx, str) and name_or_idx in self.results['name']:
-            self.results = self.results[self.results['name'] != name_or_idx]
+        if isinstance(name_or_idx, str) and self._store.rows(name_or_idx):
+            self._store.remove(self._store.rows(name_or_idx))
 
-        elif isinstance(name_or_idx, int) and name_or_idx <= len(self.results):
-            self.results.remove_row([name_or_idx])
+        elif isinstance(name_or_idx, (int, np.integer)) and 0 <= name_or_idx < len(self._store):
+            self._store.remove([name_or_idx])
 
         else:
             if self.verbose:
@@ -604,36 +934,1531 @@ class Catalog:
             return
 
     def save(self, file):
-        """Save the serialized data
+        """Save the catalog as an HDF5 file with a dataset for each column
+        of results and a group for each SED
 
         Parameters
         ----------
         file: str
             The filepath
         """
-        path = os.path.dirname(file)
+        path = os.path.dirname(file) or '.'
+        if not os.path.exists(path):
+            raise IOError('No such directory:', path)
+
+        # Write to a temporary file so SEDs can be copied from the same file
+        tmpfile = '{}.{}.tmp'.format(file, os.getpid())
+        sources = {}
+        try:
+            with h5py.File(tmpfile, 'w') as f:
+
+                # Save the metadata
+                f.attrs['version'] = CATALOG_VERSION
+                f.attrs['size'] = len(self._store)
+                f.attrs['columns'] = json.dumps(self._store.colnames)
+                f.attrs['metadata'] = json.dumps(self._metadata())
+                f.attrs['failures'] = json.dumps(self.failures)
+
+                # Save each column of results
+                results = f.create_group('results')
+                for name in self._store.colnames:
+                    if name == 'SED':
+                        continue
+
+                    col = self._store.column(name)
+                    if col.dtype.kind == 'f':
+                        data = results.create_dataset(name, data=col)
+                    else:
+                        vals = ['' if v is None else str(v) for v in col]
+                        data = results.create_dataset(name, data=vals, dtype=h5py.special_dtype(vlen=str))
+                    data.attrs['dtype'] = col.dtype.str if col.dtype.kind == 'f' else 'O'
+                    unit = self._store.units.get(name)
+                    if unit is not None:
+                        data.attrs['unit'] = unit.to_string()
+
+                # Save each SED
+                seds = f.create_group('SEDs')
+                for n, sed in enumerate(self._store.column('SED')):
+
+                    # Copy SEDs which were never rebuilt
+                    if isinstance(sed, LazySED):
+                        if sed.filepath not in sources:
+                            sources[sed.filepath] = h5py.File(sed.filepath, 'r')
+                        sources[sed.filepath].copy(sources[sed.filepath]['SEDs'][sed.key], seds, name=str(n))
+
+                    elif sed is not None:
+                        write_state(seds.create_group(str(n)), sed.get_state())
+
+        finally:
+            for source in sources.values():
+                source.close()
+
+        os.replace(tmpfile, file)
+
+        # Point unbuilt SEDs to the new file
+        seds = self._store.column('SED')
+        for n, sed in enumerate(seds):
+            if isinstance(sed, LazySED):
+                seds[n] = LazySED(os.path.abspath(file), str(n))
 
-        if os.path.exists(path):
+        if self.verbose:
+            print('Catalog saved to', file)
 
-            # Make the file if necessary
-            if not os.path.isfile(file):
-                os.system('touch {}'.format(file))
+    def stream(self, filepath, sink, run_methods=['find_2MASS'], delimiter=',', chunksize=1000, processes=None, artifacts=False):
+        """Generate a catalog file from a source list without keeping the
+        SEDs or results in memory
 
-            # Write the file
-            f = open(file, 'wb')
-            pickle.dump(self.results, f, pickle.HIGHEST_PROTOCOL)
-            f.close()
+        Parameters
+        ----------
+        filepath: str
+            The path to an ASCII file of source names and coordinates
+        sink: str
+            The path to the catalog file to write, which can be read
+            with Catalog.load
+        run_methods: list
+            A list of methods to run
+        delimiter: str
+            The column delimiter of the ASCII file
+        chunksize: int
+            The number of sources to read and process at a time
+        processes: int (optional)
+            The number of processes to build the SEDs on, default is the
+            sedkit.parallel backend
+        artifacts: bool
+            Save the state of each SED so it can be rebuilt by get_SED
+        """
+        func = partial(process_source, run_methods=run_methods, cols=self.cols,
+                       wave_units=self.wave_units, flux_units=self.flux_units,
+                       output='state' if artifacts else 'results')
+
+        with parallel.get_executor(processes) as executor:
+            with CatalogWriter(sink, self._metadata(), units=self._store.units, objects=['name', 'SpT', 'membership'], buffer=chunksize) as writer:
+
+                # Process one chunk of sources at a time
+                for chunk in read_sources(filepath, delimiter=delimiter, chunksize=chunksize):
+                    for name, row, error in executor.imap(func, chunk, ordered=False):
+                        if error is None:
+                            state = row.pop('SED')
+                            writer.append(row, state=state)
+                        else:
+                            self.failures.append({'name': name, 'error': error})
+                            if self.verbose:
+                                print("Could not add SED '{}': {}".format(name, error))
+
+                writer.failures = self.failures
 
-            if self.verbose:
-                print('Catalog saved to',file)
+        if self.verbose:
+            print("Wrote {} SEDs to {} with {} failures".format(writer.size, sink, len(self.failures)))
+
+    @property
+    def results(self):
+        """The table of all SED results, built from the results store"""
+        return self._store.to_table()
+
+    @results.setter
+    def results(self, table):
+        """Replace the results with the given table
+
+        Parameters
+        ----------
+        table: astropy.table.Table
+            The table of SED results
+        """
+        self._store = ResultsStore.from_table(table, objects=['name', 'SpT', 'membership', 'SED'])
+
+    @property
+    def evo_model(self):
+        """The evolutionary model set for all SEDs or, if none has been set,
+        the model the SEDs share"""
+        if self._evo_model is not None:
+            return self._evo_model
+
+        models = {sed.evo_model.name for sed in self._store.column('SED') if isinstance(sed, SED)}
+
+        return models.pop() if len(models) == 1 else None
+
+    @evo_model.setter
+    def evo_model(self, model):
+        """Change the evolutionary model and recalculate the dependent results
+
+        Parameters
+        ----------
+        model: str
+            The evolutionary model name
+        """
+        self.update(evo_model=model)
+
+    @property
+    def flux_units(self):
+        """The flux units of all SEDs"""
+        return self._flux_units
+
+    @flux_units.setter
+    def flux_units(self, flux_units):
+        """Change the flux units of all SEDs
+
+        Parameters
+        ----------
+        flux_units: astropy.units.quantity.Quantity
+            The flux units
+        """
+        self.update(flux_units=flux_units)
 
     @property
     def source(self):
-        """Generates a ColumnDataSource from the results table"""
-        # Copy the results table
-        table = copy(self.results)
+        """Generates a ColumnDataSource from views of the results columns"""
+        table = self.results
+
+        return ColumnDataSource(data=OrderedDict((name, table[name]) for name in table.colnames if name != 'SED'))
+
+    def update(self, processes=None, **settings):
+        """Change catalog-wide settings and recalculate only the results
+        which depend on them
+
+        Parameters
+        ----------
+        processes: int (optional)
+            The number of processes to recalculate the SEDs on, default is
+            the sedkit.parallel backend
+        evo_model: str
+            The evolutionary model for all SEDs
+        wave_units: astropy.units.quantity.Quantity
+            The wavelength units of all SEDs
+        flux_units: astropy.units.quantity.Quantity
+            The flux units of all SEDs
+
+        Returns
+        -------
+        dict
+            The new settings, the recalculated columns, the number of
+            SEDs recalculated and the number of values changed in each column
+        """
+        for setting in settings:
+            if setting not in ['evo_model', 'wave_units', 'flux_units']:
+                raise ValueError("'{}' is not a catalog setting. Please choose from ['evo_model', 'wave_units', 'flux_units']".format(setting))
+
+        # Check the units
+        for setting, unit in [('wave_units', q.um), ('flux_units', q.erg/q.s/q.cm**2/q.AA)]:
+            if setting in settings and not u.equivalent(settings[setting], unit):
+                raise TypeError("{} must be equivalent to {}".format(setting, unit))
+
+        # Share one isochrone between all the SEDs
+        isochrone = None
+        if 'evo_model' in settings:
+            if settings['evo_model'] not in iso.EVO_MODELS:
+                raise ValueError("Please use an evolutionary model from the list: {}".format(iso.EVO_MODELS))
+            isochrone = iso.Isochrone(settings['evo_model'], verbose=False)
+
+        # Get the affected results and their uncertainties
+        affected = affected_columns(settings)
+        cols = [col for col in self.cols if col.replace('_unc', '') in affected]
+        before = {col: self._store.column(col).copy() for col in cols}
+
+        # Recalculate the SEDs
+        seds = self._store.column('SED')
+        indexes = [idx for idx, sed in enumerate(seds) if sed is not None]
+        func = partial(recalculate_source, affected=affected, cols=cols, evo_model=isochrone,
+                       wave_units=settings.get('wave_units'), flux_units=settings.get('flux_units'))
+        recalculated = 0
+        with parallel.get_executor(processes) as executor:
+            for idx, (sed, values) in zip(indexes, executor.imap(func, [seds[idx] for idx in indexes])):
+
+                # Keep sharing the isochrones of SEDs copied from other processes
+                if isochrone is not None:
+                    sed._evo_model = isochrone
+                elif not isinstance(seds[idx], LazySED):
+                    sed._evo_model = seds[idx]._evo_model
+
+                seds[idx] = sed
+                if values is not None:
+                    self._store.update(idx, values)
+                    recalculated += 1
+
+        # Store the settings
+        for setting, value in settings.items():
+            setattr(self, '_' + setting, value)
+
+        # Count the changed values
+        changed = {}
+        for col in cols:
+            after = self._store.column(col)
+            same = (after == before[col]) | (np.isnan(after) & np.isnan(before[col]))
+            changed[col] = int(np.sum(~same))
+        report = {'settings': settings, 'columns': cols, 'sources': recalculated, 'changed': changed}
+
+        if self.verbose:
+            print("Recalculated {} for {} sources".format(', '.join(cols) or 'nothing', recalculated))
+
+        return report
+
+    @property
+    def wave_units(self):
+        """The wavelength units of all SEDs"""
+        return self._wave_units
+
+    @wave_units.setter
+    def wave_units(self, wave_units):
+        """Change the wavelength units of all SEDs
+
+        Parameters
+        ----------
+        wave_units: astropy.units.quantity.Quantity
+            The wavelength units
+        """
+        self.update(wave_units=wave_units)
+
+    def _metadata(self):
+        """The catalog settings saved with the results
+
+        Returns
+        -------
+        dict
+            The settings
+        """
+        return {'name': self.name, 'marker': self.marker, 'color': self.color,
+                'evo_model': self.evo_model,
+                'wave_units': self.wave_units.to_string(),
+                'flux_units': self.flux_units.to_string()}
+
+    def _plot_data(self, param):
+        """Get the values, uncertainties and unit of a parameter as floats
+
+        Parameters
+        ----------
+        param: str
+            The column name or color, e.g. 'WISE.W1-WISE.W2'
+
+        Returns
+        -------
+        tuple
+            The values and uncertainties, which are NaN where missing, and the unit
+        """
+        # Colors
+        if param not in self._store.colnames:
+            val, err, unit = self.get_data(param)[0]
+            return np.asarray(val, dtype=float), np.asarray(err, dtype=float), unit
+
+        # Columns
+        unc = '{}_unc'.format(param)
+        try:
+            val = np.asarray(self._store.column(param), dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError("'{}' is not a numeric parameter.".format(param))
+        err = np.asarray(self._store.column(unc), dtype=float) if unc in self._store.colnames else np.full(len(val), np.nan)
+
+        return val, err, self._store.units.get(param)
+
+
+class CatalogWriter:
+    """Write results to a catalog file in chunks as they are produced"""
+    def __init__(self, filepath, metadata, units=None, objects=None, buffer=1000):
+        """Open the file
+
+        Parameters
+        ----------
+        filepath: str
+            The path to the catalog file
+        metadata: dict
+            The catalog settings
+        units: dict
+            The units of the columns
+        objects: sequence
+            The columns of strings
+        buffer: int
+            The number of rows to hold before writing them
+        """
+        self.file = h5py.File(filepath, 'w')
+        self.file.attrs['version'] = CATALOG_VERSION
+        self.file.attrs['metadata'] = json.dumps(metadata)
+        self.results = self.file.create_group('results')
+        self.seds = self.file.create_group('SEDs')
+        self.units = dict(units or {})
+        self.objects = list(objects or [])
+        self.buffer = buffer
+        self.columns = []
+        self.failures = []
+        self.size = 0
+        self._rows = []
+
+    def __enter__(self):
+        """Use as a context manager"""
+        return self
+
+    def __exit__(self, *args):
+        """Close the file"""
+        self.close()
+
+    def append(self, row, state=None):
+        """Add a row of results
+
+        Parameters
+        ----------
+        row: dict
+            The scalar results
+        state: dict
+            The state of the SED from SED.get_state
+        """
+        if state is not None:
+            write_state(self.seds.create_group(str(self.size + len(self._rows))), state)
+
+        self._rows.append(row)
+        if len(self._rows) >= self.buffer:
+            self.flush()
+
+    def close(self):
+        """Write the remaining rows and close the file"""
+        if not self.file:
+            return
+
+        self.flush()
+        self.file.attrs['size'] = self.size
+        self.file.attrs['columns'] = json.dumps(self.columns + ['SED'])
+        self.file.attrs['failures'] = json.dumps(self.failures)
+        self.file.close()
+
+    def flush(self):
+        """Write the held rows to the file"""
+        if not self._rows:
+            return
+
+        # Add any new columns
+        for row in self._rows:
+            for name, val in row.items():
+                if name not in self.columns:
+                    self._add_column(name, val)
+
+        # Append the values
+        size = self.size + len(self._rows)
+        for name in self.columns:
+            data = self.results[name]
+            data.resize((size,))
+            data[self.size:] = [self._convert(name, row.get(name)) for row in self._rows]
+
+        self.size = size
+        self._rows = []
+
+    def _add_column(self, name, val):
+        """Add a column, filling previous rows with missing values
+
+        Parameters
+        ----------
+        name: str
+            The column name
+        val: object
+            The first value, which sets the type and units of the column
+        """
+        numeric = name not in self.objects and (val is None or isinstance(val, (int, float, np.number)) or hasattr(val, 'unit'))
+        if numeric:
+            data = self.results.create_dataset(name, data=np.full(self.size, np.nan), maxshape=(None,), chunks=(self.buffer,))
+            data.attrs['dtype'] = np.dtype(float).str
+        else:
+            data = self.results.create_dataset(name, data=[''] * self.size, shape=(self.size,), maxshape=(None,),
+                                               chunks=(self.buffer,), dtype=h5py.special_dtype(vlen=str))
+            data.attrs['dtype'] = 'O'
+
+        # Get the units
+        if name not in self.units and hasattr(val, 'unit'):
+            self.units[name] = val.unit
+        if self.units.get(name) is not None:
+            data.attrs['unit'] = self.units[name].to_string()
+
+        self.columns.append(name)
+
+    def _convert(self, name, val):
+        """Convert a value to the units and type of a column
+
+        Parameters
+        ----------
+        name: str
+            The column name
+        val: object
+            The value
+
+        Returns
+        -------
+        float, str
+            The converted value
+        """
+        if hasattr(val, 'unit'):
+            unit = self.units.get(name)
+            val = val.to(unit).value if unit is not None else val.value
+
+        # Strings
+        if self.results[name].attrs['dtype'] == 'O':
+            return '' if val is None else str(val)
+
+        # Numbers
+        try:
+            return np.nan if val is None or np.ma.is_masked(val) else float(val)
+        except (TypeError, ValueError):
+            return np.nan
+
+
+class LazySED:
+    """A reference to an SED in a saved catalog file"""
+    def __init__(self, filepath, key):
+        """Initialize the reference
+
+        Parameters
+        ----------
+        filepath: str
+            The path to the catalog file
+        key: str
+            The name of the SED group in the file
+        """
+        self.filepath = filepath
+        self.key = key
+
+    def __repr__(self):
+        """The reference"""
+        return '<LazySED {} in {}>'.format(self.key, self.filepath)
+
+    def load(self):
+        """Rebuild the SED from the file
+
+        Returns
+        -------
+        sedkit.sed.SED
+            The SED
+        """
+        return SED.from_state(self.get_state())
+
+    def get_state(self):
+        """Read the state of the SED from the file
+
+        Returns
+        -------
+        dict
+            The state for SED.from_state
+        """
+        with h5py.File(self.filepath, 'r') as f:
+            return read_state(f['SEDs'][self.key])
+
+
+class SEDProxy:
+    """A read-only view of an SED in a catalog, which makes a private copy
+    before any attribute is set or method is called
+
+    Until then, tables and containers are read as copies and arrays as
+    read-only views, so the SED in the catalog cannot be modified through
+    them. The proxy passes isinstance checks for the SED class, but
+    type(proxy) is SEDProxy. Pickling or deep copying it gives an SED.
+    """
+    def __init__(self, sed):
+        """Initialize the proxy
+
+        Parameters
+        ----------
+        sed: sedkit.sed.SED
+            The SED in the catalog
+        """
+        object.__setattr__(self, '_sed', sed)
+        object.__setattr__(self, '_copied', False)
+
+    @property
+    def __class__(self):
+        """Pass isinstance checks for the SED class"""
+        return type(self._sed)
+
+    def __copy__(self):
+        """Another view of the same SED"""
+        return SEDProxy(self._sed)
+
+    def __deepcopy__(self, memo):
+        """An independent copy of the SED itself"""
+        return deepcopy(self._sed, memo)
+
+    def __reduce_ex__(self, protocol):
+        """Pickle the SED itself, which is a copy once unpickled"""
+        return self._sed.__reduce_ex__(protocol)
+
+    def __getattr__(self, attr):
+        """Read an attribute of the SED, copying it before any method call"""
+        if attr in ['_sed', '_copied']:
+            raise AttributeError(attr)
+
+        val = getattr(self._sed, attr)
+        if callable(val) and hasattr(val, '__self__'):
+            return getattr(self._own(), attr)
+
+        return val if self._copied else read_only(val)
+
+    def __repr__(self):
+        """The SED representation"""
+        return repr(self._sed)
+
+    def __setattr__(self, attr, val):
+        """Set an attribute on a private copy of the SED"""
+        setattr(self._own(), attr, val)
+
+    def _own(self):
+        """Make a private copy of the SED and its tables the first time it
+        would be modified
+
+        Returns
+        -------
+        sedkit.sed.SED
+            The private copy
+        """
+        if not self._copied:
+            sed = copy(self._sed)
+            for attr in ['_photometry', '_spectra', '_synthetic_photometry']:
+                setattr(sed, attr, getattr(sed, attr).copy())
+            sed.refs = {key: copy(val) for key, val in sed.refs.items()}
+            sed.all_names = list(sed.all_names)
+            object.__setattr__(self, '_sed', sed)
+            object.__setattr__(self, '_copied', True)
+
+        return self._sed
+
+
+def affected_columns(settings):
+    """Get all the results which depend on the given settings
+
+    Parameters
+    ----------
+    settings: sequence
+        The names of the changed settings
+
+    Returns
+    -------
+    list
+        The affected results, in the order they are recalculated
+    """
+    affected = set()
+    todo = list(settings)
+    while todo:
+        for col in DEPENDENCIES.get(todo.pop(), []):
+            if col not in affected:
+                affected.add(col)
+                todo.append(col)
+
+    return [col for col in RECALCULATE if col in affected]
+
+
+def bin_edges(vals, bins, scale='linear'):
+    """Get the edges of bins spanning the values
+
+    Parameters
+    ----------
+    vals: np.ndarray
+        The values
+    bins: int
+        The number of bins
+    scale: str
+        The axis scale, 'linear' or 'log'
+
+    Returns
+    -------
+    np.ndarray
+        The bins edges
+    """
+    if scale == 'log':
+        vals = np.log10(vals[vals > 0])
+    lo, hi = (vals.min(), vals.max()) if len(vals) > 0 else (0., 1.)
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    edges = np.linspace(lo, hi, bins + 1)
+
+    return 10**edges if scale == 'log' else edges
+
+
+def export_source(sed, plots=False):
+    """Generate the exported files of an SED
+
+    Parameters
+    ----------
+    sed: sedkit.sed.SED, sedkit.catalog.LazySED
+        The SED or a reference to it in a catalog file
+    plots: bool
+        Render the SED plot as a PNG
+
+    Returns
+    -------
+    collections.OrderedDict
+        The contents of each file
+    """
+    if isinstance(sed, LazySED):
+        sed = sed.load()
+
+    return sed.export_files(plot=plots)
+
+
+def match_rows(left, right, on='name', radius=1*q.arcsec):
+    """Find the rows of two results stores with the same sources
+
+    Parameters
+    ----------
+    left: sedkit.catalog.ResultsStore
+        The first store
+    right: sedkit.catalog.ResultsStore
+        The second store
+    on: str
+        Match sources by 'name' or sky 'position'
+    radius: astropy.units.quantity.Quantity
+        The largest separation of sources matched by position
+
+    Returns
+    -------
+    tuple
+        The indexes of the matched rows in each store
+    """
+    # Hash join on the name index
+    if on == 'name':
+        pairs = [(left._rows[src][0], idx) for idx, src in enumerate(right.column('name')) if src in left._rows]
+        lrows, rrows = zip(*pairs) if pairs else ((), ())
+
+    # Nearest neighbors on the sky
+    elif on == 'position':
+        if not {'ra', 'dec'}.issubset(left.colnames) or not {'ra', 'dec'}.issubset(right.colnames):
+            raise ValueError("Both catalogs need 'ra' and 'dec' columns to match by position.")
+
+        lidx, = np.where(np.isfinite(left.column('ra')) & np.isfinite(left.column('dec')))
+        ridx, = np.where(np.isfinite(right.column('ra')) & np.isfinite(right.column('dec')))
+        lrows = rrows = ()
+        if len(lidx) > 0 and len(ridx) > 0:
+            lcoords = SkyCoord(ra=left.column('ra')[lidx], dec=left.column('dec')[lidx], unit=q.deg)
+            rcoords = SkyCoord(ra=right.column('ra')[ridx], dec=right.column('dec')[ridx], unit=q.deg)
+            nearest, sep, _ = match_coordinates_sky(rcoords, lcoords)
+            close = sep < radius
+            lrows, rrows = lidx[nearest[close]], ridx[close]
+
+    else:
+        raise ValueError("{}: Please match on 'name' or 'position'.".format(on))
+
+    return np.asarray(lrows, dtype=int), np.asarray(rrows, dtype=int)
+
+
+def process_source(row, run_methods=None, cols=None, wave_units=q.um, flux_units=q.erg/q.s/q.cm**2/q.AA, output='sed'):
+    """Build and calculate the SED of a source from a row of a source list
+
+    Parameters
+    ----------
+    row: dict
+        The 'name' and optionally 'ra' and 'dec' of the source
+    run_methods: list
+        A list of methods to run
+    cols: sequence
+        The names of the results to get
+    wave_units: astropy.units.quantity.Quantity
+        The wavelength units of the SED
+    flux_units: astropy.units.quantity.Quantity
+        The flux units of the SED
+    output: str
+        Return the results with the 'sed', its 'state', or only the
+        scalar 'results'
+
+    Returns
+    -------
+    tuple
+        The name, results and error, which is None if successful
+    """
+    try:
+        # Make the SED
+        s = SED(row['name'], verbose=False)
+        if 'ra' in row and 'dec' in row:
+            s.sky_coords = row['ra']*q.deg, row['dec']*q.deg
+
+        # Run the desired methods
+        s.run_methods(run_methods or [])
+
+        results = sed_results(s, cols, wave_units=wave_units, flux_units=flux_units)
+
+        # Drop the SED object if it is not needed
+        if output != 'sed':
+            results['SED'] = s.get_state() if output == 'state' else None
+
+        return row['name'], results, None
+
+    except Exception as exc:
+        return row['name'], None, '{}: {}'.format(type(exc).__name__, exc)
+
+
+def process_row(item, **kwargs):
+    """Build and calculate the SED of a numbered row of a source list
+
+    Parameters
+    ----------
+    item: tuple
+        The index of the row and the row
+    kwargs: dict
+        The keyword arguments for process_source
+
+    Returns
+    -------
+    tuple
+        The row index, name, results and error, which is None if successful
+    """
+    idx, row = item
+
+    return (idx,) + process_source(row, **kwargs)
+
+
+def read_checkpoint(filepath):
+    """Read the batches of results in a checkpoint file
+
+    Parameters
+    ----------
+    filepath: str
+        The path to the checkpoint file
+
+    Returns
+    -------
+    list
+        The batches, ignoring a truncated final batch
+    """
+    batches = []
+    with open(filepath, 'rb') as f:
+        while True:
+            try:
+                batches.append(pickle.load(f))
+            except (EOFError, pickle.UnpicklingError):
+                break
+
+    return batches
+
+
+def read_manifest(target):
+    """Read the manifest of a previous catalog export
+
+    Parameters
+    ----------
+    target: str
+        The path to the exported directory or zip file
+
+    Returns
+    -------
+    dict
+        The hash and files of each source, or None if there is no export
+    """
+    try:
+        if target.endswith('.zip'):
+            with zipfile.ZipFile(target, 'r') as archive:
+                return json.loads(archive.read('manifest.json').decode('utf-8'))
+        else:
+            with open(os.path.join(target, 'manifest.json')) as f:
+                return json.load(f)
+
+    except (IOError, KeyError, ValueError, zipfile.BadZipFile):
+        return None
+
+
+def read_only(val):
+    """Get a value which cannot be used to modify the original
+
+    Parameters
+    ----------
+    val: any
+        The value
+
+    Returns
+    -------
+    any
+        A copy of a table or container, a read-only view of an array or
+        of the arrays in a tuple, or the value itself
+    """
+    if isinstance(val, at.Table):
+        return val.copy()
+
+    if isinstance(val, np.ndarray):
+        view = val.view()
+        view.flags.writeable = False
+        return view
+
+    if isinstance(val, tuple):
+        return tuple(read_only(i) for i in val)
+
+    if isinstance(val, (list, dict, set)):
+        return deepcopy(val)
+
+    return val
+
+
+def read_sources(filepath, delimiter=',', chunksize=1000):
+    """Read a source list in chunks with astropy.io.ascii, holding only one
+    chunk of the file in memory at a time
+
+    Parameters
+    ----------
+    filepath: str
+        The path to an ASCII file with a 'name' and optionally 'ra' and
+        'dec' column
+    delimiter: str
+        The column delimiter of the ASCII file
+    chunksize: int
+        The number of sources in each chunk
+
+    Yields
+    ------
+    list
+        The rows of the next chunk as dicts
+    """
+    with open(filepath) as f:
+
+        # Skip comments and blank lines before the header
+        header = next((line for line in f if line.strip() and not line.startswith('#')), None)
+        if header is None:
+            return
+
+        while True:
+            lines = list(islice(f, chunksize))
+            if not lines:
+                break
+
+            # Parse the chunk under the header
+            data = ascii.read([header] + lines, format='basic', delimiter=delimiter, guess=False)
+            if len(data) > 0:
+                yield [{col: row[col] for col in data.colnames} for row in data]
+
+
+def read_state(group):
+    """Read the state of an SED from a catalog file
+
+    Parameters
+    ----------
+    group: h5py.Group
+        The SED group
+
+    Returns
+    -------
+    dict
+        The state for SED.from_state
+    """
+    state = json.loads(group.attrs['state'])
+
+    # Read the photometry and spectra arrays
+    state['photometry']['app_magnitude'], state['photometry']['app_magnitude_unc'] = group['photometry'][()]
+    for n, spec in enumerate(state['spectra']):
+        spec['data'] = group['spectrum_{}'.format(n)][()]
+
+    return state
+
+
+def recalculate_source(sed, affected=(), cols=(), evo_model=None, wave_units=None, flux_units=None):
+    """Apply new catalog settings to an SED and recalculate the results
+    which depend on them
+
+    Parameters
+    ----------
+    sed: sedkit.sed.SED, sedkit.catalog.LazySED
+        The SED or a reference to it in a catalog file
+    affected: sequence
+        The names of the results to recalculate
+    cols: sequence
+        The names of the results and uncertainties to get
+    evo_model: sedkit.isochrone.Isochrone (optional)
+        The new evolutionary model
+    wave_units: astropy.units.quantity.Quantity (optional)
+        The new wavelength units
+    flux_units: astropy.units.quantity.Quantity (optional)
+        The new flux units
+
+    Returns
+    -------
+    tuple
+        The SED and its new results, which are None if it is uncalculated
+    """
+    if isinstance(sed, LazySED):
+        sed = sed.load()
+    sed.verbose = False
+
+    if evo_model is not None:
+        sed._evo_model = evo_model
+
+        # Only radii from the isochrones are recalculated
+        if sed.isochrone_radius:
+            sed._radius = None
+            sed.isochrone_radius = False
+
+    if wave_units is not None:
+        sed.wave_units = wave_units
+    if flux_units is not None:
+        sed.flux_units = flux_units
+
+    # Recalculate only the affected results
+    if not sed.calculated:
+        return sed, None
+
+    for col, method in RECALCULATE.items():
+        if col in affected and not (col == 'radius' and sed.radius is not None):
+            getattr(sed, method)()
+
+    return sed, sed_values(sed, cols)
+
+
+def sed_results(sed, cols, wave_units=q.um, flux_units=q.erg/q.s/q.cm**2/q.AA):
+    """Calculate an SED and collect the results for a catalog
+
+    Parameters
+    ----------
+    sed: sedkit.sed.SED
+        The SED
+    cols: sequence
+        The names of the results to get, ending with 'SED'
+    wave_units: astropy.units.quantity.Quantity
+        The wavelength units of the SED
+    flux_units: astropy.units.quantity.Quantity
+        The flux units of the SED
+
+    Returns
+    -------
+    dict
+        The results, the SED, and the apparent and absolute photometry
+    """
+    # Turn off print statements
+    sed.verbose = False
+
+    # Check the units
+    sed.wave_units = wave_units
+    sed.flux_units = flux_units
+
+    # Run the SED
+    sed.make_sed()
+
+    # Add the values and uncertainties if applicable
+    row = sed_values(sed, cols[:-1])
+
+    # Add the SED
+    row['SED'] = sed
+
+    # Add the apparent and absolute photometry
+    for band in sed.photometry:
+        row[band['band']] = band['app_magnitude']
+        row[band['band']+'_unc'] = band['app_magnitude_unc']
+        row['M_'+band['band']] = band['abs_magnitude']
+        row['M_'+band['band']+'_unc'] = band['abs_magnitude_unc']
+
+    return row
+
+
+def sed_values(sed, cols):
+    """Get the results of an SED
+
+    Parameters
+    ----------
+    sed: sedkit.sed.SED
+        The SED
+    cols: sequence
+        The names of the results to get, where the uncertainty of a
+        result 'x' is named 'x_unc'
+
+    Returns
+    -------
+    dict
+        The values
+    """
+    row = {}
+    for col in cols:
+
+        if col+'_unc' in cols:
+            if isinstance(getattr(sed, col), (tuple, list)):
+                val = getattr(sed, col)[0]
+            else:
+                val = None
+        elif col.endswith('_unc'):
+            if isinstance(getattr(sed, col.replace('_unc', '')), (tuple, list)):
+                val = getattr(sed, col.replace('_unc', ''))[1]
+            else:
+                val = None
+        else:
+            val = getattr(sed, col)
+
+        row[col] = val
+
+    return row
+
+
+def state_hash(state, *extra):
+    """Hash the state of an SED to tell when it has changed
+
+    Parameters
+    ----------
+    state: dict
+        The state from SED.get_state
+    extra: sequence
+        Any other values the hash should depend on
+
+    Returns
+    -------
+    str
+        The hex digest
+    """
+    digest = hashlib.sha1()
+    meta = dict(state)
+
+    # Hash the arrays directly
+    phot = dict(meta['photometry'])
+    for key in ['app_magnitude', 'app_magnitude_unc']:
+        digest.update(np.ascontiguousarray(phot.pop(key), dtype=float).tobytes())
+    meta['photometry'] = phot
+
+    meta['spectra'] = []
+    for spec in state['spectra']:
+        digest.update(np.ascontiguousarray(spec['data'], dtype=float).tobytes())
+        meta['spectra'].append({'name': spec['name'], 'ref': spec['ref']})
+
+    # And everything else as JSON
+    digest.update(json.dumps([meta, extra], sort_keys=True, default=str).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def write_checkpoint(filepath, batch):
+    """Append a batch of results to a checkpoint file
+
+    Parameters
+    ----------
+    filepath: str
+        The path to the checkpoint file
+    batch: dict
+        The 'rows', 'failures' and 'done' row indexes of the batch
+    """
+    with open(filepath, 'ab') as f:
+        pickle.dump(batch, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_state(group, state):
+    """Write the state of an SED to a catalog file, with the photometry and
+    spectra as compressed arrays and everything else as JSON
+
+    Parameters
+    ----------
+    group: h5py.Group
+        The SED group
+    state: dict
+        The state from SED.get_state
+    """
+    meta = dict(state)
+
+    # Save the magnitudes
+    phot = dict(meta['photometry'])
+    group.create_dataset('photometry', data=np.array([phot.pop('app_magnitude'), phot.pop('app_magnitude_unc')]).reshape(2, -1))
+    meta['photometry'] = phot
+
+    # Save the spectra
+    meta['spectra'] = []
+    for n, spec in enumerate(state['spectra']):
+        group.create_dataset('spectrum_{}'.format(n), data=spec['data'], compression='gzip', shuffle=True)
+        meta['spectra'].append({'name': spec['name'], 'ref': spec['ref']})
+
+    group.attrs['state'] = json.dumps(meta, default=str)
+
+
+class ResultsStore:
+    """A columnar store of SED results with amortized O(1) row appends"""
+    def __init__(self, columns=None, units=None, capacity=16):
+        """Initialize the store
+
+        Parameters
+        ----------
+        columns: sequence
+            The (name, dtype) of the initial columns, where the dtype is
+            float or 'O' for objects
+        units: dict
+            The units of the columns
+        capacity: int
+            The number of rows to allocate
+        """
+        self.units = dict(units or {})
+        self._columns = OrderedDict()
+        self._size = 0
+        self._capacity = capacity
+        self._table = None
+        self._indexes = {}
+        self._rows = {}
+
+        # Allocate the columns
+        for name, dtype in columns or []:
+            self.add_column(name, dtype)
+
+    def __len__(self):
+        """The number of rows"""
+        return self._size
+
+    @property
+    def colnames(self):
+        """The column names"""
+        return list(self._columns)
+
+    def add_column(self, name, dtype=float, unit=None):
+        """Add an empty column
+
+        Parameters
+        ----------
+        name: str
+            The column name
+        dtype: type, str
+            The data type, float or 'O' for objects
+        unit: astropy.units.quantity.Quantity
+            The column units
+        """
+        dtype = np.dtype(dtype)
+        self._columns[name] = np.full(self._capacity, np.nan if dtype.kind == 'f' else None, dtype=dtype)
+        if unit is not None:
+            self.units[name] = unit
+        self._changed()
+
+    def append(self, row):
+        """Append a row, adding columns for any new keys
+
+        Parameters
+        ----------
+        row: dict
+            The values of the new row, where missing columns are NaN or None
+        """
+        # Grow the columns if necessary
+        if self._size == self._capacity:
+            self._grow(2 * self._capacity)
+
+        for name, val in row.items():
+
+            # Add new columns as floats if possible
+            if name not in self._columns:
+                numeric = val is None or isinstance(val, (int, float, np.number)) or hasattr(val, 'unit')
+                self.add_column(name, float if numeric else 'O', unit=getattr(val, 'unit', None))
+
+            self._columns[name][self._size] = self._convert(name, val)
+
+        # Update the name index
+        if row.get('name') is not None:
+            self._rows.setdefault(row['name'], []).append(self._size)
+
+        self._size += 1
+        self._changed()
+
+    def column(self, name):
+        """Get a view of the values in a column
+
+        Parameters
+        ----------
+        name: str
+            The column name
+
+        Returns
+        -------
+        np.ndarray
+            The column values
+        """
+        return self._columns[name][:self._size]
+
+    @classmethod
+    def concat(cls, stores, rows=None):
+        """Make a store from the rows of several stores, with all their
+        columns in the units of the first store which has them
+
+        Parameters
+        ----------
+        stores: sequence
+            The stores to combine
+        rows: sequence
+            The boolean mask or indexes of the rows to keep from each store
+
+        Returns
+        -------
+        sedkit.catalog.ResultsStore
+            The new store
+        """
+        rows = rows or [slice(None)] * len(stores)
+        sizes = [len(np.arange(len(store))[keep]) for store, keep in zip(stores, rows)]
+        size = sum(sizes)
+
+        # Align the columns and units
+        units, dtypes = {}, OrderedDict()
+        for store in stores:
+            for name, col in store._columns.items():
+                if name in store.units:
+                    units.setdefault(name, store.units[name])
+                dtypes[name] = float if col.dtype.kind == 'f' and dtypes.get(name, float) is float else 'O'
+
+        new = cls(list(dtypes.items()), units=units, capacity=max(16, size))
+
+        # Copy the kept rows of each store
+        start = 0
+        for store, keep, n in zip(stores, rows, sizes):
+            for name, col in store._columns.items():
+                vals = col[:store._size][keep]
+
+                # Convert the units
+                unit = store.units.get(name)
+                if unit is not None and units[name] != unit:
+                    if not unit.is_equivalent(units[name]):
+                        raise ValueError("Cannot combine '{}' columns in {} and {}".format(name, unit, units[name]))
+                    vals = vals * unit.to(units[name])
+
+                # Missing values of objects are None
+                if new._columns[name].dtype.kind != 'f' and col.dtype.kind == 'f':
+                    vals = np.where(np.isnan(vals), None, vals)
+
+                new._columns[name][start:start + n] = vals
+
+            start += n
+
+        new._size = size
+        new._index_names()
+
+        return new
+
+    def copy(self):
+        """Copy the store
+
+        Returns
+        -------
+        sedkit.catalog.ResultsStore
+            The copy
+        """
+        new = ResultsStore(units=self.units, capacity=self._capacity)
+        for name, col in self._columns.items():
+            new._columns[name] = col.copy()
+        new._size = self._size
+        new._rows = {name: list(rows) for name, rows in self._rows.items()}
+
+        return new
+
+    def fill(self, idx, other, other_idx):
+        """Fill the missing values in some rows with those of another store
+
+        Parameters
+        ----------
+        idx: sequence
+            The indexes of the rows to fill
+        other: sedkit.catalog.ResultsStore
+            The store to fill them from
+        other_idx: sequence
+            The indexes of the rows to fill them with
+        """
+        idx, other_idx = np.asarray(idx, dtype=int), np.asarray(other_idx, dtype=int)
+        for name, col in other._columns.items():
+            vals = col[:other._size][other_idx]
+
+            # Convert the units
+            unit, target = other.units.get(name), self.units.get(name)
+            if unit is not None and target is not None and unit != target:
+                vals = vals * unit.to(target)
+
+            # Replace the missing values
+            current = self._columns[name][idx]
+            if current.dtype.kind == 'f':
+                missing = np.isnan(current)
+            else:
+                missing = np.array([v is None or (isinstance(v, float) and np.isnan(v)) for v in current], dtype=bool)
+            self._columns[name][idx[missing]] = vals[missing]
+
+        self._changed()
+
+    @classmethod
+    def from_table(cls, table, objects=None):
+        """Make a store from a table
+
+        Parameters
+        ----------
+        table: astropy.table.Table, pandas.DataFrame
+            The table of results
+        objects: sequence
+            The columns to keep as objects
+
+        Returns
+        -------
+        sedkit.catalog.ResultsStore
+            The store
+        """
+        objects = objects or []
+        if isinstance(table, pd.DataFrame):
+            table = at.Table.from_pandas(table)
+
+        store = cls(capacity=max(16, len(table)))
+        for name in table.colnames:
+            col = table[name]
+            unit = getattr(col, 'unit', None)
+            vals = col.value if isinstance(col, q.Quantity) else col
+            if hasattr(vals, 'mask'):
+                vals = np.array([None if m else v for v, m in zip(np.asarray(vals.data, dtype='O'), np.ma.getmaskarray(vals))], dtype='O')
+
+            # Store numeric columns as floats
+            store.add_column(name, 'O', unit=unit)
+            if name not in objects:
+                try:
+                    vals = np.array([np.nan if v is None else v for v in vals], dtype=float)
+                    store.add_column(name, float, unit=unit)
+                except (TypeError, ValueError):
+                    pass
+
+            store._columns[name][:len(table)] = vals
+
+        store._size = len(table)
+        store._index_names()
+
+        return store
+
+    def index(self, name):
+        """Get the sorted index of a numeric column, which is cached until
+        the store changes
+
+        Parameters
+        ----------
+        name: str
+            The column name
+
+        Returns
+        -------
+        sedkit.tablequery.SortedIndex
+            The index, or None for object columns
+        """
+        if self._columns[name].dtype.kind != 'f':
+            return None
+
+        if name not in self._indexes:
+            self._indexes[name] = SortedIndex(self.column(name))
+
+        return self._indexes[name]
+
+    def remove(self, rows):
+        """Remove rows
 
-        # Remove the SED column
-        del table['SED']
+        Parameters
+        ----------
+        rows: sequence
+            The indexes of the rows to remove
+        """
+        keep = np.ones(self._size, dtype=bool)
+        keep[list(rows)] = False
+        size = int(keep.sum())
+        for name, col in self._columns.items():
+            new = np.full(self._capacity, np.nan if col.dtype.kind == 'f' else None, dtype=col.dtype)
+            new[:size] = col[:self._size][keep]
+            self._columns[name] = new
+
+        self._size = size
+        self._index_names()
+        self._changed()
+
+    def rows(self, name):
+        """Get the rows with the given name from the maintained name index
+
+        Parameters
+        ----------
+        name: str
+            The source name
+
+        Returns
+        -------
+        list
+            The row indexes
+        """
+        return list(self._rows.get(name, []))
+
+    def select(self, rows):
+        """Make a new store from a subset of the rows
+
+        Parameters
+        ----------
+        rows: sequence
+            The boolean mask or indexes of the rows to keep
+
+        Returns
+        -------
+        sedkit.catalog.ResultsStore
+            The new store
+        """
+        new = ResultsStore(units=self.units, capacity=self._capacity)
+        for name, col in self._columns.items():
+            vals = col[:self._size][rows]
+            new._columns[name] = np.full(self._capacity, np.nan if col.dtype.kind == 'f' else None, dtype=col.dtype)
+            new._columns[name][:len(vals)] = vals
+            new._size = len(vals)
+        new._index_names()
+
+        return new
+
+    def to_pandas(self):
+        """Materialize the results as a pandas DataFrame
+
+        Returns
+        -------
+        pandas.DataFrame
+            The results
+        """
+        return pd.DataFrame(OrderedDict((name, self.column(name)) for name in self._columns))
+
+    def to_table(self):
+        """Materialize the results as an astropy table, which is cached until
+        the store changes
+
+        Returns
+        -------
+        astropy.table.Table
+            The results
+        """
+        if self._table is None:
+            columns = [at.Column(self.column(name), name=name, unit=self.units.get(name), copy=False) for name in self._columns]
+            self._table = at.Table(columns, copy=False)
+
+        return self._table
+
+    def update(self, idx, row):
+        """Change the values in a row
+
+        Parameters
+        ----------
+        idx: int
+            The row index
+        row: dict
+            The new values of existing columns
+        """
+        for name, val in row.items():
+            self._columns[name][idx] = self._convert(name, val)
+
+        self._changed()
+
+    def _changed(self):
+        """Invalidate the cached table and indexes"""
+        self._table = None
+        self._indexes = {}
+
+    def _index_names(self):
+        """Rebuild the name index after the rows have moved"""
+        self._rows = {}
+        if 'name' in self._columns:
+            for idx, name in enumerate(self.column('name')):
+                if name is not None:
+                    self._rows.setdefault(name, []).append(idx)
+
+    def _convert(self, name, val):
+        """Convert a value to the units and type of a column
+
+        Parameters
+        ----------
+        name: str
+            The column name
+        val: object
+            The value
+
+        Returns
+        -------
+        object
+            The converted value
+        """
+        if hasattr(val, 'unit'):
+            unit = self.units.get(name)
+            val = val.to(unit).value if unit is not None else val.value
+
+        if self._columns[name].dtype.kind == 'f':
+            val = np.nan if val is None or np.ma.is_masked(val) else val
+
+        return val
+
+    def _grow(self, capacity):
+        """Reallocate the columns with a larger capacity
+
+        Parameters
+        ----------
+        capacity: int
+            The new number of rows to allocate
+        """
+        for name, col in self._columns.items():
+            new = np.full(capacity, np.nan if col.dtype.kind == 'f' else None, dtype=col.dtype)
+            new[:self._size] = col[:self._size]
+            self._columns[name] = new
 
-        return ColumnDataSource(data=dict(table))
+        self._capacity = capacity
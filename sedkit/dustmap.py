@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A module to look up the reddening E(B-V) of sources from a 3D dust map,
+either the Bayestar17 web service or a local map file set in code with
+`configure` or with the SEDKIT_DUSTMAP environment variable. Lookups are
+vectorized over arrays of coordinates and memoized in bins of galactic
+longitude, latitude and distance modulus.
+"""
+import os
+import threading
+
+import astropy.units as q
+from astropy.coordinates import SkyCoord
+import numpy as np
+
+from . import transport
+from . import utilities as u
+
+
+# Dust maps and file packages are imported on first use
+BayestarQuery = u.LazyImport('dustmaps.bayestar', 'BayestarQuery')
+BayestarWebQuery = u.LazyImport('dustmaps.bayestar', 'BayestarWebQuery')
+RegularGridInterpolator = u.LazyImport('scipy.interpolate', 'RegularGridInterpolator')
+h5py = u.LazyImport('h5py')
+
+# The supported ways to reduce the samples of the dust map at a point
+MODES = ['median', 'mean', 'best', 'random_sample']
+
+# The settings of the shared dust map
+SETTINGS = {'filepath': None, 'mode': 'median'}
+
+# The shared dust map, which is made on first use
+_DUSTMAP = None
+
+
+def _query_bayestar(coords, mode='median', version='bayestar2017'):
+    """Query the Bayestar web service"""
+    return BayestarWebQuery(version=version)(coords, mode=mode)
+
+
+# The web service is queried through the sedkit.transport
+transport.register('bayestar', _query_bayestar)
+
+
+class DustMap:
+    """A base class for dust maps, which memoizes the reddening at the
+    center of each bin of galactic longitude, latitude and distance
+    modulus so that nearby lookups give the same value without a query"""
+    def __init__(self, mode='median', angle_bin=0.05, dm_bin=0.1):
+        """Initialize the dust map
+
+        Parameters
+        ----------
+        mode: str
+            Use the 'median', 'mean' or 'best' fit reddening, which are
+            memoized, or a 'random_sample', which is not
+        angle_bin: float
+            The size of the longitude and latitude bins [deg]
+        dm_bin: float
+            The size of the distance modulus bins [mag]
+        """
+        if mode not in MODES:
+            raise ValueError("{}: Please use one of the modes {}".format(mode, MODES))
+
+        self.mode = mode
+        self.angle_bin = angle_bin
+        self.dm_bin = dm_bin
+        self.cache = {}
+        self.queries = 0
+        self.settings = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """The settings"""
+        return '<{} ({}) with {} cached bin(s)>'.format(type(self).__name__, self.mode, len(self.cache))
+
+    @property
+    def deterministic(self):
+        """Whether lookups always give the same reddening"""
+        return self.mode != 'random_sample'
+
+    def lookup(self, l, b, distance):
+        """Look up the reddening at arrays of galactic coordinates
+
+        Parameters
+        ----------
+        l: np.ndarray
+            The galactic longitudes [deg]
+        b: np.ndarray
+            The galactic latitudes [deg]
+        distance: np.ndarray
+            The distances [pc]
+
+        Returns
+        -------
+        np.ndarray
+            The E(B-V) values
+        """
+        raise NotImplementedError
+
+    def query(self, coords, distance):
+        """Get the reddening of one or many sources in one vectorized lookup
+
+        Parameters
+        ----------
+        coords: astropy.coordinates.SkyCoord
+            The coordinates of the sources
+        distance: astropy.units.quantity.Quantity
+            The distance of each source, or one distance for all of them
+
+        Returns
+        -------
+        float, np.ndarray
+            The E(B-V) of each source, which is NaN outside the map
+        """
+        if not isinstance(coords, SkyCoord):
+            raise TypeError("{}: coords must be astropy.coordinates.SkyCoord".format(type(coords)))
+
+        # Get the galactic coordinates and distance modulus of each source
+        gal = coords.galactic
+        l = np.atleast_1d(gal.l.deg)
+        b = np.atleast_1d(gal.b.deg)
+        dist = np.broadcast_to(np.atleast_1d(distance.to(q.pc).value), l.shape).astype(float)
+        valid = np.isfinite(l) & np.isfinite(b) & np.isfinite(dist) & (dist > 0)
+        red = np.full(l.shape, np.nan)
+
+        if np.any(valid):
+
+            # Query random samples directly
+            if not self.deterministic:
+                self.queries += 1
+                red[valid] = self.lookup(l[valid], b[valid], dist[valid])
+
+            else:
+
+                # Get the bin of each source
+                nlon = int(round(360. / self.angle_bin))
+                dm = 5 * np.log10(dist[valid]) - 5
+                bins = np.stack([np.round(l[valid] / self.angle_bin).astype(int) % nlon,
+                                 np.round(b[valid] / self.angle_bin).astype(int),
+                                 np.round(dm / self.dm_bin).astype(int)], axis=1)
+                keys = [tuple(key) for key in bins]
+
+                # Look up the centers of the new bins in one query
+                with self._lock:
+                    new = np.array(sorted(set(key for key in keys if key not in self.cache)))
+                    if len(new) > 0:
+                        self.queries += 1
+                        vals = self.lookup(new[:, 0] * self.angle_bin, new[:, 1] * self.angle_bin, 10**((new[:, 2] * self.dm_bin + 5) / 5.))
+                        self.cache.update(zip(map(tuple, new), np.atleast_1d(vals).astype(float)))
+
+                red[valid] = [self.cache[key] for key in keys]
+
+        return float(red[0]) if coords.isscalar else red
+
+
+class Bayestar(DustMap):
+    """The Bayestar 3D dust map of Green et al., queried from the web
+    service or read from a local map file"""
+    def __init__(self, filepath=None, version='bayestar2017', **kwargs):
+        """Initialize the dust map
+
+        Parameters
+        ----------
+        filepath: str (optional)
+            The path to a local Bayestar map file, which is loaded on first
+            use, otherwise the web service is queried
+        version: str
+            The version of the map
+        """
+        super().__init__(**kwargs)
+        self.filepath = filepath
+        self.version = version
+        self._map = None
+
+    def lookup(self, l, b, distance):
+        """Look up the reddening at arrays of galactic coordinates"""
+        coords = SkyCoord(l=l * q.deg, b=b * q.deg, distance=distance * q.pc, frame='galactic')
+
+        # Query the web service
+        if self.filepath is None:
+            return np.asarray(transport.request('bayestar', None, coords, mode=self.mode, version=self.version), dtype=float)
+
+        # Or the local map
+        if self._map is None:
+            self._map = BayestarQuery(map_fname=self.filepath, version=self.version)
+
+        return np.asarray(self._map(coords, mode=self.mode), dtype=float)
+
+
+class GridDustMap(DustMap):
+    """A dust map read from an HDF5 file with the 'l' and 'b' [deg] and
+    'distance' [pc] axes of a regular grid and the 'ebv' values on it, which
+    are linearly interpolated in longitude, latitude and log distance"""
+    def __init__(self, filepath, **kwargs):
+        """Initialize the dust map
+
+        Parameters
+        ----------
+        filepath: str
+            The path to the map file, which is loaded on first use
+        """
+        if not os.path.isfile(filepath):
+            raise IOError("{}: No such file".format(filepath))
+
+        super().__init__(**kwargs)
+        self.filepath = filepath
+        self._interp = None
+
+    def lookup(self, l, b, distance):
+        """Look up the reddening at arrays of galactic coordinates"""
+        if self._interp is None:
+            with h5py.File(self.filepath, 'r') as f:
+                axes = f['l'][()], f['b'][()], np.log10(f['distance'][()])
+                self._interp = RegularGridInterpolator(axes, f['ebv'][()], bounds_error=False, fill_value=np.nan)
+
+        return self._interp(np.stack([l, b, np.log10(distance)], axis=1))
+
+
+def configure(filepath=None, mode=None):
+    """Set the shared dust map, which the environment variable overrides
+
+    Parameters
+    ----------
+    filepath: str (optional)
+        The path to a local Bayestar or grid map file, or '' to use the
+        Bayestar web service
+    mode: str (optional)
+        Use the 'median', 'mean' or 'best' fit reddening, or a
+        'random_sample'
+
+    Returns
+    -------
+    sedkit.dustmap.DustMap
+        The shared dust map
+    """
+    if mode is not None and mode not in MODES:
+        raise ValueError("{}: Please use one of the modes {}".format(mode, MODES))
+
+    SETTINGS.update({key: val for key, val in [('filepath', filepath), ('mode', mode)] if val is not None})
+
+    return get_dustmap()
+
+
+def get_dustmap():
+    """Get the shared dust map, set by the SEDKIT_DUSTMAP environment
+    variable or the settings
+
+    Returns
+    -------
+    sedkit.dustmap.DustMap
+        The dust map, which keeps its memoized reddening until the
+        settings change
+    """
+    global _DUSTMAP
+
+    # Make the shared dust map again if the settings have changed
+    current = os.environ.get('SEDKIT_DUSTMAP') or SETTINGS['filepath'] or None, SETTINGS['mode']
+    if _DUSTMAP is None or _DUSTMAP.settings != current:
+        filepath, mode = current
+        _DUSTMAP = load(filepath, mode=mode)
+        _DUSTMAP.settings = current
+
+    return _DUSTMAP
+
+
+def load(filepath=None, **kwargs):
+    """Get the dust map in a file
+
+    Parameters
+    ----------
+    filepath: str (optional)
+        The path to a local Bayestar or grid map file, otherwise the
+        Bayestar web service is used
+
+    Returns
+    -------
+    sedkit.dustmap.DustMap
+        The dust map
+    """
+    if filepath is None:
+        return Bayestar(**kwargs)
+
+    if not os.path.isfile(filepath):
+        raise IOError("{}: No such file".format(filepath))
+
+    # Grid files have an 'ebv' dataset
+    with h5py.File(filepath, 'r') as f:
+        grid = 'ebv' in f
+
+    return GridDustMap(filepath, **kwargs) if grid else Bayestar(filepath, **kwargs)
+
+
+def query(coords, distance):
+    """Get the reddening of one or many sources from the shared dust map
+
+    Parameters
+    ----------
+    coords: astropy.coordinates.SkyCoord
+        The coordinates of the sources
+    distance: astropy.units.quantity.Quantity
+        The distance of each source, or one distance for all of them
+
+    Returns
+    -------
+    float, np.ndarray
+        The E(B-V) of each source, which is NaN outside the map
+    """
+    return get_dustmap().query(coords, distance)
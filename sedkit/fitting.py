@@ -0,0 +1,549 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A module to fit, compare and bootstrap models of one parameter as a
+function of another, e.g. polynomial relations of different orders and
+smoothing splines, and to fit blackbodies to many SEDs at once
+"""
+from functools import partial
+import hashlib
+import json
+import os
+import warnings
+
+import numpy as np
+
+from . import parallel
+from . import utilities as u
+
+# Splines are imported on first use
+splev = u.LazyImport('scipy.interpolate', 'splev')
+splrep = u.LazyImport('scipy.interpolate', 'splrep')
+
+# The default candidate models
+POLYNOMIAL_ORDERS = (1, 2, 3, 4, 5, 6)
+SPLINE_SMOOTHING = (0.1, 0.3, 1., 3.)
+
+# The default temperature grid [K] of the blackbody fitter
+BLACKBODY_TEFFS = np.geomspace(300., 50000., 1000)
+
+# Bump this when the cached fits are no longer valid
+CACHE_VERSION = 1
+
+
+class RelationFit:
+    """A class to store and evaluate a model chosen by fit_relation"""
+    def __init__(self, kind, param, params, C_p=None, grid=None, grid_unc=None, scores=None, n_boot=0, failures=0):
+        """Initialize the fit
+
+        Parameters
+        ----------
+        kind: str
+            The kind of model, ['polynomial', 'spline']
+        param: int, float
+            The polynomial order or spline smoothing factor
+        params: sequence
+            The polynomial coefficients or spline (t, c, k)
+        C_p: array-like
+            The covariance matrix of the polynomial coefficients
+        grid: array-like
+            The x values of the uncertainty curve for a spline
+        grid_unc: array-like
+            The uncertainty curve for a spline
+        scores: dict
+            The cross-validation score of each candidate model
+        n_boot: int
+            The number of bootstrap resamples
+        failures: int
+            The number of bootstrap resamples which could not be fit
+        """
+        self.kind = kind
+        self.param = param
+        self.params = params
+        self.C_p = None if C_p is None else np.asarray(C_p)
+        self.grid = None if grid is None else np.asarray(grid)
+        self.grid_unc = None if grid_unc is None else np.asarray(grid_unc)
+        self.scores = scores or {}
+        self.n_boot = n_boot
+        self.failures = failures
+
+    def __repr__(self):
+        """A string representation of the fit"""
+        return '<RelationFit: {} {}>'.format(self.kind, self.param)
+
+    @property
+    def coeffs(self):
+        """The polynomial coefficients, if the fit is a polynomial"""
+        return np.asarray(self.params) if self.kind == 'polynomial' else None
+
+    def evaluate(self, x, x_unc=None):
+        """Evaluate the model and its uncertainty
+
+        Parameters
+        ----------
+        x: float, int, array-like
+            The value(s) to evaluate
+        x_unc: float, int, array-like
+            The uncertainty of the value(s)
+
+        Returns
+        -------
+        tuple
+            The value(s) and uncertainty of the model
+        """
+        # Polynomials propagate the bootstrap covariance
+        if self.kind == 'polynomial':
+            return evaluate_polynomial(self.params, self.C_p, x, x_unc=x_unc)
+
+        # Splines interpolate the bootstrap uncertainty curve
+        x = np.asarray(x, dtype=float)
+        y = predict(x, self.kind, self.params)
+        var = np.interp(x, self.grid, self.grid_unc)**2
+        if x_unc is not None:
+            var = var + (splev(x, self.params, der=1) * x_unc)**2
+        unc = np.sqrt(var)
+        if x.ndim == 0:
+            y, unc = y[()], unc[()]
+
+        return y, unc
+
+    @classmethod
+    def from_dict(cls, data):
+        """Make a fit from the output of to_dict
+
+        Parameters
+        ----------
+        data: dict
+            The fit attributes
+
+        Returns
+        -------
+        sedkit.fitting.RelationFit
+            The fit
+        """
+        data = dict(data)
+        params = data.pop('params')
+        if data['kind'] == 'spline':
+            params = np.asarray(params[0]), np.asarray(params[1]), int(params[2])
+
+        return cls(params=params, **data)
+
+    def to_dict(self):
+        """Get the fit attributes as a JSON-serializable dictionary
+
+        Returns
+        -------
+        dict
+            The fit attributes
+        """
+        params = [np.asarray(p).tolist() for p in self.params] if self.kind == 'spline' else np.asarray(self.params).tolist()
+        array = lambda arr: None if arr is None else np.asarray(arr).tolist()
+
+        return {'kind': self.kind, 'param': self.param, 'params': params, 'C_p': array(self.C_p),
+                'grid': array(self.grid), 'grid_unc': array(self.grid_unc), 'scores': self.scores,
+                'n_boot': self.n_boot, 'failures': self.failures}
+
+
+def bootstrap(samples, x, y, w, kind, param, grid=None):
+    """Refit a model to bootstrap resamples of the data
+
+    Parameters
+    ----------
+    samples: array-like
+        The indexes of the data in each resample
+    x: array-like
+        The x values
+    y: array-like
+        The y values
+    w: array-like
+        The weights
+    kind: str
+        The kind of model, ['polynomial', 'spline']
+    param: int, float
+        The polynomial order or spline smoothing factor
+    grid: array-like
+        The x values to evaluate each resampled spline at
+
+    Returns
+    -------
+    tuple
+        The coefficients (polynomials) or grid values (splines) of each
+        resample that could be fit, and the number that could not
+    """
+    results, failures = [], 0
+    for idx in samples:
+        try:
+            params = fit_model(x[idx], y[idx], w[idx], kind, param)
+            results.append(np.asarray(params) if kind == 'polynomial' else predict(grid, kind, params))
+        except (np.linalg.LinAlgError, ValueError):
+            failures += 1
+
+    return results, failures
+
+
+def cross_validate(x, y, w, kind, param, folds=5, seed=None):
+    """Score a model by the weighted mean squared error of its predictions
+    for data left out of the fit
+
+    Parameters
+    ----------
+    x: array-like
+        The x values
+    y: array-like
+        The y values
+    w: array-like
+        The weights
+    kind: str
+        The kind of model, ['polynomial', 'spline']
+    param: int, float
+        The polynomial order or spline smoothing factor
+    folds: int
+        The number of folds
+    seed: int
+        The seed for assigning data to folds
+
+    Returns
+    -------
+    float
+        The score, where lower is better
+    """
+    # Randomly assign each point to a fold
+    fold = np.random.RandomState(seed).permutation(len(x)) % folds
+
+    resid = []
+    for n in range(folds):
+        train, test = fold != n, fold == n
+        try:
+            params = fit_model(x[train], y[train], w[train], kind, param)
+            resid.append(w[test] * (predict(x[test], kind, params) - y[test]))
+        except (np.linalg.LinAlgError, ValueError):
+            return np.inf
+
+    score = np.mean(np.concatenate(resid)**2)
+
+    return float(score) if np.isfinite(score) else np.inf
+
+
+def evaluate_polynomial(coeffs, C_p, x, x_unc=None):
+    """
+    Evaluate a fitted polynomial and its uncertainty, propagating the fit
+    covariance as T C_p T^T and any uncertainty in x through the derivative
+
+    Parameters
+    ----------
+    coeffs: array-like
+        The polynomial coefficients, highest power first
+    C_p: array-like
+        The covariance matrix of the coefficients
+    x: float, int, array-like
+        The value(s) to evaluate
+    x_unc: float, int, array-like
+        The uncertainty of the value(s)
+
+    Returns
+    -------
+    tuple
+        The value(s) and uncertainty of the polynomial
+    """
+    x = np.asarray(x, dtype=float)
+    coeffs = np.asarray(coeffs)
+
+    # Matrix with rows x**order, ..., x, 1
+    T = np.vander(x.ravel(), len(coeffs))
+
+    # Matrix multiplication calculates the polynomial values...
+    y = np.dot(T, coeffs)
+
+    # ...and the diagonal of C_y = T*C_p*T.T
+    var = np.einsum('ij,jk,ik->i', T, C_p, T)
+
+    # Add the uncertainty in x
+    if x_unc is not None:
+        dydx = np.polyval(np.polyder(coeffs), x.ravel())
+        var = var + (dydx * np.broadcast_to(x_unc, x.shape).ravel())**2
+
+    y = y.reshape(x.shape)
+    unc = np.sqrt(var).reshape(x.shape)
+    if x.ndim == 0:
+        y, unc = y[()], unc[()]
+
+    return y, unc
+
+
+def fit_blackbody(wave, flux, unc=None, teff_grid=BLACKBODY_TEFFS, iterations=20):
+    """
+    Fit blackbodies to one or many SEDs at once by evaluating a grid of
+    temperatures as one Planck array, with the best scale factor of each
+    solved analytically, then refining the best grid point with
+    Gauss-Newton steps in temperature and scale
+
+    Parameters
+    ----------
+    wave: array-like
+        The wavelengths [um] shared by all the SEDs or a row for each SED
+    flux: array-like
+        The flux densities of one SED or a row for each SED, where NaNs
+        are missing data
+    unc: array-like (optional)
+        The uncertainties of the flux densities, otherwise the fit is
+        unweighted and the uncertainty is scaled by the scatter
+    teff_grid: array-like
+        The temperatures [K] to search, which also bound the refinement
+    iterations: int
+        The maximum number of refinement steps
+
+    Returns
+    -------
+    sequence
+        The temperature [K], its uncertainty [K], the scale factor in
+        units of the flux densities and the reduced chi-squared, as floats
+        for one SED or arrays for many
+    """
+    single = np.ndim(flux) == 1
+    flux = np.atleast_2d(np.asarray(flux, dtype=float))
+    shared = np.ndim(wave) == 1
+    wave = np.broadcast_to(np.asarray(wave, dtype=float), flux.shape)
+    weighted = unc is not None
+    unc = np.broadcast_to(np.asarray(unc if weighted else 1., dtype=float), flux.shape)
+    teff_grid = np.sort(np.asarray(teff_grid, dtype=float))
+
+    # Give missing data zero weight and normalize each SED for stability
+    good = np.isfinite(wave) & (wave > 0) & np.isfinite(flux) & np.isfinite(unc) & (unc > 0)
+    f = np.where(good, flux, 0.)
+    norm = np.max(np.abs(f), axis=1)
+    norm[norm == 0] = 1.
+    f /= norm[:, None]
+    w = np.where(good, (np.where(good, unc, 1.) / norm[:, None])**-2, 0.)
+    lam = np.where(good, wave, 1.)
+    npts = good.sum(axis=1)
+
+    # Chi-squared of each temperature with the best scale, (f - A*P)**2
+    # minimized at A = sum(w*f*P) / sum(w*P**2)
+    if shared:
+        P = u.planck(np.where(np.isfinite(wave[0]) & (wave[0] > 0), wave[0], 1.), teff_grid[:, None])
+        fP = (w * f).dot(P.T)
+        PP = w.dot((P**2).T)
+    else:
+        P = u.planck(lam[:, None, :], teff_grid[None, :, None])
+        fP = np.einsum('sw,stw->st', w * f, P)
+        PP = np.einsum('sw,stw->st', w, P**2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        chi2 = np.where(PP > 0, np.sum(w * f**2, axis=1)[:, None] - fP**2 / PP, np.inf)
+
+    # Start from the best temperature on the grid
+    rows = np.arange(len(f))
+    best = np.argmin(chi2, axis=1)
+    teff = teff_grid[best]
+    scale = np.where(PP[rows, best] > 0, fP[rows, best] / np.where(PP[rows, best] > 0, PP[rows, best], 1.), 0.)
+    chi2 = np.sum(w * (f - scale[:, None] * u.planck(lam, teff[:, None]))**2, axis=1)
+
+    # Refine with the Jacobian of the model in scale and temperature
+    for _ in range(iterations):
+        P, dP = u.planck(lam, teff[:, None], derivative=True)
+        dP = dP * scale[:, None]
+        resid = f - scale[:, None] * P
+        a, b, c = [np.sum(w * i * j, axis=1) for i, j in [(P, P), (P, dP), (dP, dP)]]
+        ga, gt = [np.sum(w * resid * i, axis=1) for i in [P, dP]]
+        det = a * c - b**2
+        ok = det > 0
+        det = np.where(ok, det, 1.)
+        d_scale = np.where(ok, (c * ga - b * gt) / det, 0.)
+        d_teff = np.where(ok, (a * gt - b * ga) / det, 0.)
+
+        # Only take the steps which improve the fit
+        new_teff = np.clip(teff + d_teff, teff_grid[0], teff_grid[-1])
+        new_scale = scale + d_scale
+        new_chi2 = np.sum(w * (f - new_scale[:, None] * u.planck(lam, new_teff[:, None]))**2, axis=1)
+        better = new_chi2 < chi2
+        teff = np.where(better, new_teff, teff)
+        scale = np.where(better, new_scale, scale)
+        chi2 = np.where(better, new_chi2, chi2)
+
+        if not np.any(better & (np.abs(d_teff) > 1E-6 * teff)):
+            break
+
+    # The uncertainty from the curvature of chi-squared at the best fit
+    P, dP = u.planck(lam, teff[:, None], derivative=True)
+    dP = dP * scale[:, None]
+    a, b, c = [np.sum(w * i * j, axis=1) for i, j in [(P, P), (P, dP), (dP, dP)]]
+    det = a * c - b**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        red_chi2 = np.where(npts > 2, chi2 / (npts - 2), np.nan)
+        teff_var = np.where(det > 0, a / det, np.nan)
+    teff_unc = np.sqrt(teff_var if weighted else teff_var * red_chi2)
+
+    # SEDs without enough data have no fit
+    bad = npts < 2
+    teff[bad] = teff_unc[bad] = scale[bad] = red_chi2[bad] = np.nan
+    scale = scale * norm
+
+    if single:
+        return float(teff[0]), float(teff_unc[0]), float(scale[0]), float(red_chi2[0])
+
+    return teff, teff_unc, scale, red_chi2
+
+
+def fit_model(x, y, w, kind, param):
+    """Fit a polynomial or smoothing spline to the data
+
+    Parameters
+    ----------
+    x: array-like
+        The x values
+    y: array-like
+        The y values
+    w: array-like
+        The weights
+    kind: str
+        The kind of model, ['polynomial', 'spline']
+    param: int, float
+        The polynomial order or spline smoothing factor, where the
+        smoothing condition is the factor times the number of points
+
+    Returns
+    -------
+    sequence
+        The polynomial coefficients or spline (t, c, k)
+    """
+    if kind == 'polynomial':
+        return np.polyfit(x, y, int(param), w=w)
+
+    elif kind == 'spline':
+
+        # Splines need strictly increasing x so average any duplicates
+        xu, inv = np.unique(x, return_inverse=True)
+        wsum = np.bincount(inv, weights=w**2)
+        yu = np.bincount(inv, weights=w**2 * y) / wsum
+        wu = np.sqrt(wsum)
+        if len(xu) < 4:
+            raise ValueError("Need at least 4 unique x values to fit a spline.")
+
+        return splrep(xu, yu, w=wu, k=3, s=param * len(xu))
+
+    else:
+        raise ValueError("{}: kind must be 'polynomial' or 'spline'".format(kind))
+
+
+def fit_relation(x, y, yerr=None, orders=POLYNOMIAL_ORDERS, smoothing=SPLINE_SMOOTHING, folds=5, n_boot=200, processes=None, seed=0, cache=True):
+    """
+    Fit candidate polynomials and smoothing splines to the data, choose the
+    one with the best cross-validation score, and bootstrap its uncertainty
+
+    Parameters
+    ----------
+    x: array-like
+        The x values
+    y: array-like
+        The y values
+    yerr: array-like
+        The uncertainties of the y values
+    orders: sequence
+        The candidate polynomial orders
+    smoothing: sequence
+        The candidate spline smoothing factors
+    folds: int
+        The number of cross-validation folds
+    n_boot: int
+        The number of bootstrap resamples of the chosen model
+    processes: int (optional)
+        The number of processes to run the bootstrap resamples on, default
+        is the sedkit.parallel backend
+    seed: int
+        The seed for the cross-validation folds and bootstrap resamples
+    cache: bool
+        Load the fit from, and save it to, the cache directory
+
+    Returns
+    -------
+    sedkit.fitting.RelationFit
+        The chosen fit
+    """
+    # Only fit valid values
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    yerr = np.ones_like(y) * np.nan if yerr is None else np.asarray(yerr, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y, yerr = x[valid], y[valid], yerr[valid]
+
+    # Without uncertainties, weight by the point-to-point scatter
+    if np.all(np.isfinite(yerr) & (yerr > 0)):
+        w = 1. / yerr
+    else:
+        w = np.ones_like(y) / (np.std(np.diff(y[np.argsort(x)])) / np.sqrt(2) or 1.)
+
+    # Check the cache
+    settings = {'orders': [int(o) for o in orders], 'smoothing': [float(s) for s in smoothing], 'folds': folds,
+                'n_boot': n_boot, 'seed': seed, 'version': CACHE_VERSION}
+    digest = hashlib.sha1(np.ascontiguousarray([x, y, w]).tobytes() + json.dumps(settings, sort_keys=True).encode()).hexdigest()
+    cache_file = os.path.join(u.cache_dir('fits'), '{}.json'.format(digest))
+    if cache and os.path.isfile(cache_file):
+        with open(cache_file) as f:
+            return RelationFit.from_dict(json.load(f))
+
+    # Score each candidate that the data can constrain
+    candidates = [('polynomial', int(o)) for o in orders if int(o) < len(x) - 1]
+    candidates += [('spline', float(s)) for s in smoothing if len(np.unique(x)) > 4]
+    scores = {'{} {}'.format(*c): cross_validate(x, y, w, *c, folds=folds, seed=seed) for c in candidates}
+    if not candidates or not np.isfinite(min(scores.values())):
+        raise ValueError("Could not fit any of the candidate models to the data.")
+    kind, param = min(candidates, key=lambda c: scores['{} {}'.format(*c)])
+
+    # Fit the chosen model to all the data
+    params = fit_model(x, y, w, kind, param)
+
+    # Draw the bootstrap resamples and split them into a chunk per process
+    rng = np.random.RandomState(seed)
+    samples = rng.randint(0, len(x), size=(n_boot, len(x)))
+    grid = np.linspace(x.min(), x.max(), 200) if kind == 'spline' else None
+    func = partial(bootstrap, x=x, y=y, w=w, kind=kind, param=param, grid=grid)
+    with parallel.get_executor(processes) as executor:
+        chunks = np.array_split(samples, min(executor.workers, n_boot) if executor.parallel else 1)
+        boots = executor.map(func, chunks)
+    failures = sum(n for _, n in boots)
+    boots = np.array([b for chunk, _ in boots for b in chunk])
+
+    # Too few resamples to trust the uncertainty
+    if failures > n_boot / 2.:
+        raise ValueError("Could not fit {} of {} bootstrap resamples of the {} {} model.".format(failures, n_boot, kind, param))
+    elif failures:
+        warnings.warn("Could not fit {} of {} bootstrap resamples of the {} {} model.".format(failures, n_boot, kind, param))
+
+    # Uncertainty from the scatter of the resampled models
+    C_p = grid_unc = None
+    if kind == 'polynomial':
+        C_p = np.cov(boots.T) if len(boots) > 1 else np.zeros((param + 1, param + 1))
+        C_p = np.atleast_2d(C_p)
+    else:
+        grid_unc = np.std(boots, axis=0) if len(boots) > 1 else np.zeros_like(grid)
+
+    result = RelationFit(kind, param, params, C_p=C_p, grid=grid, grid_unc=grid_unc, scores=scores, n_boot=len(boots), failures=failures)
+
+    # Save the fit
+    if cache:
+        with open(cache_file, 'w') as f:
+            json.dump(result.to_dict(), f)
+
+    return result
+
+
+def predict(x, kind, params):
+    """Evaluate a fitted polynomial or smoothing spline
+
+    Parameters
+    ----------
+    x: float, array-like
+        The value(s) to evaluate
+    kind: str
+        The kind of model, ['polynomial', 'spline']
+    params: sequence
+        The polynomial coefficients or spline (t, c, k)
+
+    Returns
+    -------
+    float, np.ndarray
+        The value(s) of the model
+    """
+    if kind == 'polynomial':
+        return np.polyval(params, x)
+    else:
+        return splev(x, params)
@@ -10,13 +10,18 @@ import glob
 from pkg_resources import resource_filename
 
 import astropy.units as q
-from astropy.io.ascii import read
-from bokeh.plotting import figure, show
-from bokeh.models import LinearColorMapper, BasicTicker, ColorBar
 import numpy as np
+from scipy.spatial import cKDTree
 
 from . import utilities as u
 
+# Plotting packages are imported on first use
+figure = u.LazyImport('bokeh.plotting', 'figure')
+show = u.show
+LinearColorMapper = u.LazyImport('bokeh.models', 'LinearColorMapper')
+BasicTicker = u.LazyImport('bokeh.models', 'BasicTicker')
+ColorBar = u.LazyImport('bokeh.models', 'ColorBar')
+
 # A dictionary of all supported moving group ages from Bell et al. (2015)
 NYMG_AGES = {'AB Dor': (149*q.Myr, 51*q.Myr),
              'beta Pic': (24*q.Myr, 3*q.Myr),
@@ -52,9 +57,11 @@ class Isochrone:
         self._mass_units = None
         self._radius_units = None
         self._teff_units = None
+        self._trees = {}
+        self._tree_rows = {}
 
         # Read in the data
-        self.data = read(self.path)
+        self.data = u.read_table(self.path)
 
         # Convert log to linear
         for col in self.data.colnames:
@@ -244,6 +251,177 @@ class Isochrone:
 
         return result * unit
 
+    def invert(self, xval, yval, xparam='Lbol', yparam='teff', params=('age', 'mass'), neighbors=8, n_samples=100, seed=None, plot=False):
+        """Estimate the age and mass (or other *params*) of one or more
+        sources from two observables, e.g. Lbol and Teff
+
+        Parameters
+        ----------
+        xval: float, int, astropy.units.quantity.Quantity, array-like, sequence
+            The value(s) of the x-axis (or (value, uncertainty)) to invert
+        yval: float, int, astropy.units.quantity.Quantity, array-like, sequence
+            The value(s) of the y-axis (or (value, uncertainty)) to invert
+        xparam: str
+            The name of the first observable column
+        yparam: str
+            The name of the second observable column
+        params: sequence
+            The names of the columns to estimate
+        neighbors: int
+            The number of nearest isochrone points to interpolate between
+        n_samples: int
+            The number of Monte Carlo draws used to propagate the
+            uncertainties of *xval* and *yval*
+        seed: int
+            The seed for the Monte Carlo draws
+        plot: bool
+            Plot all isochrones and the inverted points
+
+        Returns
+        -------
+        dict
+            The (value, uncertainty) of each of the *params*
+        """
+        # Check if the values have uncertainties
+        if not isinstance(xval, (tuple, list)):
+            xval = (xval, 0)
+        if not isinstance(yval, (tuple, list)):
+            yval = (yval, 0)
+
+        # Strip the units and broadcast to arrays
+        scalar = np.ndim(xval[0]) == 0 and np.ndim(yval[0]) == 0
+        x, xerr = [self._strip_units(val, xparam) for val in xval]
+        y, yerr = [self._strip_units(val, yparam) for val in yval]
+        x, xerr, y, yerr = np.broadcast_arrays(*[np.atleast_1d(val) for val in [x, xerr, y, yerr]])
+
+        # Get the KD-tree of the isochrone points in (xparam, yparam) space
+        tree, points, scale = self._get_tree(xparam, yparam)
+        neighbors = min(neighbors, len(points))
+
+        # Test the values are inbounds
+        inbounds = (x >= points[:, 0].min()) & (x <= points[:, 0].max()) & (y >= points[:, 1].min()) & (y <= points[:, 1].max())
+        if not all(inbounds) and self.verbose:
+            args = (~inbounds).sum(), xparam, yparam, self.name
+            print('{} value(s) outside the range of {} and {} in the {} isochrones.'.format(*args))
+
+        # Draw samples around the nominal values to propagate the uncertainties
+        n_samples = n_samples if np.any(xerr > 0) or np.any(yerr > 0) else 0
+        rng = np.random.RandomState(seed)
+        xs = x[:, None] + xerr[:, None] * rng.standard_normal((len(x), n_samples))
+        ys = y[:, None] + yerr[:, None] * rng.standard_normal((len(y), n_samples))
+        xs = np.column_stack([x, xs])
+        ys = np.column_stack([y, ys])
+
+        # Query the tree for all nominal values and samples at once
+        coords = np.column_stack([xs.ravel(), ys.ravel()]) / scale
+        dist, idx = tree.query(coords, k=neighbors)
+        dist, idx = dist.reshape(-1, neighbors), idx.reshape(-1, neighbors)
+
+        # Inverse distance weights, with exact matches taking all the weight
+        with np.errstate(divide='ignore'):
+            weights = 1. / dist**2
+        exact = ~np.isfinite(weights)
+        weights[exact.any(axis=1)] = exact[exact.any(axis=1)]
+
+        results = {}
+        for param in params:
+
+            # Interpolate positive quantities in log space
+            vals = np.asarray(self.data[param], dtype=float)[self._tree_rows[(xparam, yparam)]]
+            log = np.all(vals > 0)
+            vals = np.log10(vals) if log else vals
+            vals = vals[idx]
+
+            # Weighted mean and spread of the neighbors for every draw
+            est = np.sum(weights * vals, axis=1) / np.sum(weights, axis=1)
+            spread = np.sqrt(np.sum(weights * (vals - est[:, None])**2, axis=1) / np.sum(weights, axis=1))
+            est, spread = est.reshape(xs.shape), spread.reshape(xs.shape)
+
+            # The uncertainty is the grid resolution plus the scatter of the draws
+            nominal = est[:, 0]
+            error = np.sqrt(spread[:, 0]**2 + (np.std(est[:, 1:], axis=1) if n_samples > 0 else 0)**2)
+            if log:
+                nominal, error = 10**nominal, 10**nominal * np.log(10) * error
+
+            # Balk at the out of bounds values
+            nominal[~inbounds] = np.nan
+            error[~inbounds] = np.nan
+
+            # Put the results back in the same shape and units
+            unit = self.data[param].unit or 1
+            if scalar:
+                nominal, error = nominal[0], error[0]
+            results[param] = (nominal * unit, error * unit)
+
+        # Plot the figure and inverted points
+        if plot:
+            fig = self.plot(xparam, yparam)
+            fig.circle(x, y, color='red', legend='Inverted')
+            u.errorbars(fig, x, y, xerr=xerr * 2, yerr=yerr * 2, color='red')
+
+            show(fig)
+
+        return results
+
+    def _get_tree(self, xparam, yparam):
+        """Get the (cached) KD-tree of the isochrone points in the
+        (*xparam*, *yparam*) plane, scaled to the range of each column
+
+        Parameters
+        ----------
+        xparam: str
+            The name of the parameter on the x-axis
+        yparam: str
+            The name of the parameter on the y-axis
+
+        Returns
+        -------
+        scipy.spatial.cKDTree, np.ndarray, np.ndarray
+            The tree, the unscaled points, and the scale of each axis
+        """
+        # Use the cached tree if the units have not changed
+        key = (xparam, yparam)
+        units = self.data[xparam].unit, self.data[yparam].unit
+        if key in self._trees and self._trees[key][-1] == units:
+            return self._trees[key][:3]
+
+        # Collect the finite points
+        points = np.column_stack([np.asarray(self.data[xparam], dtype=float), np.asarray(self.data[yparam], dtype=float)])
+        rows = np.where(np.all(np.isfinite(points), axis=1))[0]
+        points = points[rows]
+
+        # Scale each axis to its range so both observables carry equal weight
+        scale = np.ptp(points, axis=0)
+        scale[scale == 0] = 1.
+        tree = cKDTree(points / scale)
+
+        self._trees[key] = tree, points, scale, units
+        self._tree_rows[key] = rows
+
+        return tree, points, scale
+
+    def _strip_units(self, value, param):
+        """Convert a value to the units of the given column and return the
+        bare values
+
+        Parameters
+        ----------
+        value: float, int, astropy.units.quantity.Quantity, array-like
+            The value(s) to convert
+        param: str
+            The name of the column
+
+        Returns
+        -------
+        float, np.ndarray
+            The value(s) in the units of the column
+        """
+        unit = self.data[param].unit
+        if hasattr(value, 'unit'):
+            value = value.to(unit).value if unit is not None else value.value
+
+        return np.asarray(value, dtype=float)
+
     def plot(self, xparam, yparam, draw=False, **kwargs):
         """Plot an evaluated isochrone, isochrone, or set of isochrones
 
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A module to record the wall time, number of calls and array sizes of each
+stage of the SED pipeline, which is switched on in code with `configure`
+or with the SEDKIT_METRICS environment variable
+"""
+from collections import OrderedDict
+from functools import wraps
+import os
+import time
+
+import astropy.table as at
+import astropy.units as q
+
+
+# The settings of the recorders
+SETTINGS = {'enabled': False}
+
+
+class Metrics:
+    """The total wall time, number of calls and array size of each stage
+    run by an object, where the times of nested stages are included in
+    the stages which call them"""
+    def __init__(self):
+        """Initialize the Metrics object"""
+        self.stages = OrderedDict()
+
+    def __add__(self, other):
+        """Add the metrics of two objects
+
+        Parameters
+        ----------
+        other: sedkit.metrics.Metrics
+            The metrics to add
+
+        Returns
+        -------
+        sedkit.metrics.Metrics
+            The combined metrics
+        """
+        if not isinstance(other, Metrics):
+            raise TypeError('Cannot add object of type', type(other))
+
+        new = Metrics()
+        new.merge(self)
+        new.merge(other)
+
+        return new
+
+    def __len__(self):
+        """The number of stages"""
+        return len(self.stages)
+
+    def __repr__(self):
+        """The stages"""
+        return '<Metrics of {} stage(s)>'.format(len(self))
+
+    def add(self, stage, elapsed, calls=1, size=None):
+        """Record a run of a stage
+
+        Parameters
+        ----------
+        stage: str
+            The name of the stage
+        elapsed: float
+            The wall time [s]
+        calls: int
+            The number of calls
+        size: int (optional)
+            The number of array elements processed
+        """
+        record = self.stages.setdefault(stage, [0, 0., 0])
+        record[0] += calls
+        record[1] += elapsed
+        record[2] += size or 0
+
+    def merge(self, other):
+        """Add the metrics of another object to these
+
+        Parameters
+        ----------
+        other: sedkit.metrics.Metrics
+            The metrics to add
+        """
+        for stage, (calls, elapsed, size) in other.stages.items():
+            self.add(stage, elapsed, calls=calls, size=size)
+
+    def reset(self):
+        """Forget all recorded stages"""
+        self.stages.clear()
+
+    def to_table(self):
+        """Make a table of the metrics
+
+        Returns
+        -------
+        astropy.table.Table
+            The calls, total and mean time, and total size of each stage
+        """
+        rows = [(stage, calls, elapsed, elapsed / calls, size) for stage, (calls, elapsed, size) in self.stages.items()]
+        table = at.Table(rows=rows or None, names=('stage', 'calls', 'time', 'mean_time', 'size'),
+                         dtype=('U32', int, float, float, int))
+        table['time'].unit = table['mean_time'].unit = q.s
+
+        return table
+
+
+def configure(enabled=None):
+    """Switch the recording of metrics on or off, which the environment
+    variable overrides
+
+    Parameters
+    ----------
+    enabled: bool (optional)
+        Record metrics
+    """
+    if enabled is not None:
+        SETTINGS['enabled'] = bool(enabled)
+
+
+def enabled():
+    """
+    Check if metrics are being recorded, which can also be switched on by
+    setting the SEDKIT_METRICS environment variable to 1
+
+    Returns
+    -------
+    bool
+        Whether to record metrics
+    """
+    return SETTINGS['enabled'] or os.environ.get('SEDKIT_METRICS', '').lower() in ['1', 'true', 'yes']
+
+
+def timed(stage, size=None):
+    """Record the wall time of a method in the `metrics` of its object
+
+    Parameters
+    ----------
+    stage: str
+        The name of the stage
+    size: callable (optional)
+        A function of the object and the method arguments which returns the
+        number of array elements processed, called after the method
+
+    Returns
+    -------
+    callable
+        The decorator
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+
+            # Just run the method if not recording
+            recorder = getattr(self, 'metrics', None)
+            if recorder is None or not enabled():
+                return method(self, *args, **kwargs)
+
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                try:
+                    nelem = size(self, *args, **kwargs) if size is not None else None
+                except Exception:
+                    nelem = None
+                recorder.add(stage, elapsed, size=nelem)
+
+        return wrapper
+
+    return decorator
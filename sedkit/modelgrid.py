@@ -8,8 +8,6 @@ import glob
 import pickle
 from copy import copy
 from functools import partial
-from multiprocessing.dummy import Pool as ThreadPool
-from multiprocessing import Pool
 from pkg_resources import resource_filename
 
 import astropy.io.ascii as ii
@@ -17,13 +15,16 @@ import astropy.table as at
 import astropy.units as q
 import astropy.io.votable as vo
 import numpy as np
-import pandas as pd
-from bokeh.plotting import figure, output_file, show, save
 
+from . import parallel
 from . import utilities as u
 from .spectrum import Spectrum
 
 
+# pandas is imported on first use
+pd = u.LazyImport('pandas')
+
+
 def load_model(file, parameters=None, wl_min=5000, wl_max=50000, max_points=10000):
     """Load a model from file
 
@@ -221,13 +222,10 @@ class ModelGrid:
                                                          self.name))
 
         # Grab the parameters and the filepath for each
-        pool = Pool(8)
         func = partial(load_model, parameters=parameters,
                        wl_min=wl_min.to(self.wave_units).value,
                        wl_max=wl_max.to(self.wave_units).value)
-        all_meta = pool.map(func, files)
-        pool.close()
-        pool.join()
+        all_meta = parallel.get_executor().map(func, files)
 
         # Make the index table
         self.index = pd.DataFrame(all_meta)
@@ -244,8 +242,8 @@ class ModelGrid:
 
         Returns
         -------
-        list
-            A list of the spectra as sedkit.spectrum.Spectrum objects
+        pandas.DataFrame
+            The rows of the index satisfying the conditions
         """
         # Get the relevant table rows
         return u.filter_table(self.index, **kwargs)
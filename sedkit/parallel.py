@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A module to run sedkit's parallel tasks on one configurable execution
+backend, which can be set in code with `configure` or overridden for
+cluster jobs with the SEDKIT_BACKEND, SEDKIT_WORKERS and SEDKIT_CHUNKSIZE
+environment variables. The shared pool is made again whenever the settings
+its worker processes copied, e.g. from `transport.configure`, have changed.
+"""
+import atexit
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+import sys
+
+
+# The supported execution backends
+BACKENDS = ['serial', 'threads', 'processes']
+
+# The settings of the shared executor
+SETTINGS = {'backend': 'processes', 'workers': None, 'chunksize': None}
+
+# The modules whose settings the worker processes copy when they start
+WORKER_MODULES = ['sedkit.transport', 'sedkit.dustmap', 'sedkit.metrics']
+
+# The shared executor, which is made on first use, and the settings it was made with
+_EXECUTOR = None
+_EXECUTOR_KEY = None
+
+
+class Executor:
+    """Run a function on many inputs serially or on a thread or process
+    pool, which is made once and reused by every call"""
+    def __init__(self, backend='processes', workers=None, chunksize=None, shared=False):
+        """Initialize the executor
+
+        Parameters
+        ----------
+        backend: str
+            Run tasks in 'serial', on 'threads' or on 'processes'
+        workers: int (optional)
+            The number of threads or processes, default is the number of
+            available CPUs
+        chunksize: int (optional)
+            The number of tasks sent to a worker at a time
+        shared: bool
+            Keep the pool open when used as a context manager
+        """
+        if backend not in BACKENDS:
+            raise ValueError("{}: Please use one of the backends {}".format(backend, BACKENDS))
+
+        self.backend = backend
+        self.workers = 1 if backend == 'serial' else max(1, int(workers or cpu_count()))
+        self.chunksize = None if chunksize is None else max(1, int(chunksize))
+        self.shared = shared
+        self._pool = None
+
+    def __enter__(self):
+        """Use the executor"""
+        return self
+
+    def __exit__(self, *args):
+        """Close the pool unless it is shared"""
+        if not self.shared:
+            self.close()
+
+    def __repr__(self):
+        """The settings"""
+        return '<Executor {} with {} worker(s)>'.format(self.backend, self.workers)
+
+    def close(self):
+        """Close the pool and wait for the workers to finish"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def imap(self, func, iterable, ordered=True, chunksize=None):
+        """Lazily apply a function to each input
+
+        Parameters
+        ----------
+        func: callable
+            The function, which must be picklable for processes
+        iterable: sequence
+            The inputs
+        ordered: bool
+            Yield the results in the order of the inputs rather than as
+            they finish
+        chunksize: int (optional)
+            The number of tasks sent to a worker at a time
+
+        Returns
+        -------
+        iterator
+            The results
+        """
+        if not self.parallel:
+            return map(func, iterable)
+
+        pool = self._get_pool()
+        method = pool.imap if ordered else pool.imap_unordered
+
+        return method(func, iterable, chunksize or self.chunksize or 1)
+
+    def map(self, func, iterable, chunksize=None):
+        """Apply a function to each input
+
+        Parameters
+        ----------
+        func: callable
+            The function, which must be picklable for processes
+        iterable: sequence
+            The inputs
+        chunksize: int (optional)
+            The number of tasks sent to a worker at a time
+
+        Returns
+        -------
+        list
+            The results in the order of the inputs
+        """
+        if not self.parallel:
+            return list(map(func, iterable))
+
+        return self._get_pool().map(func, iterable, chunksize or self.chunksize)
+
+    @property
+    def parallel(self):
+        """Whether tasks run in parallel, which they cannot from inside a
+        worker process"""
+        if self.backend == 'serial' or self.workers < 2:
+            return False
+
+        return not (self.backend == 'processes' and multiprocessing.current_process().daemon)
+
+    def _get_pool(self):
+        """Make the pool the first time it is needed
+
+        Returns
+        -------
+        multiprocessing.pool.Pool
+            The thread or process pool
+        """
+        if self._pool is None:
+            self._pool = ThreadPool(self.workers) if self.backend == 'threads' else multiprocessing.Pool(self.workers)
+
+        return self._pool
+
+
+def configure(backend=None, workers=None, chunksize=None):
+    """Set the backend of the shared executor, which the environment
+    variables override
+
+    Parameters
+    ----------
+    backend: str (optional)
+        Run tasks in 'serial', on 'threads' or on 'processes'
+    workers: int (optional)
+        The number of threads or processes, default is the number of
+        available CPUs
+    chunksize: int (optional)
+        The number of tasks sent to a worker at a time
+
+    Returns
+    -------
+    sedkit.parallel.Executor
+        The shared executor
+    """
+    if backend is not None and backend not in BACKENDS:
+        raise ValueError("{}: Please use one of the backends {}".format(backend, BACKENDS))
+
+    SETTINGS.update({key: val for key, val in [('backend', backend), ('workers', workers), ('chunksize', chunksize)] if val is not None})
+
+    return get_executor()
+
+
+def cpu_count():
+    """Get the number of CPUs this process may run on
+
+    Returns
+    -------
+    int
+        The number of CPUs
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+
+    return os.cpu_count() or 1
+
+
+def get_executor(processes=None):
+    """Get the shared executor, or one with the given number of processes
+
+    An explicit number of processes takes precedence over the shared
+    settings and the SEDKIT_BACKEND and SEDKIT_WORKERS environment
+    variables, so only the shared executor follows them.
+
+    Parameters
+    ----------
+    processes: int (optional)
+        The number of processes to use instead of the shared executor
+
+    Returns
+    -------
+    sedkit.parallel.Executor
+        The executor, which only closes its pool on leaving a context if
+        it is not shared
+    """
+    global _EXECUTOR, _EXECUTOR_KEY
+
+    # A private executor, with new workers
+    if processes is not None:
+        return Executor('processes' if processes > 1 else 'serial', workers=processes)
+
+    # Make the shared executor again if its settings or those the workers
+    # copied from the other modules have changed
+    key = settings(), worker_settings()
+    if _EXECUTOR is None or key != _EXECUTOR_KEY:
+        shutdown()
+        backend, workers, chunksize = key[0]
+        _EXECUTOR = Executor(backend, workers=workers, chunksize=chunksize, shared=True)
+        _EXECUTOR_KEY = key
+
+    return _EXECUTOR
+
+
+def settings():
+    """Get the settings of the shared executor, overridden by the
+    SEDKIT_BACKEND, SEDKIT_WORKERS and SEDKIT_CHUNKSIZE environment variables
+
+    Returns
+    -------
+    tuple
+        The backend, number of workers and chunk size
+    """
+    backend = os.environ.get('SEDKIT_BACKEND') or SETTINGS['backend']
+    if backend not in BACKENDS:
+        raise ValueError("{}: Please use one of the backends {}".format(backend, BACKENDS))
+
+    try:
+        workers = int(os.environ.get('SEDKIT_WORKERS') or SETTINGS['workers'] or cpu_count())
+        chunksize = os.environ.get('SEDKIT_CHUNKSIZE') or SETTINGS['chunksize']
+        chunksize = None if chunksize is None else int(chunksize)
+    except ValueError:
+        raise ValueError("SEDKIT_WORKERS and SEDKIT_CHUNKSIZE must be integers.")
+
+    return backend, 1 if backend == 'serial' else max(1, workers), None if chunksize is None else max(1, chunksize)
+
+
+def shutdown():
+    """Close the pool of the shared executor"""
+    global _EXECUTOR, _EXECUTOR_KEY
+
+    if _EXECUTOR is not None:
+        _EXECUTOR.close()
+        _EXECUTOR = None
+        _EXECUTOR_KEY = None
+
+
+def worker_settings():
+    """Get the settings which worker processes copy from this process when
+    they start, i.e. the sedkit environment variables and the settings of
+    the loaded modules which are set with `configure`
+
+    Returns
+    -------
+    tuple
+        The environment variables and module settings
+    """
+    env = tuple(sorted((key, val) for key, val in os.environ.items() if key.startswith('SEDKIT_')))
+    modules = tuple((name, repr(sorted(sys.modules[name].SETTINGS.items()))) for name in WORKER_MODULES if name in sys.modules)
+
+    return env, modules
+
+
+atexit.register(shutdown)
@@ -2,19 +2,34 @@
 This is the code used to generate the polynomial relations
 used in sedkit's calculations
 """
+import argparse
+import datetime
+from functools import lru_cache
+import json
+import os
 from pkg_resources import resource_filename
 
-import astropy.io.ascii as ii
 import astropy.units as q
 import astropy.table as at
-from astroquery.vizier import Vizier
-from bokeh.plotting import figure, show
 import numpy as np
 
+from . import fitting
+from . import transport
 from . import utilities as u
 
 
-V = Vizier(columns=["**"])
+# Catalog queries and plotting are imported on first use
+V = u.LazyImport('astroquery.vizier', 'Vizier', setup=lambda vizier: vizier(columns=["**"]))
+figure = u.LazyImport('bokeh.plotting', 'figure')
+show = u.show
+transport.register('vizier_catalogs', V)
+
+# The precomputed spectral type-radius relation and its format version
+SPT_RADIUS_FILE = 'spt_radius.json'
+SPT_RADIUS_VERSION = 1
+SPT_RADIUS_COLUMNS = ['spectral_type', 'spt', 'radius', 'radius_unc']
+SPT_RADIUS_RANGES = {'AFGK': (30, 65), 'MLTY': (65, 99)}
+SPT_RADIUS_REFS = {'AFGK': 'Boyajian+ 2012b, 2013', 'MLTY': 'Filippazzo+ 2015'}
 
 
 class Relation:
@@ -26,9 +41,18 @@ class Relation:
         ----------
         file: str
             The file to load
+        xparam: str
+            The x-axis parameter to derive a relation for
+        yparam: str
+            The y-axis parameter to derive a relation for
+        order: int, str
+            The order of the polynomial fit, or 'best' to choose the best
+            model with the fit method
+        add_columns: dict
+            Additional columns to add to the data
         """
         # Load the file into a table
-        self.data = ii.read(file, **kwargs)
+        self.data = u.read_table(file, **kwargs)
 
         # Add additional columns
         if isinstance(add_columns, dict):
@@ -47,11 +71,15 @@ class Relation:
         self.yi = None
         self.C_yi = None
         self.sig_yi = None
+        self.model = None
         self.derived = False
 
         # Try to derive
         if self.xparam is not None and self.yparam is not None and self.order is not None:
-            self.derive(self.xparam, self.yparam, self.order)
+            if self.order == 'best':
+                self.fit(self.xparam, self.yparam)
+            else:
+                self.derive(self.xparam, self.yparam, self.order)
 
     def add_column(self, colname, values):
         """
@@ -124,16 +152,21 @@ class Relation:
         self.sig_yi = np.sqrt(np.diag(self.C_yi))
 
         # Set as derived
+        self.model = None
         self.derived = True
 
-    def evaluate(self, x_val, plot=False):
+    def evaluate(self, x_val, x_unc=None, plot=False):
         """
         Evaluate the derived polynomial at the given xval
 
         Parameters
         ----------
-        x_val: float, int
-            The xvalue to evaluate
+        x_val: float, int, array-like
+            The xvalue(s) to evaluate
+        x_unc: float, int, array-like
+            The uncertainty of the xvalue(s)
+        plot: bool
+            Plot the relation and the evaluated points
 
         Returns
         -------
@@ -145,17 +178,67 @@ class Relation:
             print("Please run the derive method before trying to evaluate.")
             return
 
-        # Evaluate the polynomial
-        y_val = np.polyval(self.coeffs, x_val)
-        y_unc = np.interp(x_val, self.x, self.sig_yi)
+        # Evaluate the polynomial or chosen model
+        if self.model is not None:
+            y_val, y_unc = self.model.evaluate(x_val, x_unc=x_unc)
+        else:
+            y_val, y_unc = fitting.evaluate_polynomial(self.coeffs, self.C_p, x_val, x_unc=x_unc)
 
         if plot:
             plt = self.plot()
-            plt.circle([x_val], [y_val], color='red', size=10, legend='f({})'.format(x_val))
+            legend = 'f({})'.format(x_val) if np.ndim(x_val) == 0 else 'f(x)'
+            plt.circle(np.atleast_1d(x_val), np.atleast_1d(y_val), color='red', size=10, legend=legend)
             show(plt)
 
         return y_val, y_unc
 
+    def fit(self, xparam, yparam, orders=fitting.POLYNOMIAL_ORDERS, smoothing=fitting.SPLINE_SMOOTHING, **kwargs):
+        """
+        Choose the polynomial or smoothing spline for *yparam* as a function
+        of *xparam* with the best cross-validation score and bootstrap its
+        uncertainties. The fit is cached so it is only run once for the same
+        data and settings.
+
+        Parameters
+        ----------
+        xparam: str
+            The x-axis parameter
+        yparam: str
+            The y-axis parameter
+        orders: sequence
+            The candidate polynomial orders
+        smoothing: sequence
+            The candidate spline smoothing factors
+        """
+        # Make sure params are in the table
+        if xparam not in self.data.colnames or yparam not in self.data.colnames:
+            raise NameError("{}, {}: Make sure both parameters are in the data, {}".format(xparam, yparam, self.data.colnames))
+
+        # Grab data with masked values as NaN
+        values = lambda col: np.asarray(at.MaskedColumn(self.data[col], dtype=float).filled(np.nan))
+        x = values(xparam)
+        y = values(yparam)
+        yerr = values('{}_unc'.format(yparam)) if '{}_unc'.format(yparam) in self.data.colnames else None
+
+        # Fit the candidates
+        self.model = fitting.fit_relation(x, y, yerr, orders=orders, smoothing=smoothing, **kwargs)
+
+        # Store the chosen fit
+        valid = np.isfinite(x) & np.isfinite(y)
+        self.xparam = xparam
+        self.yparam = yparam
+        self.x = x[valid]
+        self.y = y[valid]
+        self.order = self.model.param if self.model.kind == 'polynomial' else None
+        self.coeffs = self.model.coeffs
+        self.C_p = self.model.C_p
+        self.matrix = None
+        self.C_yi = None
+        self.yi, self.sig_yi = self.model.evaluate(self.x)
+
+        # Set as derived
+        self.derived = True
+
     def plot(self, xparam=None, yparam=None, **kwargs):
         """
         Plot the data for the given parameters
@@ -179,7 +262,7 @@ class Relation:
 
             # Plot polynomial values
             xaxis = np.linspace(self.x.min(), self.x.max(), 100)
-            evals = [self.evaluate(i)[0] for i in xaxis]
+            evals, _ = self.evaluate(xaxis)
             fig.line(xaxis, evals, color='black', legend='Fit')
 
             # Plot polynomial uncertainties
@@ -192,7 +275,7 @@ class Relation:
 
 class DwarfSequence(Relation):
     """A class to evaluate the Main Sequence in arbitrary parameter spaces"""
-    def __init__(self, **kwargs):
+    def __init__(self, xparam=None, yparam=None, order=None, **kwargs):
         """
         Initialize a Relation object with the Dwarf Sequence data
         """
@@ -207,27 +290,99 @@ class DwarfSequence(Relation):
 
         self.add_column('spt', [u.specType(i)[0] for i in self.data['SpT']])
 
+        # Derive now that all the columns are present
+        if xparam is not None and yparam is not None and order is not None:
+            if order == 'best':
+                self.fit(xparam, yparam)
+            else:
+                self.derive(xparam, yparam, order)
+
 
 class SpectralTypeRadius:
-    def __init__(self, orders=(5, 3), name='Spectral Type vs. Radius'):
+    def __init__(self, orders=(5, 3), name='Spectral Type vs. Radius', rebuild=False):
         """Initialize the object
 
         Parameters
         ----------
-        order: int
-            The order polynomial to fit to the spt-radius data
+        orders: sequence
+            The order polynomials to fit to the AFGK and MLTY data
+        name: str
+            The name of the relation
+        rebuild: bool
+            Query the source data and refit the polynomials instead of
+            loading the precomputed relation
         """
         self.name = name
-        self.generate(orders)
+        self.source = None
+
+        # Load the precomputed relation...
+        artifact = None if rebuild else load_spt_radius()
+        if artifact is not None:
+            self.source = {grp: at.Table(artifact[grp]['data']) for grp in ['AFGK', 'MLTY']}
+            fits = [artifact[grp]['fits'].get(str(order)) for grp, order in zip(['AFGK', 'MLTY'], orders)]
+
+            # ...and use the stored fits if they are the requested orders...
+            if all(fits):
+                for grp, fit in zip(['AFGK', 'MLTY'], fits):
+                    setattr(self, grp, self._container(grp, fit))
 
-    def get_radius(self, spt, plot=False):
+            # ...or refit the stored source data
+            else:
+                self.generate(orders)
+
+        # ...or generate it from scratch and cache it for next time
+        else:
+            self.generate(orders, refresh=True)
+            self.save(os.path.join(u.cache_dir(), SPT_RADIUS_FILE))
+
+    def _container(self, name, fit):
+        """Make the container for a fitted polynomial
+
+        Parameters
+        ----------
+        name: str
+            The name of the data, ['AFGK', 'MLTY']
+        fit: dict
+            The fit 'order', 'coeffs' and 'C_p'
+
+        Returns
+        -------
+        dict
+            The data, coefficients, covariance and uncertainty curve
+        """
+        data = self.source[name]
+        order = int(fit['order'])
+        container = {'data': data, 'rng': SPT_RADIUS_RANGES[name], 'ref': SPT_RADIUS_REFS[name], 'order': order}
+        container['coeffs'] = np.asarray(fit['coeffs'])
+        container['C_p'] = np.asarray(fit['C_p'])
+
+        # Do the interpolation for plotting
+        container['spt'] = np.arange(np.nanmin(data['spt'])-3, np.nanmax(data['spt'])+1)
+
+        # Matrix with rows 1, spt, spt**2, ...
+        container['sptT'] = np.vstack([container['spt']**(order-i) for i in range(order+1)]).T
+
+        # Matrix multiplication calculates the polynomial values
+        container['yi'] = np.dot(container['sptT'], container['coeffs'])
+
+        # C_y = TT*C_z*TT.T
+        container['C_yi'] = np.dot(container['sptT'], np.dot(container['C_p'], container['sptT'].T))
+
+        # Standard deviations are sqrt of diagonal
+        container['sig_yi'] = np.sqrt(np.diag(container['C_yi']))
+
+        return container
+
+    def get_radius(self, spt, spt_unc=None, plot=False):
         """Get the radius for the given spectral type
 
         Parameters
         ----------
-        spt: str, int
+        spt: str, int, sequence
             The alphanumeric (e.g. 'A0') or integer (0-99 => O0-Y9) spectral
-            type
+            type, or a sequence of them
+        spt_unc: float, int, sequence
+            The uncertainty of the spectral type(s)
         plot: bool
             Generate a plots
 
@@ -237,29 +392,39 @@ class SpectralTypeRadius:
             The radius and uncertainty in solar radii
         """
         # Convert to integer
-        if isinstance(spt, (str, bytes)):
-            spt = u.specType(spt)[0]
+        scalar = np.ndim(spt) == 0
+        spt = [u.specType(i)[0] if isinstance(i, (str, bytes)) else i for i in ([spt] if scalar else list(spt))]
 
         # Test valid ranges
-        if not isinstance(spt, (int, float)) or not 30 <= spt <= 99:
+        try:
+            spt = np.asarray(spt, dtype=float)
+        except (TypeError, ValueError):
+            raise ValueError("Please provide a spectral type within [30, 99]")
+        if not np.all((spt >= 30) & (spt <= 99)):
             raise ValueError("Please provide a spectral type within [30, 99]")
 
         # Evaluate the polynomials
-        if spt > 64:
-            data = self.MLTY
-        else:
-            data = self.AFGK
-        radius = np.polyval(data['coeffs'], spt)*q.Rsun
-        radius_unc = np.interp(spt, data['spt'], data['sig_yi'])*q.Rsun
+        radius = np.zeros_like(spt)
+        radius_unc = np.zeros_like(spt)
+        spt_unc = np.broadcast_to(0 if spt_unc is None else spt_unc, spt.shape)
+        for data, idx in [(self.MLTY, spt > 64), (self.AFGK, spt <= 64)]:
+            if any(idx):
+                radius[idx], radius_unc[idx] = fitting.evaluate_polynomial(data['coeffs'], data['C_p'], spt[idx], x_unc=spt_unc[idx])
+
+        if scalar:
+            radius, radius_unc, spt = radius[0], radius_unc[0], spt[0]
+        radius = radius*q.Rsun
+        radius_unc = radius_unc*q.Rsun
 
         if plot:
             fig = self.plot()
-            fig.triangle([spt], [radius.value], color='red', size=15, legend=u.specType(spt))
+            legend = u.specType(spt) if scalar else 'Evaluated'
+            fig.triangle(np.atleast_1d(spt), np.atleast_1d(radius.value), color='red', size=15, legend=legend)
             show(fig)
 
         return radius.round(3), radius_unc.round(3)
 
-    def generate(self, orders):
+    def generate(self, orders, refresh=False):
         """
         Generate a polynomial that describes the radius as a function of
         spectral type for empirically measured AFGKM main sequence stars
@@ -269,113 +434,19 @@ class SpectralTypeRadius:
         Parameters
         ----------
         orders: sequence
-            The order polynomials to fit to the MLTY and AFGK data
-        generate: bool
-            Generate the polynomials
+            The order polynomials to fit to the AFGK and MLTY data
+        refresh: bool
+            Query the source data again rather than refit the stored data
         """
-        # ====================================================================
-        # Boyajian AFGKM data
-        # ====================================================================
-
-        afgk = resource_filename('sedkit', 'data/AFGK_radii.txt')
-        afgk_data = ii.read(afgk, format='csv', comment='#')
-
-        # ====================================================================
-        # Filippazzo MLTY data
-        # ====================================================================
-
-        # Get the data
-        cat1 = V.query_constraints('J/ApJ/810/158/table1')[0]
-        cat2 = V.query_constraints('J/ApJ/810/158/table9')[0]
+        # Get the source data
+        if refresh or self.source is None:
+            self.source = get_spt_radius_data()
 
-        # Join the tables to getthe spectral types and radii in one table
-        mlty_data = at.join(cat1, cat2, keys='ID', join_type='outer')
-
-        # Only keep field age
-        mlty_data = mlty_data[mlty_data['b_Age'] >= 0.5]
-
-        # Rename columns
-        mlty_data.rename_column('SpT', 'spectral_type')
-        mlty_data.rename_column('Rad', 'radius')
-        mlty_data.rename_column('e_Rad', 'radius_unc')
-
-        # Make solar radii units
-        mlty_data['radius'] = mlty_data['radius'].to(q.Rsun)
-        mlty_data['radius_unc'] = mlty_data['radius_unc'].to(q.Rsun)
-
-        # ====================================================================
         # Fit and save the data
-        # ====================================================================
-
-        for data, name, order, ref, rng in zip([afgk_data, mlty_data],
-                                               ['AFGK', 'MLTY'], orders,
-                                               ['Boyajian+ 2012b, 2013', 'Filippazzo+ 2015'],
-                                               [(30, 65), (65, 99)]):
-
-            # Container for data
-            container = {}
-
-            # Translate string SPT to numbers
-            spts = []
-            keep = []
-            for n,i in enumerate(data['spectral_type']):
-                try:
-                    spt = u.specType(i)
-                    spts.append(spt)
-                    keep.append(n)
-                except:
-                    pass
-
-            # Filter bad spectral types
-            data = data[keep]
-
-            # Add the number to the table
-            num, *_, lum = np.array(spts).T
-            data['spt'] = num.astype(float)
-            data['lum'] = lum
-
-            # Filter out sub-giants
-            data = data[(data['spt'] > rng[0]) & (data['spt'] < rng[1])]
-            data = data[data['lum'] == 'V']
-            data = data[((data['radius'] < 1.8) & (data['spt'] > 37)) | (data['spt'] <= 37)]
-
-            # Filter out nans
-            data = data[data['radius'] < 4]
-            data = data[data['radius'] > 0]
-            data = data[data['radius_unc'] > 0]
-            container['data'] = data[data['spt'] > 0]
-            container['rng'] = rng
-
-            # Fit polynomial
-            container['coeffs'], container['C_p'] = np.polyfit(data['spt'],
-                                                               data['radius'],
-                                                               order,
-                                                               w=1./data['radius_unc'],
-                                                               cov=True)
-
-            # Do the interpolation for plotting
-            container['spt'] = np.arange(np.nanmin(data['spt'])-3, np.nanmax(data['spt'])+1)
-
-            # Matrix with rows 1, spt, spt**2, ...
-            container['sptT'] = np.vstack([container['spt']**(order-i) for i in range(order+1)]).T
-
-            # Matrix multiplication calculates the polynomial values
-            container['yi'] = np.dot(container['sptT'], container['coeffs'])
-
-            # C_y = TT*C_z*TT.T
-            container['C_yi'] = np.dot(container['sptT'], np.dot(container['C_p'], container['sptT'].T))
-
-            # Standard deviations are sqrt of diagonal
-            container['sig_yi'] = np.sqrt(np.diag(container['C_yi']))
-
-            # Store the new order
-            container['order'] = order
-
-            # Set the reference
-            container['ref'] = ref
-
-            # Add the container as an attribute
-            setattr(self, name, container)
+        for name, order in zip(['AFGK', 'MLTY'], orders):
+            data = self.source[name]
+            coeffs, C_p = np.polyfit(data['spt'], data['radius'], order, w=1./data['radius_unc'], cov=True)
+            setattr(self, name, self._container(name, {'order': order, 'coeffs': coeffs, 'C_p': C_p}))
 
     def plot(self, draw=False):
         """Plot the relation
@@ -423,3 +494,201 @@ class SpectralTypeRadius:
             show(fig)
         else:
             return fig
+
+    def save(self, filepath):
+        """Save the source data and fitted polynomials as a versioned JSON
+        file that can be loaded instead of regenerating the relation
+
+        Parameters
+        ----------
+        filepath: str
+            The path to the output file
+        """
+        artifact = {'name': self.name, 'version': SPT_RADIUS_VERSION,
+                    'created': datetime.datetime.utcnow().isoformat()}
+
+        for grp in ['AFGK', 'MLTY']:
+            container = getattr(self, grp)
+            data = {col: np.asarray(self.source[grp][col]).tolist() for col in self.source[grp].colnames}
+            fit = {'order': container['order'], 'coeffs': container['coeffs'].tolist(), 'C_p': container['C_p'].tolist(),
+                   'spt': container['spt'].tolist(), 'yi': container['yi'].tolist(), 'sig_yi': container['sig_yi'].tolist()}
+            artifact[grp] = {'ref': container['ref'], 'rng': container['rng'], 'data': data, 'fits': {str(container['order']): fit}}
+
+        with open(filepath, 'w') as f:
+            json.dump(artifact, f, indent=1)
+
+
+def build_spt_radius(filepath, orders=(5, 3)):
+    """
+    Query the source data, refit the spectral type-radius relation and write
+    the precomputed relation loaded by SpectralTypeRadius, e.g. to
+    sedkit/data/spt_radius.json in a source checkout
+
+    Parameters
+    ----------
+    filepath: str
+        The path to the output file
+    orders: sequence
+        The order polynomials to fit to the AFGK and MLTY data
+
+    Returns
+    -------
+    str
+        The path to the output file
+    """
+    relation = SpectralTypeRadius(orders=orders, rebuild=True)
+    relation.save(filepath)
+
+    return filepath
+
+
+def get_spt_radius_data():
+    """
+    Get the radii of AFGKM main sequence stars (Boyajian+ 2012b, 2013) and
+    MLTY field age dwarfs (Filippazzo+ 2015), which requires a Vizier query
+
+    Returns
+    -------
+    dict
+        The 'AFGK' and 'MLTY' tables of spectral type, radius and uncertainty
+    """
+    # ====================================================================
+    # Boyajian AFGKM data
+    # ====================================================================
+
+    afgk = resource_filename('sedkit', 'data/AFGK_radii.txt')
+    afgk_data = u.read_table(afgk, format='csv', comment='#')
+
+    # ====================================================================
+    # Filippazzo MLTY data
+    # ====================================================================
+
+    # Get the data
+    cat1 = transport.request('vizier_catalogs', 'query_constraints', 'J/ApJ/810/158/table1')[0]
+    cat2 = transport.request('vizier_catalogs', 'query_constraints', 'J/ApJ/810/158/table9')[0]
+
+    # Join the tables to getthe spectral types and radii in one table
+    mlty_data = at.join(cat1, cat2, keys='ID', join_type='outer')
+
+    # Only keep field age
+    mlty_data = mlty_data[mlty_data['b_Age'] >= 0.5]
+
+    # Rename columns
+    mlty_data.rename_column('SpT', 'spectral_type')
+    mlty_data.rename_column('Rad', 'radius')
+    mlty_data.rename_column('e_Rad', 'radius_unc')
+
+    # Make solar radii units
+    mlty_data['radius'] = mlty_data['radius'].to(q.Rsun)
+    mlty_data['radius_unc'] = mlty_data['radius_unc'].to(q.Rsun)
+
+    # ====================================================================
+    # Clean the data
+    # ====================================================================
+
+    source = {}
+    for data, name in zip([afgk_data, mlty_data], ['AFGK', 'MLTY']):
+
+        rng = SPT_RADIUS_RANGES[name]
+
+        # Translate string SPT to numbers
+        spts = []
+        keep = []
+        for n, i in enumerate(data['spectral_type']):
+            try:
+                spt = u.specType(i)
+                spts.append(spt)
+                keep.append(n)
+            except:
+                pass
+
+        # Filter bad spectral types
+        data = data[keep]
+
+        # Add the number to the table
+        num, *_, lum = np.array(spts).T
+        data['spt'] = num.astype(float)
+        data['lum'] = lum
+
+        # Filter out sub-giants
+        data = data[(data['spt'] > rng[0]) & (data['spt'] < rng[1])]
+        data = data[data['lum'] == 'V']
+        data = data[((data['radius'] < 1.8) & (data['spt'] > 37)) | (data['spt'] <= 37)]
+
+        # Filter out nans
+        data = data[data['radius'] < 4]
+        data = data[data['radius'] > 0]
+        data = data[data['radius_unc'] > 0]
+        data = data[data['spt'] > 0]
+
+        # Only keep the columns needed for the fit
+        columns = [np.asarray(data['spectral_type']).astype(str)] + [np.asarray(data[col], dtype=float) for col in SPT_RADIUS_COLUMNS[1:]]
+        source[name] = at.Table(columns, names=SPT_RADIUS_COLUMNS)
+
+    return source
+
+
+def load_spt_radius():
+    """
+    Load the precomputed spectral type-radius relation from the package data
+    or, failing that, the user cache
+
+    Returns
+    -------
+    dict, None
+        The relation, or None if there is no valid file
+    """
+    for filepath in [resource_filename('sedkit', 'data/{}'.format(SPT_RADIUS_FILE)),
+                     os.path.join(u.cache_dir(), SPT_RADIUS_FILE)]:
+
+        if os.path.isfile(filepath):
+            with open(filepath) as f:
+                artifact = json.load(f)
+
+            # Ignore files written by an older version of this module
+            if artifact.get('version') == SPT_RADIUS_VERSION:
+                return artifact
+
+    return None
+
+
+@lru_cache()
+def spectral_type_radius(orders=(5, 3)):
+    """
+    Get the shared spectral type-radius relation, loaded on first use
+
+    Parameters
+    ----------
+    orders: sequence
+        The order polynomials to fit to the AFGK and MLTY data
+
+    Returns
+    -------
+    sedkit.relations.SpectralTypeRadius
+        The relation
+    """
+    return SpectralTypeRadius(orders=tuple(orders))
+
+
+def main(args=None):
+    """
+    Build the precomputed spectral type-radius relation from the command
+    line, e.g. python -m sedkit.relations sedkit/data/spt_radius.json
+
+    Parameters
+    ----------
+    args: sequence (optional)
+        The command line arguments, default is sys.argv[1:]
+    """
+    parser = argparse.ArgumentParser(description=build_spt_radius.__doc__.strip().split('\n\n')[0])
+    parser.add_argument('filepath', help='The path to the output file')
+    parser.add_argument('--orders', type=int, nargs=2, default=[5, 3], metavar=('AFGK', 'MLTY'),
+                        help='The order polynomials to fit to the AFGK and MLTY data')
+    args = parser.parse_args(args)
+
+    filepath = build_spt_radius(args.filepath, orders=tuple(args.orders))
+    print("Wrote the spectral type-radius relation to {}".format(filepath))
+
+
+if __name__ == '__main__':
+    main()
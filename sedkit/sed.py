@@ -4,35 +4,57 @@ and calculate fundamental and atmospheric parameters
 
 Author: Joe Filippazzo, jfilippazzo@stsci.edu
 """
+from collections import OrderedDict
 from copy import copy
+import io
 import os
-import shutil
+import tempfile
+import zipfile
 
 import astropy.table as at
 import astropy.units as q
 import astropy.io.ascii as ii
 import astropy.constants as ac
 import numpy as np
-from astropy.modeling import fitting
 from astropy.coordinates import Angle, SkyCoord
-from astroquery.vizier import Vizier
-from astroquery.simbad import Simbad
-from bokeh.io import export_png
-from bokeh.plotting import figure, show
-from bokeh.models import HoverTool, Range1d, ColumnDataSource
-from dustmaps.bayestar import BayestarWebQuery
-from svo_filters import svo
 
 from . import utilities as u
 from . import spectrum as sp
+from . import dustmap
+from . import fitting
 from . import isochrone as iso
+from . import metrics
 from . import relations as rel
+from . import transport
 from . import modelgrid as mg
 
 
-Vizier.columns = ["**", "+_r"]
-Simbad.add_votable_fields('parallax', 'sptype', 'diameter', 'ids')
-SptRadius = rel.SpectralTypeRadius()
+def _setup_simbad(simbad):
+    """Add the fields sedkit uses to Simbad queries"""
+    simbad.add_votable_fields('parallax', 'sptype', 'diameter', 'ids')
+    return simbad
+
+
+def _setup_vizier(vizier):
+    """Return all columns and the distance in Vizier queries"""
+    vizier.columns = ["**", "+_r"]
+    return vizier
+
+
+# Catalog queries, filters and plotting are imported on first use
+Vizier = u.LazyImport('astroquery.vizier', 'Vizier', setup=_setup_vizier)
+Simbad = u.LazyImport('astroquery.simbad', 'Simbad', setup=_setup_simbad)
+svo = u.LazyImport('svo_filters.svo')
+export_png = u.LazyImport('bokeh.io', 'export_png')
+figure = u.LazyImport('bokeh.plotting', 'figure')
+show = u.show
+HoverTool = u.LazyImport('bokeh.models', 'HoverTool')
+Range1d = u.LazyImport('bokeh.models', 'Range1d')
+ColumnDataSource = u.LazyImport('bokeh.models', 'ColumnDataSource')
+
+# The services queried through the sedkit.transport
+transport.register('simbad', Simbad)
+transport.register('vizier', Vizier)
 
 
 class SED:
@@ -52,8 +74,10 @@ class SED:
         The string spectral type
     Teff: astropy.units.quantity.Quantity
         The effective temperature calculated from the SED
-    Teff_bb: astropy.units.quantity.Quantity
-        The effective temperature calculated from the blackbody fit
+    Teff_bb: int
+        The effective temperature calculated from the blackbody fit [K]
+    Teff_bb_unc: int
+        The uncertainty of Teff_bb [K]
     abs_SED: sequence
         The [W, F, E] of the calculate absolute SED
     abs_phot_SED: sequence
@@ -72,8 +96,8 @@ class SED:
         The [W, F, E] of the calculate apparent spectroscopic SED
     bb_source: str
         The [W, F, E] fit to calculate Teff_bb
-    blackbody: astropy.modeling.core.blackbody
-        The best fit blackbody function
+    blackbody: sedkit.spectrum.Spectrum
+        The best fit blackbody spectrum
     distance: astropy.units.quantity.Quantity
         The target distance
     fbol: astropy.units.quantity.Quantity
@@ -84,6 +108,9 @@ class SED:
         The surface gravity suffix
     mbol: float
         The apparent bolometric magnitude
+    metrics: sedkit.metrics.Metrics
+        The wall time, calls and array sizes of each pipeline stage,
+        recorded when sedkit.metrics is enabled
     name: str
         The name of the target
     parallaxes: astropy.table.QTable
@@ -127,6 +154,9 @@ class SED:
         # Print stuff
         self.verbose = verbose
 
+        # The time spent in each stage of the pipeline
+        self.metrics = metrics.Metrics()
+
         # Attributes with setters
         self._name = None
         self._ra = None
@@ -169,6 +199,11 @@ class SED:
         self.abs_spec_SED = None
         self.app_phot_SED = None
         self.abs_phot_SED = None
+        self.wein = None
+        self.rj = None
+        self._data_SED = None
+        self._app_SED = None
+        self._abs_SED = None
         self.best_fit = {}
 
         # Make empty spectra table
@@ -199,14 +234,15 @@ class SED:
             setattr(self, k, v)
         self.name = name
 
-        # Make a plot
-        self.fig = figure()
+        # The plot, which is made by the plot method
+        self.fig = None
 
         # Empty result attributes
         self.fbol = None
         self.mbol = None
         self.Teff = None
         self.Teff_bb = None
+        self.Teff_bb_unc = None
         self.Teff_evo = None
         self.Lbol = None
         self.Mbol = None
@@ -224,6 +260,16 @@ class SED:
         if method_list is not None:
             self.run_methods(method_list)
 
+    def __getstate__(self):
+        """
+        Pickle the SED without the bokeh figure, which cannot be unpickled
+        and is made again by the plot method
+        """
+        state = self.__dict__.copy()
+        state['fig'] = None
+
+        return state
+
     def run_methods(self, method_list):
         """
         Run the methods listed in order
@@ -469,18 +515,48 @@ class SED:
         # Set SED as uncalculated
         self.calculated = False
 
+    @property
+    def abs_SED(self):
+        """
+        The absolute SED, which is flux calibrated when it is needed
+        """
+        if '_abs_SED' not in self.__dict__:
+            return self.__dict__.get('abs_SED')
+
+        if self._abs_SED is None and self.distance is not None and self.app_SED is not None:
+            self._abs_SED = self.app_SED.flux_calibrate(self.distance)
+
+        return self._abs_SED
+
+    @property
+    def app_SED(self):
+        """
+        The apparent SED, with the blackbody tails sampled when it is needed
+        """
+        # SEDs pickled before the tails were analytic have no stitched data
+        if '_data_SED' not in self.__dict__:
+            return self.__dict__.get('app_SED')
+
+        if self._app_SED is None and self._data_SED is not None:
+            tails = [tail.spectrum for tail in [self.wein, self.rj] if isinstance(tail, sp.PlanckTail)]
+            self._app_SED = np.sum([self._data_SED] + tails)
+
+        return self._app_SED
+
+    @metrics.timed('calculate_sed', size=lambda sed: len(sed._data_SED.wave))
     def _calculate_sed(self):
         """
-        Stitch the components together and flux calibrate if possible
+        Stitch the data together and calculate the fundamental parameters,
+        integrating the blackbody tails analytically
         """
-        # Construct full app_SED
-        components = [self.wein, self.app_specphot_SED, self.rj]
+        # Stitch the data, with ~0 flux at ~0 wavelength if there is no Wein tail
+        components = [self.app_specphot_SED] + ([] if isinstance(self.wein, sp.PlanckTail) else [self.wein])
         components = list(filter(None, components))
-        self.app_SED = np.sum(components + self.stitched_spectra)
+        self._data_SED = np.sum(components + self.stitched_spectra)
 
-        # Flux calibrate SEDs
-        if self.distance is not None:
-            self.abs_SED = self.app_SED.flux_calibrate(self.distance)
+        # The full SEDs are sampled when they are needed
+        self._app_SED = None
+        self._abs_SED = None
 
         # Calculate Fundamental Params
         self.fundamental_params()
@@ -556,6 +632,7 @@ class SED:
 
         return self.synthetic_photometry
 
+    @metrics.timed('calibrate_photometry', size=lambda sed, name='photometry': len(getattr(sed, '_' + name)))
     def _calibrate_photometry(self, name='photometry'):
         """
         Calculate the absolute magnitudes and flux values of all rows in the photometry table
@@ -617,6 +694,7 @@ class SED:
         # Set SED as uncalculated
         self.calculated = False
 
+    @metrics.timed('calibrate_spectra', size=lambda sed: sum(len(spec.wave) for spec in sed.spectra['spectrum']))
     def _calibrate_spectra(self):
         """
         Create composite spectra and flux calibrate
@@ -885,7 +963,7 @@ class SED:
         # Set as uncalculated
         self.calculated = False
 
-    def export(self, parentdir='.', dirname=None, zipped=False):
+    def export(self, parentdir='.', dirname=None, zipped=False, plot=True):
         """
         Exports the photometry and results tables and a file of the
         composite spectra
@@ -898,6 +976,8 @@ class SED:
             The name of the exported directory or zip file, default is SED name
         zipped: bool
             Zip the directory
+        plot: bool
+            Render the SED plot as a PNG, unless running headless
         """
         # Check the parent directory
         if not os.path.exists(parentdir):
@@ -907,46 +987,67 @@ class SED:
         name = self.name.replace(' ', '_')
         dirname = dirname or name
         dirpath = os.path.join(parentdir, dirname)
-        if not os.path.exists(dirpath):
-            os.system('mkdir {}'.format(dirpath))
-        else:
+        if os.path.exists(dirpath):
             raise IOError('Directory already exists:', dirpath)
 
-        # Apparent spectral SED
-        if self.app_spec_SED is not None:
-            specpath = os.path.join(dirpath, '{}_apparent_SED.txt'.format(name))
-            header = '{} apparent spectrum (erg/s/cm2/A) as a function of wavelength (um)'.format(name)
-            self.app_spec_SED.export(specpath, header=header)
-
-        # Absolute spectral SED
-        if self.abs_spec_SED is not None:
-            specpath = os.path.join(dirpath, '{}_absolute_SED.txt'.format(name))
-            header = '{} absolute spectrum (erg/s/cm2/A) as a function of wavelength (um)'.format(name)
-            self.abs_spec_SED.export(specpath, header=header)
-
-        # All photometry
-        if self.photometry is not None:
-            photpath = os.path.join(dirpath, '{}_photometry.txt'.format(name))
-            self.photometry.write(photpath, format='ipac')
-
-        # All synthetic photometry
-        if self.synthetic_photometry is not None:
-            synpath = os.path.join(dirpath, '{}_synthetic_photometry.txt'.format(name))
-            self.synthetic_photometry.write(synpath, format='ipac')
-
-        # All results
-        resultspath = os.path.join(dirpath, '{}_results.txt'.format(name))
-        self.results.write(resultspath, format='ipac')
-
-        # The SED plot
-        if self.fig is not None:
-            pltopath = os.path.join(dirpath, '{}_plot.png'.format(name))
-            export_png(self.fig, filename=pltopath)
-
-        # zip if desired
+        # Get the files
+        files = self.export_files(plot=plot)
+
+        # Write a zip file...
         if zipped:
-            shutil.make_archive(dirpath, 'zip', dirpath)
-            os.system('rm -R {}'.format(dirpath))
+            with zipfile.ZipFile(dirpath + '.zip', 'w', zipfile.ZIP_DEFLATED) as archive:
+                for filename, data in files.items():
+                    archive.writestr(filename, data)
+
+        # ...or a directory
+        else:
+            os.makedirs(dirpath)
+            for filename, data in files.items():
+                with open(os.path.join(dirpath, filename), 'wb') as f:
+                    f.write(data)
+
+    def export_files(self, plot=False):
+        """
+        Generate the contents of the exported files in memory
+
+        Parameters
+        ----------
+        plot: bool
+            Render the SED plot as a PNG, unless running headless
+
+        Returns
+        -------
+        collections.OrderedDict
+            The contents of each file
+        """
+        name = self.name.replace(' ', '_')
+        files = OrderedDict()
+
+        # Apparent and absolute spectral SEDs
+        for kind, spec in [('apparent', self.app_spec_SED), ('absolute', self.abs_spec_SED)]:
+            if spec is not None:
+                header = '{} {} spectrum (erg/s/cm2/A) as a function of wavelength (um)'.format(name, kind)
+                buf = io.BytesIO()
+                spec.export(buf, header=header)
+                files['{}_{}_SED.txt'.format(name, kind)] = buf.getvalue()
+
+        # All photometry, synthetic photometry and results
+        for kind, table in [('photometry', self.photometry), ('synthetic_photometry', self._synthetic_photometry), ('results', self.results)]:
+            if table is not None:
+                buf = io.StringIO()
+                table.write(buf, format='ipac')
+                files['{}_{}.txt'.format(name, kind)] = buf.getvalue().encode('utf-8')
+
+        # The SED plot, which is left to be made from the data when headless
+        if plot and not u.headless():
+            fig = self.fig if self.fig is not None and self.fig.renderers else self.plot(output=True)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                pltpath = os.path.join(tmpdir, '{}_plot.png'.format(name))
+                export_png(fig, filename=pltpath)
+                with open(pltpath, 'rb') as f:
+                    files['{}_plot.png'.format(name)] = f.read()
+
+        return files
 
     def find_2MASS(self, **kwargs):
         """
@@ -980,15 +1081,15 @@ class SED:
 
         # If search_radius is explicitly set, use that
         if search_radius is not None:
-            viz_cat = Vizier.query_region(self.sky_coords, radius=search_radius, catalog=[catalog])
+            viz_cat = transport.request('vizier', 'query_region', self.sky_coords, radius=search_radius, catalog=[catalog])
 
         # ...or get photometry using designation...
         elif len(des) > 0:
-            viz_cat = Vizier.query_object(des[0], catalog=[catalog])
+            viz_cat = transport.request('vizier', 'query_object', des[0], catalog=[catalog])
 
         # ...or from the coordinates
         else:
-            viz_cat = Vizier.query_region(self.sky_coords, radius=self.search_radius, catalog=[catalog])
+            viz_cat = transport.request('vizier', 'query_region', self.sky_coords, radius=self.search_radius, catalog=[catalog])
 
         # Print info
         if self.verbose:
@@ -1042,15 +1143,15 @@ class SED:
 
         # If search_radius is explicitly set, use that
         if search_radius is not None and isinstance(self.sky_coords, SkyCoord):
-            viz_cat = Vizier.query_region(self.sky_coords, radius=search_radius, catalog=[catalog])
+            viz_cat = transport.request('vizier', 'query_region', self.sky_coords, radius=search_radius, catalog=[catalog])
 
         # ...or get photometry using designation...
         elif len(des) > 0:
-            viz_cat = Vizier.query_object(des[0], catalog=[catalog])
+            viz_cat = transport.request('vizier', 'query_object', des[0], catalog=[catalog])
 
         # ...or from the coordinates...
         elif isinstance(self.sky_coords, SkyCoord):
-            viz_cat = Vizier.query_region(self.sky_coords, radius=self.search_radius, catalog=[catalog])
+            viz_cat = transport.request('vizier', 'query_region', self.sky_coords, radius=self.search_radius, catalog=[catalog])
 
         # ...or abort
         else:
@@ -1108,12 +1209,12 @@ class SED:
 
             # Search Simbad by sky coords
             rad = search_radius or self.search_radius
-            viz_cat = Simbad.query_region(self.sky_coords, radius=rad)
+            viz_cat = transport.request('simbad', 'query_region', self.sky_coords, radius=rad)
             crit = self.sky_coords
 
         elif self.name is not None and self.name != 'My Target':
 
-            viz_cat = Simbad.query_object(self.name)
+            viz_cat = transport.request('simbad', 'query_object', self.name)
             crit = self.name
 
         else:
@@ -1176,7 +1277,7 @@ class SED:
                              ['WISE.W1', 'WISE.W2', 'WISE.W3', 'WISE.W4'],
                              **kwargs)
 
-    def fit_blackbody(self, fit_to='app_phot_SED', Teff_init=4000, epsilon=0.0001, acc=0.05, trim=[], norm_to=[]):
+    def fit_blackbody(self, fit_to='app_phot_SED', teff_grid=fitting.BLACKBODY_TEFFS, trim=[], norm_to=[]):
         """
         Fit a blackbody curve to the data
 
@@ -1184,12 +1285,13 @@ class SED:
         ----------
         fit_to: str
             The attribute name of the [W, F, E] to fit
-        initial: int
-            The initial guess
-        epsilon: float
-            The step size
-        acc: float
-            The acceptible error
+        teff_grid: array-like
+            The temperatures [K] to search
+        trim: sequence
+            The (lower, upper) wavelength bounds to exclude from the fit
+        norm_to: sequence
+            The bands to normalize the plotted blackbody to, otherwise the
+            fitted scale factor is used
         """
         if not self.calculated:
             self.make_sed()
@@ -1207,39 +1309,52 @@ class SED:
                 except TypeError:
                     print('Please provide a list of (lower, upper) bounds to exclude from the fit, e.g. [(0, 0.8)]')
 
-        # Initial guess
-        if self.Teff is not None:
-            teff = self.Teff[0].value
-        else:
-            teff = Teff_init
-        init = u.blackbody(temperature=teff)
-
         # Fit the blackbody
-        fit = fitting.LevMarLSQFitter()
-        norm = np.nanmax(data[1])
-        weight = norm / data[2]
-        if acc is None:
-            acc = np.nanmax(weight)
-        bb_fit = fit(init, data[0], data[1] / norm, weights=weight,
-                     epsilon=epsilon, acc=acc, maxiter=500)
+        wave = data[0] * self.wave_units.to(q.um)
+        unc = data[2] if len(data) > 2 else None
+        teff, teff_unc, scale, _ = fitting.fit_blackbody(wave, data[1], unc, teff_grid=teff_grid)
 
-        # Store the results
-        try:
-            self.Teff_bb = int(bb_fit.temperature.value)
-            self.bb_source = fit_to
-            self.bb_norm_to = norm_to
+        self.set_blackbody(teff, teff_unc, scale, fit_to=fit_to, norm_to=norm_to)
 
-            # Make the blackbody spectrum
-            wav = np.linspace(0.2, 22., 400) * self.wave_units
-            bb = sp.Blackbody(wav, self.Teff_bb * q.K, radius=self.radius, distance=self.distance)
-            bb = bb.norm_to_mags(self.photometry[-3:], include=norm_to)
-            self.blackbody = bb
+    def set_blackbody(self, teff, teff_unc, scale, fit_to='app_phot_SED', norm_to=[]):
+        """
+        Store a blackbody fit and make the blackbody spectrum to plot
 
-            if self.verbose:
-                print('\nBlackbody fit: {} K'.format(self.Teff_bb))
-        except IOError:
+        Parameters
+        ----------
+        teff: float
+            The temperature [K]
+        teff_unc: float
+            The uncertainty of the temperature [K]
+        scale: float
+            The scale factor of pi * B_lambda(T) in the flux units
+        fit_to: str
+            The attribute name of the [W, F, E] which was fit
+        norm_to: sequence
+            The bands to normalize the blackbody spectrum to, otherwise the
+            fitted scale factor is used
+        """
+        if not np.isfinite(teff):
             if self.verbose:
                 print('\nNo blackbody fit.')
+            return
+
+        # Store the results
+        self.Teff_bb = int(round(teff))
+        self.Teff_bb_unc = int(round(teff_unc)) if np.isfinite(teff_unc) else None
+        self.bb_source = fit_to
+        self.bb_norm_to = norm_to
+
+        # Make the blackbody spectrum from the fit
+        wav = np.linspace(0.2, 22., 400)
+        flx = scale * u.planck(wav * self.wave_units.to(q.um), teff)
+        bb = sp.Spectrum(wav * self.wave_units, flx * self.flux_units, name='{} Blackbody'.format(self.Teff_bb))
+        if norm_to:
+            bb = bb.norm_to_mags(self.photometry, include=norm_to)
+        self.blackbody = bb
+
+        if self.verbose:
+            print('\nBlackbody fit: {} +/- {} K'.format(self.Teff_bb, self.Teff_bb_unc))
 
     def fit_modelgrid(self, modelgrid, name=None):
         """
@@ -1458,6 +1573,67 @@ class SED:
                 else:
                     self.add_spectrum(spectrum + [unc * flux_unit], name=name)
 
+    @classmethod
+    def from_state(cls, state):
+        """
+        Rebuild an SED from its saved state without any catalog queries
+
+        Parameters
+        ----------
+        state: dict
+            The state from SED.get_state
+
+        Returns
+        -------
+        sedkit.sed.SED
+            The rebuilt SED
+        """
+        sed = cls(verbose=False)
+        sed._name = state['name']
+        sed.all_names = list(state['all_names'])
+        sed.refs = state['refs']
+        sed.wave_units = q.Unit(state['wave_units'])
+        sed.flux_units = q.Unit(state['flux_units'])
+
+        # Restore the attributes directly, since they were already derived
+        if state['ra'] is not None:
+            sed._sky_coords = SkyCoord(ra=state['ra'] * q.deg, dec=state['dec'] * q.deg, frame='icrs')
+            sed._ra, sed._dec = state['ra'], state['dec']
+        for attr, unit in [('age', q.Gyr), ('parallax', q.mas), ('radius', q.Rsun)]:
+            vals = state[attr]
+            setattr(sed, '_' + attr, None if vals is None else tuple(None if v is None else v * unit for v in vals))
+        if sed._parallax is not None:
+            sed._distance = u.pi2pc(*sed._parallax)
+        sed.isochrone_radius = state.get('isochrone_radius', False)
+        if state['spectral_type'] is not None:
+            sed._spectral_type = tuple(state['spectral_type'])
+            sed.luminosity_class = state['luminosity_class']
+            sed.gravity = state['gravity']
+            sed.prefix = state['prefix']
+        sed.SpT = state['SpT']
+        sed._membership = state['membership']
+        if state['evo_model'] != sed.evo_model.name:
+            sed.evo_model = state['evo_model']
+
+        # The saved photometry is already dereddened
+        phot = state['photometry']
+        for band, mag, unc, ref in zip(phot['band'], phot['app_magnitude'], phot['app_magnitude_unc'], phot['ref']):
+            sed.add_photometry(band, float(mag), float(unc), ref=ref)
+        sed.reddening = state['reddening']
+
+        # Add the spectra
+        for spec in state['spectra']:
+            wave, flux, unc = spec['data']
+            sed.add_spectrum([wave * sed.wave_units, flux * sed.flux_units, unc * sed.flux_units], name=spec['name'], ref=spec['ref'])
+
+        # Recalculate
+        if state['calculated']:
+            sed.make_sed()
+
+        sed.refs = state['refs']
+
+        return sed
+
     def fundamental_params(self, **kwargs):
         """
         Calculate the fundamental parameters of the current SED
@@ -1482,17 +1658,29 @@ class SED:
         # Calculate Teff (dependent on Lbol, distance, and radius)
         self.get_Teff()
 
+    @metrics.timed('get_fbol', size=lambda sed, *args, **kwargs: len(sed._data_SED.wave))
     def get_fbol(self, units=q.erg / q.s / q.cm**2):
         """
-        Calculate the bolometric flux of the SED
+        Calculate the bolometric flux of the SED from the integral of the
+        data and the analytic integrals of the blackbody tails
 
         Parameters
         ----------
         units: astropy.units.quantity.Quantity
             The target untis for fbol
         """
-        # Integrate the SED to get fbol
-        self.fbol = self.app_SED.integrate(units=units)
+        # Integrate the data
+        fbol, fbol_unc = self._data_SED.integrate(units=units)
+
+        # Add the tails
+        for tail in [self.wein, self.rj]:
+            if isinstance(tail, sp.PlanckTail):
+                val, unc = tail.integrate(units=units)
+                fbol = fbol + val
+                if fbol_unc is not None and unc is not None:
+                    fbol_unc = np.sqrt(fbol_unc**2 + unc**2)
+
+        self.fbol = fbol, fbol_unc
 
     def get_Lbol(self):
         """
@@ -1567,20 +1755,60 @@ class SED:
             # Update the attribute
             self.Mbol = Mbol, Mbol_unc
 
+    @metrics.timed('get_reddening')
     def get_reddening(self):
         """
-        Calculate the reddening from the Bayestar17 dust map
+        Calculate the reddening from the sedkit.dustmap, which is the
+        Bayestar17 dust map unless a local map is configured
         """
         # Check for distance and coordinates
         if self.distance is not None and self.sky_coords is not None:
-            gal_coords = SkyCoord(self.sky_coords.galactic, frame='galactic', distance=self.distance[0])
-            bayestar = BayestarWebQuery(version='bayestar2017')
-            red = bayestar(gal_coords, mode='random_sample')
+            red = dustmap.query(self.sky_coords, self.distance[0])
 
             # Set the attribute
-            if not np.isinf(red) and not np.isnan(red) and red >= 0:
+            if np.isfinite(red) and red >= 0:
                 self.reddening = red
 
+    def get_state(self):
+        """
+        Get the measured and derived inputs needed to rebuild the SED
+
+        Returns
+        -------
+        dict
+            The state as plain values and arrays
+        """
+        def values(vals, unit=None):
+            if vals is None:
+                return None
+            return [None if v is None else float(v.to(unit).value if hasattr(v, 'unit') else v) for v in vals]
+
+        phot = self.photometry
+        state = {'name': self.name, 'all_names': list(self.all_names),
+                 'ra': self._ra, 'dec': self._dec,
+                 'age': values(self.age, q.Gyr),
+                 'parallax': values(self.parallax, q.mas),
+                 'radius': values(self.radius, q.Rsun),
+                 'isochrone_radius': self.isochrone_radius,
+                 'spectral_type': values(self.spectral_type),
+                 'luminosity_class': getattr(self, 'luminosity_class', None),
+                 'gravity': getattr(self, 'gravity', None),
+                 'prefix': getattr(self, 'prefix', None),
+                 'SpT': self.SpT, 'membership': self.membership,
+                 'reddening': float(self.reddening),
+                 'evo_model': self.evo_model.name,
+                 'refs': self.refs, 'calculated': self.calculated,
+                 'wave_units': self.wave_units.to_string(),
+                 'flux_units': self.flux_units.to_string(),
+                 'photometry': {'band': [str(b) for b in phot['band']],
+                                'app_magnitude': np.array(phot['app_magnitude'], dtype=float),
+                                'app_magnitude_unc': np.array(phot['app_magnitude_unc'], dtype=float),
+                                'ref': [None if r is None else str(r) for r in phot['ref']]},
+                 'spectra': [{'name': row['name'], 'ref': None if row['ref'] is None else str(row['ref']),
+                              'data': np.asarray(row['spectrum'].data, dtype=float)} for row in self.spectra]}
+
+        return state
+
     def get_Teff(self):
         """
         Calculate the effective temperature
@@ -1623,6 +1851,7 @@ class SED:
                 val = getattr(self, attr)
                 print('{0: <25}= {1}{2}'.format(attr, '\n' if isinstance(val, at.QTable) else '', val))
 
+    @metrics.timed('logg_from_age')
     def logg_from_age(self, plot=False):
         """
         Estimate the surface gravity from model isochrones given an age and Lbol
@@ -1649,35 +1878,85 @@ class SED:
             if self.verbose:
                 print('Lbol={0.Lbol} and age={0.age}. Both are needed to calculate the surface gravity.'.format(self))
 
-    def make_rj_tail(self, teff=3000 * q.K):
+    def _tail_norm(self, teff, wave_min, wave_max, to_spec=False):
         """
-        Generate a Rayleigh Jeans tail for the SED
+        Get the factor which normalizes a blackbody to the data between
+        the given wavelengths, evaluating the Planck function only at the
+        photometric effective wavelengths or the spectrum wavelengths
 
         Parameters
         ----------
         teff: astropy.units.quantity.Quantity
             The effective temperature of the source
+        wave_min: astropy.units.quantity.Quantity
+            The shortest wavelength of the data to normalize to
+        wave_max: astropy.units.quantity.Quantity
+            The longest wavelength of the data to normalize to
+        to_spec: bool
+            Normalize to the spectra rather than the photometry
+
+        Returns
+        -------
+        float
+            The normalization factor in the SED units
         """
-        # Make the blackbody from 2 to 1000um
-        rj_wave = np.linspace(0.1, 1000, 2000) * q.um
-        rj = sp.Blackbody(rj_wave, (teff, 100 * q.K), name='RJ Tail')
+        teff = teff.to(q.K).value
+        wave_min, wave_max = wave_min.to(q.um).value, wave_max.to(q.um).value
+        factor = (q.erg / q.s / q.cm**2 / q.AA).to(self.flux_units)
+
+        # Minimize the residuals with the spectrum in range
+        if to_spec:
+            spec = self.app_spec_SED
+            wave = spec.wave * spec.wave_units.to(q.um)
+            idx = (wave >= wave_min) & (wave <= wave_max)
+
+            # Leave the blackbody as is without data in range
+            if not np.any(idx):
+                return 1.
+
+            flux = spec.flux[idx] * spec.flux_units.to(self.flux_units)
+
+            return float(u.minimize_norm(flux, u.planck(wave[idx], teff) * factor))
 
-        # Convert to native units
-        rj.wave_units = self.wave_units
-        rj.flux_units = self.flux_units
+        # Weight the photometry in range by the bandpass widths
+        rows = [row for row in self.photometry if wave_min <= row['bandpass'].wave_min.to(q.um).value and row['bandpass'].wave_max.to(q.um).value <= wave_max]
+        if len(rows) == 0:
+            return 1.
 
-        # Normalize to longest wavelength data
-        if self.max_spec > self.max_phot:
-            rj = rj.norm_to_spec(self.app_spec_SED)
+        eff = np.array([row['eff'].to(q.um).value for row in rows])
+        flux = np.array([row['app_flux'].to(self.flux_units).value for row in rows])
+        unc = np.array([row['app_flux_unc'].to(self.flux_units).value for row in rows])
+        weights = np.array([row['bandpass'].fwhm.value for row in rows])
+
+        # Weight by the photometric uncertainties if they are all known
+        bb = u.planck(eff, teff) * factor
+        if np.all(unc > 0):
+            gstat, norm = u.goodness(flux, bb, unc, np.zeros_like(bb), weights)
         else:
-            rj = rj.norm_to_mags(self.photometry)
+            gstat, norm = u.goodness(flux, bb, weights=weights)
+
+        return float(norm)
+
+    @metrics.timed('make_rj_tail')
+    def make_rj_tail(self, teff=3000 * q.K):
+        """
+        Generate a Rayleigh Jeans tail for the SED, which is integrated
+        analytically from the longest wavelength data to infinity
 
-        # Trim so there is no data overlap
-        max_wave = np.nanmax([self.max_spec.value, self.max_phot.value])
-        rj.trim([(0 * q.um, max_wave * self.wave_units)])
+        Parameters
+        ----------
+        teff: astropy.units.quantity.Quantity
+            The effective temperature of the source
+        """
+        # Normalize a blackbody to the longest wavelength data
+        norm = self._tail_norm(teff, 0.1 * q.um, 1000 * q.um, to_spec=self.max_spec > self.max_phot)
 
-        self.rj = rj
+        # Start where the data ends
+        max_wave = np.nanmax([self.max_spec.value, self.max_phot.value]) * self.wave_units
+        self.rj = sp.PlanckTail((teff, 100 * q.K), norm, max_wave, np.inf * q.um, wave_units=self.wave_units,
+                                flux_units=self.flux_units, name='RJ Tail')
 
+    @metrics.timed('make_sed')
     def make_sed(self):
         """
         Construct the SED
@@ -1736,45 +2015,34 @@ class SED:
         # Set SED as calculated
         self.calculated = True
 
+    @metrics.timed('make_wein_tail')
     def make_wein_tail(self, teff=None, trim=None):
         """
-        Generate a Wein tail for the SED
+        Generate a Wein tail for the SED, which is integrated analytically
+        from zero to the shortest wavelength data if there is a temperature
 
         Parameters
         ----------
         teff: astropy.units.quantity.Quantity (optional)
             The effective temperature of the source
         """
-        if teff is not None:
-
-            # Make the blackbody from ~0 to 1um
-            wein_wave = np.linspace(0.0001, 1.1, 500) * q.um
-            wein = sp.Blackbody(wein_wave, (teff, 100 * q.K), name='Wein Tail')
-
-            # Convert to native units
-            wein.wave_units = self.wave_units
-            wein.flux_units = self.flux_units
-
-            # Normalize to shortest wavelength data
-            if self.min_spec < self.min_phot:
-                wein = wein.norm_to_spec(self.app_spec_SED, exclude=[(1.1 * q.um, 1E30 * q.um)])
-            else:
-                wein = wein.norm_to_mags(self.photometry)
-
-        else:
-
-            # Otherwise just use ~0 flux at ~0 wavelength
-            wein = sp.Spectrum(np.array([0.0001]) * self.wave_units,
-                               np.array([1E-30]) * self.flux_units,
-                               np.array([1E-30]) * self.flux_units,
-                               name='Wein Tail')
+        # Just use ~0 flux at ~0 wavelength without a temperature
+        if teff is None:
+            self.wein = sp.Spectrum(np.array([0.0001]) * q.um.to(self.wave_units) * self.wave_units,
+                                    np.array([1E-30]) * self.flux_units,
+                                    np.array([1E-30]) * self.flux_units,
+                                    name='Wein Tail')
+            return
 
-        # Trim so there is no data overlap
-        min_wave = np.nanmin([self.min_spec.value, self.min_phot.value])
-        wein.trim([(min_wave * self.wave_units, 1E30 * q.um)])
+        # Normalize a blackbody to the shortest wavelength data below 1.1um
+        norm = self._tail_norm(teff, 0.0001 * q.um, 1.1 * q.um, to_spec=self.min_spec < self.min_phot)
 
-        self.wein = wein
+        # End where the data starts
+        min_wave = np.nanmin([self.min_spec.value, self.min_phot.value]) * self.wave_units
+        self.wein = sp.PlanckTail((teff, 100 * q.K), norm, 0 * q.um, min_wave, wave_units=self.wave_units,
+                                  flux_units=self.flux_units, name='Wein Tail')
 
+    @metrics.timed('mass_from_age')
     def mass_from_age(self, mass_units=q.Msun, plot=False):
         """
         Estimate the mass from model isochrones given an age and Lbol
@@ -2195,11 +2463,12 @@ class SED:
         """
         spt = spt or self.spectral_type[0]
         try:
-            self.radius = SptRadius.get_radius(spt)
+            self.radius = rel.spectral_type_radius().get_radius(spt)
 
         except:
             print("Could not estimate radius from spectral type {}".format(spt))
 
+    @metrics.timed('radius_from_age')
     def radius_from_age(self, radius_units=q.Rsun, plot=False):
         """
         Estimate the radius from model isochrones given an age and Lbol
@@ -2452,6 +2721,7 @@ class SED:
 
         return self._synthetic_photometry
 
+    @metrics.timed('teff_from_age')
     def teff_from_age(self, teff_units=q.K, plot=False):
         """
         Estimate the radius from model isochrones given an age and Lbol
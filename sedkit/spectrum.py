@@ -14,16 +14,23 @@ import astropy.constants as ac
 import astropy.units as q
 import astropy.io.votable as vo
 from astropy.io import fits
-from bokeh.plotting import figure, show
-from bokeh.models import ColumnDataSource, HoverTool
 from functools import partial
-from multiprocessing import Pool
 import numpy as np
-from pandas import DataFrame
 
+from . import parallel
 from . import utilities as u
 
 
+# Plotting packages are imported on first use
+figure = u.LazyImport('bokeh.plotting', 'figure')
+show = u.show
+ColumnDataSource = u.LazyImport('bokeh.models', 'ColumnDataSource')
+HoverTool = u.LazyImport('bokeh.models', 'HoverTool')
+
+# pandas is imported on first use
+DataFrame = u.LazyImport('pandas', 'DataFrame')
+
+
 def copy_raw(func):
     """A wrapper to copy the raw data to the new Spectrum object"""
     @wraps(func)
@@ -260,11 +267,8 @@ class Spectrum:
         rows = [row for n, row in modelgrid.index.iterrows()]
 
         # Iterate over entire model grid
-        pool = Pool(8)
         func = partial(fit_model, fitspec=spectrum)
-        fit_rows = pool.map(func, rows)
-        pool.close()
-        pool.join()
+        fit_rows = parallel.get_executor().map(func, rows)
 
         # Turn the results into a DataFrame and sort
         models = DataFrame(fit_rows)
@@ -319,16 +323,16 @@ class Spectrum:
 
         Parameters
         ----------
-        filepath: str
-            The path for the exported file
+        filepath: str, file
+            The path or open binary file for the exported file
         """
-        # Get target directory
-        dirname = os.path.dirname(filepath) or '.'
         name = self.name.replace(' ', '_')
 
         # Check the parent directory
-        if not os.path.exists(dirname):
-            raise IOError('{}: No such directory'.format(dirname))
+        if isinstance(filepath, str):
+            dirname = os.path.dirname(filepath) or '.'
+            if not os.path.exists(dirname):
+                raise IOError('{}: No such directory'.format(dirname))
 
         # Write the file with a header
         head = '{}\nWavelength [{}], Flux Density [{}]'.format(name, self.wave_units, self.flux_units)
@@ -1116,6 +1120,302 @@ class Blackbody(Spectrum):
         return I, I_unc
 
 
+class BlackbodyGrid:
+    """Blackbodies of many temperatures at the same wavelengths, evaluated
+    as one (n_temperatures x n_wave) float64 array"""
+    def __init__(self, wavelength, teff, radius=None, distance=None,
+                 flux_units=q.erg / q.s / q.cm**2 / q.AA, name=None):
+        """Initialize the BlackbodyGrid object
+
+        Parameters
+        ----------
+        wavelength: astropy.units.quantity.Quantity
+            The wavelengths at which to evaluate the Planck function
+        teff: astropy.unit.quantity.Quantity, sequence
+            The temperatures and (optional) uncertainties
+        radius: astropy.unit.quantity.Quantity, sequence
+            The radius and (optional) uncertainty, or one for each
+            temperature
+        distance: astropy.unit.quantity.Quantity, sequence
+            The distance and (optional) uncertainty, or one for each
+            temperature
+        flux_units: astropy.units.quantity.Quantity
+            The flux density units
+        name: str
+            A name for the grid
+        """
+        # Check the units
+        if not u.equivalent(wavelength, q.um):
+            raise TypeError("Wavelength must be in astropy units of length, e.g. 'um'")
+        if not u.equivalent(flux_units, q.erg / q.s / q.cm**2 / q.AA):
+            raise TypeError("flux_units must be in flux density units, e.g. 'erg/s/cm2/A'")
+        teff, teff_unc = _value_unc(teff, q.K, 'teff')
+        radius, radius_unc = _value_unc(radius, q.cm, 'radius')
+        distance, distance_unc = _value_unc(distance, q.cm, 'distance')
+
+        self.name = name or 'Blackbody Grid'
+        self.teff = np.atleast_1d(teff) * q.K
+        self.teff_unc = None if teff_unc is None else np.broadcast_to(teff_unc, self.teff.shape) * q.K
+        self._wave_units = wavelength.unit
+        self._flux_units = flux_units
+
+        # Sort the wavelengths, which all the temperatures share
+        self.wave = np.sort(np.asarray(wavelength.value, dtype=np.float64).ravel())
+
+        # Evaluate in um, K and erg/s/cm2/A then convert once
+        factor = (q.erg / q.s / q.cm**2 / q.AA).to(flux_units)
+        flux, dflux = u.planck(self.wave * self.wave_units.to(q.um), self.teff.value[:, None], derivative=True)
+
+        # Scale to the flux at the distance
+        if radius is not None and distance is not None:
+            factor = factor * (np.reshape(radius, (-1, 1)) / np.reshape(distance, (-1, 1)))**2
+
+        self.flux = flux * factor
+
+        # Add the uncertainties from each parameter in quadrature
+        terms = []
+        if teff_unc is not None:
+            terms.append(np.reshape(teff_unc, (-1, 1)) * dflux * factor)
+        if radius is not None and distance is not None:
+            if radius_unc is not None:
+                terms.append(2 * self.flux * np.reshape(radius_unc / radius, (-1, 1)))
+            if distance_unc is not None:
+                terms.append(2 * self.flux * np.reshape(distance_unc / distance, (-1, 1)))
+        self.unc = np.sqrt(np.sum(np.broadcast_arrays(*[term**2 for term in terms]), axis=0)) if terms else None
+
+    def __getitem__(self, idx):
+        """Get the spectrum of one temperature, which shares the memory of
+        the grid rather than copying it
+
+        Parameters
+        ----------
+        idx: int
+            The index of the temperature
+
+        Returns
+        -------
+        sedkit.spectrum.Spectrum
+            The spectrum
+        """
+        if not isinstance(idx, (int, np.integer)):
+            raise TypeError("{}: Please use an integer index".format(type(idx)))
+
+        # Set the attributes of Spectrum.__init__ without scrubbing the arrays
+        spec = Spectrum.__new__(Spectrum)
+        spec.verbose = False
+        spec.name = '{} Blackbody'.format(self.teff[idx])
+        spec.ref = None
+        spec.history = {}
+        spec.raw = None
+        spec._wave_units = self.wave_units
+        spec._flux_units = self.flux_units
+        spec.wave = self.wave
+        spec.flux = self.flux[idx]
+        spec.unc = None if self.unc is None else self.unc[idx]
+        spec.components = None
+        spec.best_fit = {}
+        spec._set_units()
+
+        return spec
+
+    def __iter__(self):
+        """Iterate over the spectra of all the temperatures"""
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __len__(self):
+        """The number of temperatures"""
+        return len(self.teff)
+
+    @property
+    def flux_units(self):
+        """The flux density units"""
+        return self._flux_units
+
+    def integrate(self, units=q.erg / q.s / q.cm**2):
+        """Calculate the area under the spectrum of each temperature
+
+        Parameters
+        ----------
+        units: astropy.units.quantity.Quantity
+            The target units for the integrals
+
+        Returns
+        -------
+        sequence
+            The integrated fluxes and uncertainties
+        """
+        # Make sure the target units are flux units
+        if not u.equivalent(units, q.erg / q.s / q.cm**2):
+            raise TypeError("units must be in flux units, e.g. 'erg/s/cm2'")
+
+        m = (self.flux_units * self.wave_units).to(units) * units
+        val = np.trapz(self.flux, x=self.wave, axis=1) * m
+
+        if self.unc is None:
+            unc = None
+        else:
+            unc = np.sqrt(np.nansum((self.unc * np.gradient(self.wave))**2, axis=1)) * m
+
+        return val, unc
+
+    def synthetic_flux(self, bandpass, force=False):
+        """
+        Calculate the flux of each temperature in a bandpass
+
+        Parameters
+        ----------
+        bandpass: svo_filters.svo.Filter
+            The bandpass to use
+        force: bool
+            Force the calculation even if overlap is only partial
+
+        Returns
+        -------
+        sequence
+            The fluxes and uncertainties
+        """
+        # Test overlap
+        overlap = bandpass.overlap([self.wave * self.wave_units])
+        if not (overlap == 'full' or (overlap == 'partial' and force)):
+            return None, None
+
+        # Get the interpolation weights at the filter wavelengths once
+        wave = self.wave * self.wave_units.to(bandpass.wave_units)
+        wav = bandpass.wave[0].value
+        rsr = bandpass.throughput[0]
+        jdx = np.clip(np.searchsorted(wave, wav), 1, len(wave) - 1)
+        frac = (wav - wave[jdx - 1]) / (wave[jdx] - wave[jdx - 1])
+        inside = (wav >= wave[0]) & (wav <= wave[-1])
+
+        def interp(arr):
+            return np.where(inside, arr[:, jdx - 1] * (1 - frac) + arr[:, jdx] * frac, 0)
+
+        # Calculate the fluxes
+        flx = np.trapz(interp(self.flux) * rsr, x=wav, axis=1) / np.trapz(rsr, x=wav) * self.flux_units
+
+        # Calculate the uncertainties
+        if self.unc is None:
+            unc = None
+        else:
+            unc = np.sqrt(np.sum((interp(self.unc) * rsr * np.gradient(wav))**2, axis=1)) * self.flux_units
+
+        return flx, unc
+
+    def synthetic_magnitude(self, bandpass, force=False):
+        """
+        Calculate the magnitude of each temperature in a bandpass
+
+        Parameters
+        ----------
+        bandpass: svo_filters.svo.Filter
+            The bandpass to use
+        force: bool
+            Force the calculation even if overlap is only partial
+
+        Returns
+        -------
+        sequence
+            The magnitudes and uncertainties
+        """
+        flx, flx_unc = self.synthetic_flux(bandpass, force=force)
+
+        # Calculate the magnitudes
+        if flx is None:
+            return None, None
+
+        return u.flux2mag((flx, flx_unc), bandpass)
+
+    @property
+    def wave_units(self):
+        """The wavelength units"""
+        return self._wave_units
+
+
+class PlanckTail:
+    """A blackbody normalized to the edge of an SED, whose flux beyond the
+    data is integrated analytically and only sampled for plotting"""
+    def __init__(self, teff, norm, wave_min, wave_max, wave_units=q.um,
+                 flux_units=q.erg / q.s / q.cm**2 / q.AA, name=None, size=500):
+        """Initialize the PlanckTail object
+
+        Parameters
+        ----------
+        teff: astropy.unit.quantity.Quantity, sequence
+            The effective temperature and (optional) uncertainty
+        norm: float
+            The factor which normalizes the blackbody in flux_units
+        wave_min: astropy.unit.quantity.Quantity
+            The lower wavelength limit, which can be zero
+        wave_max: astropy.unit.quantity.Quantity
+            The upper wavelength limit, which can be infinite
+        wave_units: astropy.units.quantity.Quantity
+            The wavelength units of the sampled spectrum
+        flux_units: astropy.units.quantity.Quantity
+            The flux units of the sampled spectrum
+        name: str
+            A name for the tail
+        size: int
+            The number of points in the sampled spectrum
+        """
+        if not u.issequence(teff, length=2):
+            teff = teff, None
+        self.teff, self.teff_unc = teff
+        self.norm = norm
+        self.wave_min = wave_min
+        self.wave_max = wave_max
+        self.wave_units = wave_units
+        self.flux_units = flux_units
+        self.name = name
+        self.size = size
+        self._spectrum = None
+
+    def integrate(self, units=q.erg / q.s / q.cm**2):
+        """Calculate the area under the tail
+
+        Parameters
+        ----------
+        units: astropy.units.quantity.Quantity
+            The target units for the integral
+
+        Returns
+        -------
+        sequence
+            The integrated flux and uncertainty
+        """
+        # Make sure the target units are flux units
+        if not u.equivalent(units, q.erg / q.s / q.cm**2):
+            raise TypeError("units must be in flux units, e.g. 'erg/s/cm2'")
+
+        val = self.norm * u.planck_integral(self.wave_min, self.wave_max, self.teff, units=units)
+
+        # The uncertainty from the temperature uncertainty
+        if self.teff_unc is None:
+            unc = None
+        else:
+            hi, lo = [u.planck_integral(self.wave_min, self.wave_max, self.teff + sign * self.teff_unc, units=units) for sign in [1, -1]]
+            unc = self.norm * abs(hi - lo) / 2.
+
+        return val, unc
+
+    @property
+    def spectrum(self):
+        """The tail sampled between its limits, or up to 1000 um"""
+        if self._spectrum is None:
+
+            # Sample evenly in log wavelength
+            lo = max(self.wave_min.to(q.um).value, 1E-4)
+            hi = min(self.wave_max.to(q.um).value, 1000)
+            wave = (np.logspace(np.log10(lo), np.log10(hi), self.size) * q.um).to(self.wave_units)
+            bb = BlackbodyGrid(wave, (self.teff, self.teff_unc), flux_units=self.flux_units)
+
+            # Normalize
+            data = [bb.wave * self.wave_units] + [i[0] * self.norm * self.flux_units for i in [bb.flux, bb.unc] if i is not None]
+            self._spectrum = Spectrum(*data, name=self.name)
+
+        return self._spectrum
+
+
 class FileSpectrum(Spectrum):
     def __init__(self, file, wave_units=None, flux_units=None, ext=0,
                  survey=None, name=None, **kwargs):
@@ -1199,7 +1499,7 @@ class Vega(Spectrum):
         """
         # Get the data and apply units
         vega_file = resource_filename('sedkit', 'data/STScI_Vega.txt')
-        wave, flux = np.genfromtxt(vega_file, unpack=True)
+        wave, flux = u.read_array(vega_file, unpack=True)
         wave *= q.AA
         flux *= q.erg / q.s / q.cm**2 / q.AA
 
@@ -1238,3 +1538,36 @@ def fit_model(row, fitspec):
         row['gstat'] = np.nan
 
     return row
+
+
+def _value_unc(val, unit, name):
+    """Get the values and uncertainties of a Quantity or a (value,
+    uncertainty) sequence as floats in the given units
+
+    Parameters
+    ----------
+    val: astropy.units.quantity.Quantity, sequence
+        The value(s) or the value(s) and uncertainty
+    unit: astropy.units.quantity.Quantity
+        The target units
+    name: str
+        The name of the parameter
+
+    Returns
+    -------
+    sequence
+        The values and uncertainties, which are None if not given
+    """
+    if val is None:
+        return None, None
+
+    # A sequence is the value and uncertainty
+    unc = None
+    if not isinstance(val, q.Quantity):
+        val, unc = val[:2]
+
+    for v, label in [(val, name), (unc, name + '_unc')]:
+        if v is not None and not u.equivalent(v, unit):
+            raise TypeError("{} must be in astropy units equivalent to '{}'".format(label, unit))
+
+    return np.asarray(val.to(unit).value, dtype=float), None if unc is None else np.asarray(unc.to(unit).value, dtype=float)
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A module to filter tables with vectorized queries
+"""
+from collections import OrderedDict
+import re
+
+import numpy as np
+
+from . import utilities as u
+
+
+# pandas is imported on first use
+pd = u.LazyImport('pandas')
+
+# The comparison operators, longest first so prefixes match correctly
+OPERATORS = OrderedDict([('<=', np.less_equal), ('>=', np.greater_equal),
+                         ('==', np.equal), ('!=', np.not_equal),
+                         ('<', np.less), ('>', np.greater),
+                         ('=', np.equal)])
+
+
+class Query:
+    """A set of conditions parsed once into vectorized column masks
+
+    Each keyword is a column name and each value is a condition or a
+    sequence of conditions which must all be satisfied, e.g.
+
+        Query(Teff=('>1200', '<=1400'), name='2MASS*', spectral_type='<70|>=80')
+
+    Conditions can be a number for equality, a string with an operator
+    [<, <=, >, >=, ==, !=], or a string with '*' wildcards. Alternatives
+    within a string are separated by '|'.
+    """
+    def __init__(self, **conditions):
+        """Parse the conditions
+
+        Parameters
+        ----------
+        conditions: dict
+            The conditions for each column
+        """
+        self.conditions = OrderedDict((param, parse_condition(value)) for param, value in conditions.items())
+
+    def filter(self, table, indexes=None):
+        """Retrieve the rows of a table that satisfy the conditions
+
+        Parameters
+        ----------
+        table: astropy.table.Table, pandas.DataFrame
+            The table to filter
+        indexes: dict, callable
+            The sorted indexes of the columns, or a function of the column
+            name which returns one or None
+
+        Returns
+        -------
+        astropy.table.Table, pandas.DataFrame
+            The filtered table
+        """
+        mask = self.mask(table, indexes=indexes)
+
+        if isinstance(table, pd.DataFrame):
+            return table[mask].reset_index(drop=True)
+        else:
+            return table[mask]
+
+    def mask(self, table, indexes=None):
+        """Get the rows of a table that satisfy the conditions
+
+        Parameters
+        ----------
+        table: astropy.table.Table, pandas.DataFrame, sedkit.catalog.ResultsStore
+            The table to filter
+        indexes: dict, callable
+            The sorted indexes of the columns, or a function of the column
+            name which returns one or None
+
+        Returns
+        -------
+        np.ndarray
+            The boolean mask of the rows to keep
+        """
+        mask = np.ones(len(table), dtype=bool)
+        for param, condition in self.conditions.items():
+
+            # Get the column data and index
+            data = get_column(table, param)
+            index = indexes(param) if callable(indexes) else (indexes or {}).get(param)
+
+            # All condition groups must be satisfied...
+            for group in condition:
+
+                # ...by any of the alternatives in a group
+                keep = np.zeros(len(table), dtype=bool)
+                for op, value in group:
+                    keep |= evaluate(data, op, value, index=index)
+
+                mask &= keep
+
+        return mask
+
+
+class SortedIndex:
+    """A sorted index of a numeric column for fast range queries"""
+    def __init__(self, values):
+        """Sort the values
+
+        Parameters
+        ----------
+        values: sequence
+            The column values
+        """
+        values = np.asarray(values, dtype=float)
+        self.size = len(values)
+        self.order = np.argsort(values, kind='mergesort')
+        self.values = values[self.order]
+
+        # NaNs are sorted to the end and only match '!='
+        self.valid = int(np.sum(~np.isnan(self.values)))
+
+    def mask(self, op, value):
+        """Get the rows satisfying a comparison
+
+        Parameters
+        ----------
+        op: str
+            The operator
+        value: float
+            The value to compare to
+
+        Returns
+        -------
+        np.ndarray
+            The boolean mask of the rows
+        """
+        values = self.values[:self.valid]
+        left = np.searchsorted(values, value, side='left')
+        right = np.searchsorted(values, value, side='right')
+        bounds = {'<': (0, left), '<=': (0, right), '>': (right, self.valid),
+                  '>=': (left, self.valid), '==': (left, right), '=': (left, right)}
+
+        mask = np.zeros(self.size, dtype=bool)
+        if op == '!=':
+            mask[self.order[:left]] = True
+            mask[self.order[right:]] = True
+        else:
+            start, end = bounds[op]
+            mask[self.order[start:end]] = True
+
+        return mask
+
+
+def evaluate(data, op, value, index=None):
+    """Evaluate a single comparison on a column
+
+    Parameters
+    ----------
+    data: np.ndarray
+        The column data
+    op: str
+        The operator, or 'match' for a compiled wildcard pattern
+    value: float, str, re.Pattern
+        The value to compare to
+    index: sedkit.tablequery.SortedIndex
+        The sorted index of the column
+
+    Returns
+    -------
+    np.ndarray
+        The boolean mask of the rows
+    """
+    # Wildcard
+    if op == 'match':
+        return pd.Series(data).astype(str).str.match(value.pattern, flags=value.flags, na=False).values.astype(bool)
+
+    # String comparison
+    if isinstance(value, str):
+        if op not in ('==', '=', '!='):
+            raise ValueError("'{}' operator not understood for strings.".format(op))
+        keep = np.asarray(data.astype(str) == value, dtype=bool)
+        return ~keep if op == '!=' else keep
+
+    # Numeric comparison with a sorted index
+    if index is not None:
+        return index.mask(op, value)
+
+    # Numeric comparison
+    if data.dtype.kind not in 'biuf':
+        try:
+            data = data.astype(float)
+        except (TypeError, ValueError):
+            raise ValueError("Cannot compare non-numeric column to {}".format(value))
+
+    with np.errstate(invalid='ignore'):
+        return OPERATORS[op](data, value)
+
+
+def get_column(table, param):
+    """Get the data in a column as an array
+
+    Parameters
+    ----------
+    table: astropy.table.Table, pandas.DataFrame, sedkit.catalog.ResultsStore
+        The table
+    param: str
+        The column name
+
+    Returns
+    -------
+    np.ndarray
+        The column data, with masked numeric values as NaN
+    """
+    # Check it is a valid column
+    colnames = table.columns if isinstance(table, pd.DataFrame) else table.colnames
+    if param not in colnames:
+        raise KeyError("No column named {}".format(param))
+
+    # pandas
+    if isinstance(table, pd.DataFrame):
+        return table[param].values
+
+    # sedkit.catalog.ResultsStore
+    if hasattr(table, 'column'):
+        return table.column(param)
+
+    # astropy
+    col = table[param]
+    data = np.asarray(getattr(col, 'value', col))
+    if np.ma.is_masked(col):
+        data = np.ma.filled(np.ma.array(data, mask=np.ma.getmaskarray(col)), np.nan if data.dtype.kind == 'f' else '')
+
+    return data
+
+
+def parse_condition(value):
+    """Parse a condition into groups of (operator, value) alternatives
+
+    Parameters
+    ----------
+    value: str, float, int, sequence
+        The criteria to filter by, which can be single valued like 1400,
+        a range with operators [<, <=, >, >=, ==, !=], e.g. ('>1200', '<=1400'),
+        a wildcard string like 'M*', or alternatives like 'M*|L*'
+
+    Returns
+    -------
+    list
+        The groups, all of which must be satisfied by any of their
+        (operator, value) alternatives
+    """
+    # Sequences of conditions must all be satisfied
+    if isinstance(value, (list, tuple)):
+        return [group for cond in value for group in parse_condition(cond)]
+
+    # Numbers are equality
+    if not isinstance(value, str):
+        return [[('==', float(value))]]
+
+    return [[parse_term(term) for term in value.split('|')]]
+
+
+def parse_term(term):
+    """Parse a single condition string
+
+    Parameters
+    ----------
+    term: str
+        The condition, e.g. '>=1200', 'M*' or 'foo'
+
+    Returns
+    -------
+    tuple
+        The operator and value
+    """
+    term = term.strip()
+
+    # Wildcard
+    if '*' in term:
+        term = term.replace("'", '').replace('"', '')
+        pattern = '^' + '.*'.join(re.escape(part) for part in term.split('*')) + '$'
+        return 'match', re.compile(pattern, re.IGNORECASE)
+
+    # Operator, assuming equality if there is none
+    op = next((o for o in OPERATORS if term.startswith(o)), '==')
+    value = term[len(op):].strip() if term.startswith(op) else term
+    if not value or value[0] in '<>=!':
+        raise ValueError("'{}' condition not understood.".format(term))
+
+    # Number or quoted string
+    try:
+        return op, float(value)
+    except ValueError:
+        return op, value.strip('\'"')
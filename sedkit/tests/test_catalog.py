@@ -1,8 +1,14 @@
 import unittest
+from unittest import mock
 import copy
 import os
+import json
+import pickle
+import shutil
+import zipfile
 
 import astropy.units as q
+import numpy as np
 
 from .. import sed
 from .. import catalog
@@ -99,7 +105,7 @@ class TestCatalog(unittest.TestCase):
         # Get the SED
         s = cat.get_SED('Vega')
 
-        self.assertEqual(type(s), type(self.vega))
+        self.assertIsInstance(s, type(self.vega))
 
     def test_plot(self):
         """Test plot method"""
@@ -152,4 +158,422 @@ class TestCatalog(unittest.TestCase):
         cat.add_SED(self.vega)
 
         # Check the source
-        self.assertEqual(str(type(cat.source)), "<class 'bokeh.models.sources.ColumnDataSource'>")
\ No newline at end of file
+        self.assertEqual(str(type(cat.source)), "<class 'bokeh.models.sources.ColumnDataSource'>")
+
+
+class TestCatalogOffline(unittest.TestCase):
+    """Tests for Catalog methods with an SED that needs no catalog queries"""
+    def setUp(self):
+        # Make an SED without any catalog queries
+        s = sed.SED(verbose=False)
+        s._name = 'foo'
+        s.parallax = 100 * q.mas, 1 * q.mas
+        s.radius = 1 * q.Rsun, 0.1 * q.Rsun
+        for band, mag in [('2MASS.J', 10.), ('2MASS.H', 9.6), ('2MASS.Ks', 9.4), ('WISE.W1', 9.3)]:
+            s.add_photometry(band, mag, 0.05)
+
+        self.cat = catalog.Catalog(verbose=False)
+        self.cat.add_SED(s)
+        self.filepath = 'test_catalog.h5'
+
+    def tearDown(self):
+        if os.path.isfile(self.filepath):
+            os.remove(self.filepath)
+
+    def test_fit_blackbody(self):
+        """Test that all the SEDs are fit at once"""
+        s = copy.copy(self.cat.get_SED('foo'))
+        s._name = 'bar'
+        s.add_photometry('WISE.W2', 9.2, 0.05)
+        self.cat.add_SED(s)
+
+        teff, teff_unc = self.cat.fit_blackbody()
+        self.assertEqual(teff.shape, (2,))
+        self.assertTrue(np.all(teff_unc > 0))
+        self.assertEqual(list(self.cat.results['Teff_bb']), [int(round(i)) for i in teff])
+
+        # Same as fitting each SED
+        s = self.cat.get_SED('bar')
+        s.fit_blackbody()
+        self.assertEqual(s.Teff_bb, self.cat.results['Teff_bb'][1])
+
+    def test_get_SED(self):
+        """Test that SEDs are copied only when modified"""
+        s = self.cat.get_SED('foo')
+        self.assertIsInstance(s, sed.SED)
+        self.assertIs(s._sed, self.cat.results['SED'][0])
+        self.assertIsNot(type(s), sed.SED)
+
+        # Tables and arrays that are read cannot modify the catalog
+        s.photometry.remove_row(0)
+        s.all_names.append('bar')
+        with self.assertRaises(ValueError):
+            s.parallax[0][...] = 0
+        self.assertEqual(len(self.cat.get_SED('foo').photometry), 4)
+        self.assertNotIn('bar', self.cat.get_SED('foo').all_names)
+        self.assertIs(s._sed, self.cat.results['SED'][0])
+
+        # Modifying the SED leaves the catalog alone
+        s.add_photometry('WISE.W2', 9.2, 0.05)
+        self.assertEqual(len(s.photometry), 5)
+        self.assertEqual(len(self.cat.get_SED('foo').photometry), 4)
+
+        # Pickles and deep copies are SEDs independent of the catalog
+        for new in [pickle.loads(pickle.dumps(self.cat.get_SED('foo'))), copy.deepcopy(self.cat.get_SED('foo'))]:
+            self.assertIs(type(new), sed.SED)
+            new.add_photometry('WISE.W2', 9.2, 0.05)
+            self.assertEqual(len(self.cat.get_SED('foo').photometry), 4)
+
+    def test_get_metrics(self):
+        """Test that the metrics of each SED are aggregated"""
+        cat = catalog.Catalog(verbose=False)
+        with mock.patch.dict(os.environ, {'SEDKIT_METRICS': '1'}):
+            cat.add_SED(self.cat.get_SED('foo'))
+
+        # Totals
+        table = cat.get_metrics()
+        self.assertIn('make_sed', table['stage'])
+        self.assertEqual(table['sources'][list(table['stage']).index('make_sed')], 1)
+
+        # Per source
+        table = cat.get_metrics(per_source=True)
+        self.assertEqual(set(table['name']), {'foo'})
+
+    def test_lazy(self):
+        """Test that selected columns are loaded and SEDs are rebuilt on demand"""
+        self.cat.save(self.filepath)
+        cat = catalog.Catalog(verbose=False)
+        cat.load(self.filepath, columns=['Lbol'])
+
+        # Only the requested columns
+        self.assertEqual(cat.results.colnames, ['name', 'Lbol', 'SED'])
+        self.assertAlmostEqual(cat.results['Lbol'][0], self.cat.results['Lbol'][0])
+        self.assertIsInstance(cat.results['SED'][0], catalog.LazySED)
+
+        # Rebuild the SED
+        s = cat.get_SED('foo')
+        self.assertEqual(len(s.photometry), 4)
+        self.assertAlmostEqual(s.Lbol[0].value / self.cat.results['Lbol'][0], 1)
+
+        # Save again without rebuilding
+        cat.save(self.filepath)
+        cat.load(self.filepath)
+        self.assertEqual(len(cat.get_SED(0).photometry), 4)
+
+    def test_merge(self):
+        """Test that catalogs are joined with a duplicate policy"""
+        other = catalog.Catalog(verbose=False, name='Other')
+        for name in ['foo', 'bar']:
+            s = copy.copy(self.cat.get_SED('foo'))
+            s._name = name
+            s.add_photometry('WISE.W2', 9.2, 0.05)
+            other.add_SED(s)
+        self.cat._store.update(0, {'Lbol': np.nan})
+
+        # Photometry columns are aligned
+        merged = self.cat + other
+        self.assertEqual(list(merged.results['name']), ['foo', 'foo', 'bar'])
+        self.assertTrue(np.isnan(merged.results['WISE.W2'][0]))
+
+        # Duplicates
+        self.assertEqual(list(self.cat.merge(other, duplicates='first').results['name']), ['foo', 'bar'])
+        self.assertAlmostEqual(self.cat.merge(other, duplicates='last').results['WISE.W2'][0], 9.2, places=2)
+        filled = self.cat.merge(other, duplicates='fill')
+        self.assertEqual(filled.results['Lbol'][0], other.results['Lbol'][0])
+        self.assertIs(filled.results['SED'][0], self.cat.results['SED'][0])
+
+        # Position
+        for store, ra in [(self.cat._store, [10.]), (other._store, [10.0001, 11.])]:
+            for idx, val in enumerate(ra):
+                store.update(idx, {'ra': val, 'dec': 20.})
+        self.assertEqual(len(self.cat.merge(other, on='position', duplicates='first').results), 2)
+        self.assertEqual(len(self.cat.merge(other, on='position', duplicates='first', radius=0.1 * q.arcsec).results), 3)
+
+        # Bad policy
+        self.assertRaises(ValueError, self.cat.merge, other, duplicates='foo')
+        self.assertRaises(ValueError, self.cat.merge, other, on='foo', duplicates='first')
+
+    def test_plot_modes(self):
+        """Test that large catalogs are binned or downsampled"""
+        cat = catalog.Catalog(verbose=False)
+        for n in range(50):
+            cat._store.append({'name': 'Star {}'.format(n), 'Teff': 1000. + n, 'Teff_unc': 10., 'Lbol': 1e30 * (n + 1)})
+
+        # Binned
+        fig = cat.plot('Teff', 'Lbol', max_points=10, identify=['Star 3'])
+        self.assertIn('Quad', [type(r.glyph).__name__ for r in fig.renderers])
+
+        # Downsampled
+        fig = cat.plot('Teff', 'Lbol', mode='downsample', max_points=10)
+        self.assertEqual(len(fig.select(name='points')[0].data_source.data['x']), 10)
+
+        # Bad mode
+        self.assertRaises(ValueError, cat.plot, 'Teff', 'Lbol', mode='foo')
+
+    def test_update(self):
+        """Test that only the results depending on a setting are recalculated"""
+        def brown_dwarf(evo_model):
+            s = sed.SED(verbose=False, evo_model=evo_model)
+            s._name = 'bar'
+            s.parallax = 50 * q.mas, 1 * q.mas
+            s.age = 0.5 * q.Gyr, 0.1 * q.Gyr
+            for band, mag in [('2MASS.J', 14.), ('2MASS.H', 13.5), ('2MASS.Ks', 13.), ('WISE.W1', 12.7)]:
+                s.add_photometry(band, mag, 0.05)
+            return s
+
+        cat = catalog.Catalog(verbose=False)
+        self.assertIsNone(cat.evo_model)
+        cat.add_SED(brown_dwarf('DUSTY00'))
+        cat._store.append({'name': 'empty'})
+        self.assertEqual(cat.evo_model, 'DUSTY00')
+        report = cat.update(evo_model='COND03')
+        self.assertEqual(cat.evo_model, 'COND03')
+        self.assertEqual(report['sources'], 1)
+        self.assertIn('logg', report['columns'])
+        self.assertNotIn('fbol', report['columns'])
+
+        # Same results as building the SED with the new model
+        new = catalog.Catalog(verbose=False)
+        new.add_SED(brown_dwarf('COND03'))
+        for col in report['columns']:
+            self.assertEqual(cat.results[col][0], new.results[col][0])
+
+        # Same results on other processes, still sharing one isochrone
+        other = catalog.Catalog(verbose=False)
+        other.add_SED(brown_dwarf('DUSTY00'))
+        other.add_SED(brown_dwarf('DUSTY00'))
+        other.update(processes=2, evo_model='COND03')
+        for col in report['columns']:
+            self.assertEqual(other.results[col][1], new.results[col][0])
+        self.assertIs(other.get_SED(0)._evo_model, other.get_SED(1)._evo_model)
+
+        # Units change no results, and leave each SED's model alone
+        new.wave_units = q.AA
+        self.assertEqual(new.get_SED(0).wave_units, q.AA)
+        self.assertEqual(new.get_SED(0).evo_model.name, 'COND03')
+        self.assertEqual(new.evo_model, 'COND03')
+        self.assertRaises(ValueError, cat.update, foo=1)
+
+    def test_writer(self):
+        """Test that results are written in chunks and read back"""
+        with catalog.CatalogWriter(self.filepath, self.cat._metadata(), units={'Teff': q.K}, objects=['name'], buffer=3) as writer:
+            for n in range(7):
+                row = {'name': 'Star {}'.format(n), 'Teff': (1000 + n) * q.K}
+                if n > 3:
+                    row['2MASS.J'] = 12.
+                writer.append(row, state=self.cat.get_SED('foo').get_state() if n == 5 else None)
+
+        cat = catalog.Catalog(verbose=False)
+        cat.load(self.filepath)
+        self.assertEqual(len(cat.results), 7)
+        self.assertEqual(cat.results['Teff'][6], 1006)
+        self.assertTrue(np.isnan(cat.results['2MASS.J'][0]))
+
+        # Only the saved SED can be rebuilt
+        self.assertIsNone(cat.results['SED'][0])
+        self.assertEqual(cat.get_SED('Star 5').name, 'foo')
+
+    def test_pickle(self):
+        """Test that SEDs can be sent to other processes"""
+        s = pickle.loads(pickle.dumps(self.cat.results['SED'][0]))
+        self.assertEqual(len(s.photometry), 4)
+
+    def test_export(self):
+        """Test that exports only rewrite the sources which changed"""
+        dirpath = 'SED_Catalog'
+        try:
+            self.cat.export()
+            self.assertTrue(os.path.isfile(os.path.join(dirpath, 'sources', 'foo', 'foo_photometry.txt')))
+            with open(os.path.join(dirpath, 'manifest.json')) as f:
+                first = json.load(f)
+
+            # Unchanged sources are skipped
+            mtime = os.path.getmtime(os.path.join(dirpath, 'sources', 'foo', 'foo_photometry.txt'))
+            s = self.cat.get_SED('foo')
+            s._name = 'bar'
+            s.add_photometry('WISE.W2', 9.2, 0.05)
+            self.cat.add_SED(s)
+            self.cat.export()
+            with open(os.path.join(dirpath, 'manifest.json')) as f:
+                second = json.load(f)
+            self.assertEqual(first['foo'], second['foo'])
+            self.assertEqual(mtime, os.path.getmtime(os.path.join(dirpath, 'sources', 'foo', 'foo_photometry.txt')))
+            self.assertEqual(sorted(os.listdir(os.path.join(dirpath, 'sources'))), ['bar', 'foo'])
+
+            # Zipped in parallel
+            self.cat.export(zipped=True, processes=2)
+            with zipfile.ZipFile(dirpath + '.zip') as archive:
+                self.assertIn('sources/bar/bar_photometry.txt', archive.namelist())
+                self.assertIn('manifest.json', archive.namelist())
+
+            # Other directories are not overwritten
+            os.remove(os.path.join(dirpath, 'manifest.json'))
+            self.assertRaises(IOError, self.cat.export)
+
+        finally:
+            shutil.rmtree(dirpath, ignore_errors=True)
+            if os.path.isfile(dirpath + '.zip'):
+                os.remove(dirpath + '.zip')
+
+    def test_legacy(self):
+        """Test that pickled results tables are still loaded"""
+        results = self.cat.results.copy()
+        del results['SED']
+        with open(self.filepath, 'wb') as f:
+            pickle.dump(results, f)
+        cat = catalog.Catalog(verbose=False)
+        cat.load(self.filepath)
+        self.assertEqual(len(cat.results), 1)
+
+
+class TestFromFile(unittest.TestCase):
+    """Tests for the Catalog.from_file method"""
+    def setUp(self):
+        # Make a source list
+        self.filepath = 'test_sources.csv'
+        with open(self.filepath, 'w') as f:
+            f.write('name,ra,dec\nVega,279.2347,38.7837\nfoo bar baz,10.,10.\n')
+        self.checkpoint = 'test_sources.chk'
+
+    def tearDown(self):
+        for filepath in [self.filepath, self.checkpoint]:
+            if os.path.isfile(filepath):
+                os.remove(filepath)
+
+    def test_failures(self):
+        """Test that every source is either added or recorded as a failure"""
+        cat = catalog.Catalog(verbose=False)
+        cat.from_file(self.filepath, run_methods=[], processes=2)
+        self.assertEqual(len(cat.results) + len(cat.failures), 2)
+
+        # Failures carry the error
+        for failure in cat.failures:
+            self.assertIn(failure['name'], ['Vega', 'foo bar baz'])
+            self.assertTrue(failure['error'])
+
+    def test_success(self):
+        """Test that SEDs with photometry set directly are built on a process pool and checkpointed"""
+        phot = [['add_photometry', {'band': band, 'mag': mag, 'mag_unc': 0.05}] for band, mag in [('2MASS.J', 10.), ('2MASS.H', 9.6), ('2MASS.Ks', 9.4)]]
+        with mock.patch.object(sed.transport, 'request', return_value=None):
+            cat = catalog.Catalog(verbose=False)
+            cat.from_file(self.filepath, run_methods=phot + ['make_sed'], processes=2)
+
+            # Check a finished SED can be written to a checkpoint
+            name, row, error = catalog.process_source({'name': 'Vega'}, run_methods=phot + ['make_sed'], cols=cat.cols)
+            catalog.write_checkpoint(self.checkpoint, {'rows': [row], 'failures': [], 'done': [name]})
+
+        # All the SEDs came back from the workers
+        self.assertEqual(len(cat.failures), 0)
+        self.assertEqual(sorted(cat.results['name']), ['Vega', 'foo bar baz'])
+        self.assertEqual(len(cat.get_SED('Vega').photometry), 3)
+
+        # And the checkpointed one is restored
+        batch = catalog.read_checkpoint(self.checkpoint)[0]
+        self.assertIsNone(error)
+        self.assertEqual(batch['done'], ['Vega'])
+        self.assertEqual(len(batch['rows'][0]['SED'].photometry), 3)
+
+    def test_stream(self):
+        """Test that a source list is streamed to a catalog file"""
+        cat = catalog.Catalog(verbose=False)
+        cat.stream(self.filepath, self.checkpoint, run_methods=[], chunksize=1, processes=2)
+
+        # Read it back
+        new = catalog.Catalog(verbose=False)
+        new.load(self.checkpoint)
+        self.assertEqual(len(new.results) + len(new.failures), 2)
+
+    def test_read_sources(self):
+        """Test that a source list is read in chunks"""
+        with open(self.filepath, 'w') as f:
+            f.write('# Sources\nname, ra, dec\nVega,279.2347,38.7837\nfoo bar baz,10.,10.\nbar,1.,2.\n')
+
+        chunks = list(catalog.read_sources(self.filepath, chunksize=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertEqual(chunks[0][1]['name'], 'foo bar baz')
+        self.assertEqual(chunks[1][0]['dec'], 2.)
+
+    def test_resume(self):
+        """Test that a checkpoint is resumed from and removed"""
+        # Pretend Vega was done in a previous run
+        catalog.write_checkpoint(self.checkpoint, {'rows': [{'name': 'Vega'}], 'failures': [], 'done': [0]})
+
+        # Add a truncated batch
+        with open(self.checkpoint, 'ab') as f:
+            f.write(pickle.dumps({'rows': [], 'failures': [], 'done': [1]})[:10])
+
+        cat = catalog.Catalog(verbose=False)
+        cat.from_file(self.filepath, run_methods=[], checkpoint=self.checkpoint)
+
+        # Vega is restored and only the other source was processed
+        self.assertEqual(list(cat.results['name']).count('Vega'), 1)
+        self.assertEqual(len(cat.results) + len(cat.failures), 2)
+        self.assertFalse(os.path.isfile(self.checkpoint))
+
+    def test_resume_duplicates(self):
+        """Test that rows with the same name are resumed by their index"""
+        with open(self.filepath, 'a') as f:
+            f.write('Vega,279.2347,38.7837\n')
+
+        # Pretend the first Vega was done in a previous run
+        catalog.write_checkpoint(self.checkpoint, {'rows': [{'name': 'Vega'}], 'failures': [], 'done': [0]})
+
+        cat = catalog.Catalog(verbose=False)
+        cat.from_file(self.filepath, run_methods=[], processes=1, checkpoint=self.checkpoint)
+
+        # The second Vega is still processed
+        names = list(cat.results['name']) + [failure['name'] for failure in cat.failures]
+        self.assertEqual(names.count('Vega'), 2)
+        self.assertEqual(len(names), 3)
+
+
+class TestResultsStore(unittest.TestCase):
+    """Tests for the ResultsStore class"""
+    def setUp(self):
+        # Make a store with a few rows
+        self.store = catalog.ResultsStore([('name', 'O'), ('Teff', float)], units={'Teff': q.K})
+        for n in range(40):
+            self.store.append({'name': 'Star {}'.format(n), 'Teff': 1000 + n})
+
+    def test_append(self):
+        """Test that rows are appended with new columns"""
+        self.assertEqual(len(self.store), 40)
+
+        # New columns are filled for previous rows
+        self.store.append({'name': 'foo', 'Teff': 1.*q.kK, '2MASS.J': 12.3})
+        table = self.store.to_table()
+        self.assertEqual(len(table), 41)
+        self.assertEqual(table['Teff'][-1], 1000)
+        self.assertTrue(np.isnan(table['2MASS.J'][0]))
+
+        # Missing columns are NaN
+        self.store.append({'name': 'bar'})
+        self.assertTrue(np.isnan(self.store.column('Teff')[-1]))
+
+    def test_remove(self):
+        """Test that rows are removed"""
+        self.store.remove([0, 5])
+        self.assertEqual(len(self.store), 38)
+        self.assertNotIn('Star 5', self.store.column('name'))
+
+    def test_rows(self):
+        """Test that the name index is maintained"""
+        self.store.append({'name': 'Star 3'})
+        self.assertEqual(self.store.rows('Star 3'), [3, 40])
+
+        # Rows move after a removal
+        self.store.remove([0])
+        self.assertEqual(self.store.rows('Star 3'), [2, 39])
+        self.assertEqual(self.store.rows('Star 0'), [])
+        self.assertEqual(self.store.select(self.store.column('Teff') > 1030).rows('Star 39'), [8])
+
+    def test_tables(self):
+        """Test that the store converts to and from tables"""
+        table = self.store.to_table()
+        self.assertEqual(table['Teff'].unit, q.K)
+        self.assertEqual(len(self.store.to_pandas()), 40)
+
+        # Round trip
+        store = catalog.ResultsStore.from_table(table, objects=['name'])
+        self.assertEqual(store.column('Teff').dtype, float)
+        self.assertEqual(len(store), 40)
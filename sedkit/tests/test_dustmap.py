@@ -0,0 +1,102 @@
+"""A suite of tests for the dustmap.py module"""
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import astropy.units as q
+from astropy.coordinates import SkyCoord
+import h5py
+import numpy as np
+
+from .. import catalog
+from .. import dustmap as dm
+from .. import sed
+from .. import transport as tr
+
+
+def make_grid(filepath):
+    """Write a grid dust map where E(B-V) = distance/1000 pc everywhere"""
+    distance = np.logspace(0, 4, 9)
+    with h5py.File(filepath, 'w') as f:
+        f['l'] = np.linspace(0, 360, 37)
+        f['b'] = np.linspace(-90, 90, 19)
+        f['distance'] = distance
+        f['ebv'] = np.broadcast_to(distance / 1000., (37, 19, 9))
+
+
+class TestDustMap(unittest.TestCase):
+    """Tests for the dust maps"""
+    def setUp(self):
+        """Make a grid dust map"""
+        self.settings = copy.copy(dm.SETTINGS)
+        self.tmpdir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.tmpdir, 'grid.h5')
+        make_grid(self.filepath)
+        self.coords = SkyCoord(ra=[10, 10.001, 200] * q.deg, dec=[20, 20, -30] * q.deg)
+
+    def tearDown(self):
+        """Restore the settings"""
+        dm.SETTINGS.update(self.settings)
+        shutil.rmtree(self.tmpdir)
+
+    def test_bayestar(self):
+        """Test that the web service is queried deterministically through the transport"""
+        calls = []
+
+        def service(coords, mode='median', version='bayestar2017'):
+            calls.append(mode)
+            return np.full(len(coords), 0.1) if mode == 'median' else np.random.uniform(size=len(coords))
+
+        with mock.patch.dict(tr.SERVICES, {'bayestar': service}):
+            dustmap = dm.Bayestar()
+            self.assertEqual(list(dustmap.query(self.coords, 100 * q.pc)), [0.1] * 3)
+            self.assertEqual(dm.Bayestar(mode='random_sample').query(self.coords[0], 100 * q.pc) >= 0, True)
+        self.assertEqual(calls, ['median', 'random_sample'])
+        self.assertRaises(ValueError, dm.Bayestar, mode='foo')
+
+    def test_grid(self):
+        """Test that a batch is looked up once and memoized in bins"""
+        dustmap = dm.load(self.filepath)
+        self.assertIsInstance(dustmap, dm.GridDustMap)
+        red = dustmap.query(self.coords, [100, 100, 1000] * q.pc)
+        np.testing.assert_allclose(red, [0.1, 0.1, 1.], rtol=0.05)
+        self.assertEqual((dustmap.queries, len(dustmap.cache)), (1, 2))
+
+        # Nearby sources use the memoized bins
+        self.assertEqual(dustmap.query(self.coords[1], 101 * q.pc), red[0])
+        self.assertEqual(dustmap.queries, 1)
+
+        # Outside the map or without a distance
+        self.assertTrue(np.isnan(dustmap.query(self.coords[0], 1E5 * q.pc)))
+        self.assertTrue(np.isnan(dustmap.query(self.coords[0], np.nan * q.pc)))
+
+        # Bad input
+        self.assertRaises(TypeError, dustmap.query, 'foo', 100 * q.pc)
+        self.assertRaises(IOError, dm.load, 'foo.h5')
+
+    def test_catalog(self):
+        """Test that SEDs and catalogs use the configured dust map"""
+        shared = dm.configure(self.filepath)
+        self.assertIs(dm.get_dustmap(), shared)
+
+        s = sed.SED(verbose=False)
+        s._name = 'foo'
+        s._set_sky_coords(self.coords[0], simbad=False)
+        s.parallax = 10 * q.mas, 0.1 * q.mas
+        self.assertAlmostEqual(s.reddening, 0.1, places=2)
+
+        # Batched for the whole catalog
+        for band, mag in [('2MASS.J', 10.), ('2MASS.H', 9.6), ('2MASS.Ks', 9.4)]:
+            s.add_photometry(band, mag, 0.05)
+        cat = catalog.Catalog(verbose=False)
+        cat.add_SED(s)
+        np.testing.assert_allclose(cat.get_reddening(), [s.reddening])
+
+        # Environment variable
+        with mock.patch.dict(os.environ, {'SEDKIT_DUSTMAP': self.filepath}):
+            dm.configure('')
+            self.assertIsInstance(dm.get_dustmap(), dm.GridDustMap)
+        self.assertIsInstance(dm.get_dustmap(), dm.Bayestar)
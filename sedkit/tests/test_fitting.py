@@ -0,0 +1,125 @@
+"""Series of unit tests for the fitting.py module"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from .. import fitting as fit
+from .. import utilities as u
+
+
+class TestFitRelation(unittest.TestCase):
+    """Tests for the fit_relation function"""
+    def setUp(self):
+        # Use a temporary cache directory
+        self.tmpdir = tempfile.mkdtemp()
+        self.old_cache = os.environ.get('SEDKIT_CACHE')
+        os.environ['SEDKIT_CACHE'] = self.tmpdir
+
+        # Make some noisy quadratic data
+        rng = np.random.RandomState(42)
+        self.x = np.linspace(0, 10, 60)
+        self.yerr = np.ones_like(self.x) * 0.5
+        self.y = 0.3 * self.x**2 - 2 * self.x + 1 + rng.normal(scale=0.5, size=60)
+
+    def tearDown(self):
+        if self.old_cache is None:
+            del os.environ['SEDKIT_CACHE']
+        else:
+            os.environ['SEDKIT_CACHE'] = self.old_cache
+        shutil.rmtree(self.tmpdir)
+
+    def test_polynomial(self):
+        """Test that a polynomial is chosen and bootstrapped"""
+        result = fit.fit_relation(self.x, self.y, self.yerr, smoothing=[], n_boot=50, processes=2)
+        self.assertEqual(result.kind, 'polynomial')
+        self.assertTrue(result.param >= 2)
+        self.assertEqual(len(result.scores), len(fit.POLYNOMIAL_ORDERS))
+        self.assertEqual(result.C_p.shape, (result.param + 1, result.param + 1))
+
+        # Evaluate arrays with uncertainties
+        vals, uncs = result.evaluate(np.array([2., 5.]), x_unc=0.1)
+        self.assertTrue(np.allclose(vals, [-1.8, -1.5], atol=0.5))
+        self.assertTrue(np.all(uncs > 0))
+
+    def test_spline(self):
+        """Test that a spline can be chosen and evaluated"""
+        result = fit.fit_relation(self.x, np.sin(self.x), orders=[1], n_boot=20, processes=1)
+        self.assertEqual(result.kind, 'spline')
+        val, unc = result.evaluate(np.pi / 2)
+        self.assertAlmostEqual(val, 1, places=1)
+        self.assertTrue(unc >= 0)
+
+    def test_cache(self):
+        """Test that the chosen fit is cached"""
+        result = fit.fit_relation(self.x, self.y, self.yerr, n_boot=20, processes=1)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmpdir, 'fits'))), 1)
+
+        # Same data and settings load the cached fit
+        cached = fit.fit_relation(self.x, self.y, self.yerr, n_boot=20, processes=1)
+        self.assertEqual(cached.scores, result.scores)
+        self.assertTrue(np.allclose(cached.evaluate(self.x)[1], result.evaluate(self.x)[1]))
+
+        # No candidates
+        self.assertRaises(ValueError, fit.fit_relation, self.x[:3], self.y[:3], orders=[4], smoothing=[], cache=False)
+
+    def test_bootstrap_failures(self):
+        """Test that resamples which cannot be fit are counted"""
+        w = 1. / self.yerr
+        grid = np.linspace(0, 10, 20)
+        samples = np.array([np.zeros(60, dtype=int), np.arange(60)])
+        results, failures = fit.bootstrap(samples, self.x, self.y, w, 'spline', 1., grid=grid)
+        self.assertEqual((len(results), failures), (1, 1))
+
+        # Some failures are recorded with a warning
+        with mock.patch.object(fit, 'bootstrap', return_value=([np.ones(3)] * 15, 5)):
+            with self.assertWarns(UserWarning):
+                result = fit.fit_relation(self.x, self.y, self.yerr, orders=[2], smoothing=[], n_boot=20, processes=1, cache=False)
+        self.assertEqual((result.n_boot, result.failures), (15, 5))
+        self.assertEqual(fit.RelationFit.from_dict(result.to_dict()).failures, 5)
+
+        # Mostly failures raise
+        with mock.patch.object(fit, 'bootstrap', return_value=([np.ones(3)] * 5, 15)):
+            self.assertRaises(ValueError, fit.fit_relation, self.x, self.y, self.yerr, orders=[2], smoothing=[], n_boot=20, processes=1, cache=False)
+
+
+class TestFitBlackbody(unittest.TestCase):
+    """Tests for the fit_blackbody function"""
+    def setUp(self):
+        # Make some noisy blackbody photometry
+        rng = np.random.RandomState(42)
+        self.wave = np.array([0.55, 0.8, 1.25, 1.65, 2.2, 3.4, 4.6])
+        self.teff = np.array([1200., 3000., 6500.])
+        flux = np.array([1E-20, 1E-19, 1E-18])[:, None] * u.planck(self.wave, self.teff[:, None])
+        self.unc = flux * 0.01
+        self.flux = flux + self.unc * rng.normal(size=flux.shape)
+
+    def test_single(self):
+        """Test that one SED is fit between the grid temperatures"""
+        teff, teff_unc, scale, chi2 = fit.fit_blackbody(self.wave, self.flux[1], self.unc[1])
+        self.assertTrue(abs(teff - 3000) < 3 * teff_unc)
+        self.assertAlmostEqual(scale / 1E-19, 1, places=1)
+
+        # Unweighted
+        teff, teff_unc, scale, chi2 = fit.fit_blackbody(self.wave, self.flux[1])
+        self.assertTrue(abs(teff - 3000) < 50)
+        self.assertTrue(teff_unc > 0)
+
+    def test_many(self):
+        """Test that many SEDs with missing data are fit at once"""
+        flux = self.flux.copy()
+        flux[0, -2:] = np.nan
+        teff, teff_unc, scale, chi2 = fit.fit_blackbody(self.wave, flux, self.unc)
+        self.assertEqual(teff.shape, (3,))
+        self.assertTrue(np.all(np.abs(teff - self.teff) < 3 * teff_unc))
+
+        # A wavelength row for each SED and one without data
+        waves = np.tile(self.wave, (4, 1))
+        flux = np.vstack([self.flux, np.full(len(self.wave), np.nan)])
+        unc = np.vstack([self.unc, np.ones(len(self.wave))])
+        teff, teff_unc, scale, chi2 = fit.fit_blackbody(waves, flux, unc)
+        self.assertTrue(np.all(np.abs(teff[:3] - self.teff) < 3 * teff_unc[:3]))
+        self.assertTrue(np.isnan(teff[3]))
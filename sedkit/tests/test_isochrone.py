@@ -2,6 +2,7 @@
 import unittest
 
 import astropy.units as q
+import numpy as np
 
 from .. import isochrone as iso
 from .. import utilities as u
@@ -42,6 +43,22 @@ class TestIsochrone(unittest.TestCase):
         val = self.hsa.interpolate(-400000, 4*q.Gyr, 'Lbol', 'mass')
         self.assertIsNone(val)
 
+    def test_invert(self):
+        """Test that age and mass can be inverted from Lbol and Teff"""
+        # Round trip a single value
+        teff, _ = self.hsa.evaluate(-4, 0.3*q.Gyr, 'Lbol', 'teff')
+        result = self.hsa.invert((-4, 0.05), (teff, 50*q.K), seed=1)
+        self.assertTrue(isinstance(result['age'], tuple))
+        self.assertTrue(abs(result['age'][0] - 0.3*q.Gyr) < result['age'][1])
+
+        # Arrays
+        result = self.hsa.invert(np.array([-4, -3.5]), np.array([1700, 2000]))
+        self.assertEqual(result['mass'][0].shape, (2,))
+
+        # Out of bounds
+        result = self.hsa.invert(-40, 1700)
+        self.assertTrue(np.isnan(result['mass'][0]))
+
     def test_age_units(self):
         """Test the unit conversions"""
         # Test that the age_units property is updated
@@ -0,0 +1,66 @@
+"""A suite of tests for the metrics.py module"""
+import copy
+import os
+import unittest
+from unittest import mock
+
+from .. import metrics
+
+
+class Pipeline:
+    """A stand-in object with timed stages"""
+    def __init__(self):
+        self.metrics = metrics.Metrics()
+        self.data = []
+
+    @metrics.timed('extend', size=lambda obj, n: n)
+    def extend(self, n):
+        self.data += [0] * n
+        return len(self.data)
+
+
+class TestMetrics(unittest.TestCase):
+    """Tests for the Metrics class"""
+    def setUp(self):
+        """Save the settings"""
+        self.settings = copy.copy(metrics.SETTINGS)
+
+    def tearDown(self):
+        """Restore the settings"""
+        metrics.SETTINGS.update(self.settings)
+
+    def test_disabled(self):
+        """Test that nothing is recorded unless enabled"""
+        metrics.configure(False)
+        obj = Pipeline()
+        self.assertEqual(obj.extend(3), 3)
+        self.assertEqual(len(obj.metrics), 0)
+
+        # Environment variable
+        with mock.patch.dict(os.environ, {'SEDKIT_METRICS': '1'}):
+            obj.extend(3)
+        self.assertEqual(len(obj.metrics), 1)
+
+    def test_timed(self):
+        """Test that calls, times and sizes are recorded"""
+        metrics.configure(True)
+        obj = Pipeline()
+        obj.extend(3)
+        obj.extend(4)
+        calls, elapsed, size = obj.metrics.stages['extend']
+        self.assertEqual((calls, size), (2, 7))
+        self.assertGreater(elapsed, 0)
+
+        # Table
+        table = obj.metrics.to_table()
+        self.assertEqual(list(table['stage']), ['extend'])
+        self.assertAlmostEqual(table['mean_time'][0], elapsed / 2)
+
+        # Combine
+        total = obj.metrics + obj.metrics
+        self.assertEqual(total.stages['extend'][0], 4)
+        self.assertRaises(TypeError, total.__add__, 'foo')
+
+        # Reset
+        obj.metrics.reset()
+        self.assertEqual(len(obj.metrics.to_table()), 0)
@@ -0,0 +1,113 @@
+"""A suite of tests for the parallel.py module"""
+import copy
+import os
+import unittest
+from unittest import mock
+
+from .. import metrics
+from .. import parallel as par
+
+
+def square(x):
+    """A picklable task"""
+    return x**2
+
+
+def metrics_enabled(x):
+    """A picklable task which checks a setting in the worker"""
+    return metrics.enabled()
+
+
+class TestExecutor(unittest.TestCase):
+    """Tests for the Executor class"""
+    def test_backends(self):
+        """Test that every backend gives the same results"""
+        for backend in par.BACKENDS:
+            with par.Executor(backend, workers=2, chunksize=2) as executor:
+                self.assertEqual(executor.map(square, range(10)), [x**2 for x in range(10)])
+                self.assertEqual(list(executor.imap(square, range(10))), [x**2 for x in range(10)])
+                self.assertEqual(sorted(executor.imap(square, range(10), ordered=False)), [x**2 for x in range(10)])
+            self.assertIsNone(executor._pool)
+
+        # Bad backend
+        self.assertRaises(ValueError, par.Executor, 'foo')
+
+    def test_reuse(self):
+        """Test that the pool is made once and reused"""
+        executor = par.Executor('threads', workers=2, shared=True)
+        with executor:
+            executor.map(square, range(4))
+        pool = executor._pool
+        executor.map(square, range(4))
+        self.assertIs(executor._pool, pool)
+        executor.close()
+        self.assertIsNone(executor._pool)
+
+
+class TestSharedExecutor(unittest.TestCase):
+    """Tests for the shared executor"""
+    def setUp(self):
+        """Save the settings"""
+        self.settings = copy.copy(par.SETTINGS)
+
+    def tearDown(self):
+        """Restore the settings"""
+        par.shutdown()
+        par.SETTINGS.update(self.settings)
+
+    def test_configure(self):
+        """Test that the shared executor is configured once and reused"""
+        executor = par.configure('threads', workers=3, chunksize=5)
+        self.assertEqual((executor.backend, executor.workers, executor.chunksize), ('threads', 3, 5))
+        self.assertIs(par.get_executor(), executor)
+
+        # Changing the settings makes a new one
+        self.assertEqual(par.configure(workers=2).workers, 2)
+
+        # Bad settings
+        self.assertRaises(ValueError, par.configure, 'foo')
+
+    def test_environment(self):
+        """Test that environment variables override the settings"""
+        par.configure('threads', workers=3)
+        with mock.patch.dict(os.environ, {'SEDKIT_BACKEND': 'serial'}):
+            self.assertEqual(par.get_executor().backend, 'serial')
+            self.assertFalse(par.get_executor().parallel)
+
+        with mock.patch.dict(os.environ, {'SEDKIT_WORKERS': '2', 'SEDKIT_CHUNKSIZE': '10'}):
+            self.assertEqual(par.settings(), ('threads', 2, 10))
+
+        with mock.patch.dict(os.environ, {'SEDKIT_WORKERS': 'foo'}):
+            self.assertRaises(ValueError, par.get_executor)
+
+    def test_private(self):
+        """Test that a number of processes gives a private executor"""
+        with par.get_executor(1) as executor:
+            self.assertEqual(executor.backend, 'serial')
+            self.assertFalse(executor.shared)
+        self.assertEqual(par.get_executor(4).workers, 4)
+
+        # Explicit processes take precedence over the environment
+        with mock.patch.dict(os.environ, {'SEDKIT_BACKEND': 'serial', 'SEDKIT_WORKERS': '1'}):
+            self.assertEqual(par.get_executor(2).backend, 'processes')
+
+    def test_worker_settings(self):
+        """Test that worker processes see settings changed after the pool was made"""
+        enabled = metrics.SETTINGS['enabled']
+        try:
+            par.configure('processes', workers=2)
+            metrics.configure(False)
+            self.assertEqual(par.get_executor().map(metrics_enabled, range(2)), [False, False])
+            pool = par.get_executor()._pool
+
+            # A new pool copies the new setting
+            metrics.configure(True)
+            self.assertEqual(par.get_executor().map(metrics_enabled, range(2)), [True, True])
+            self.assertIsNot(par.get_executor()._pool, pool)
+
+            # As do environment variables
+            metrics.configure(False)
+            with mock.patch.dict(os.environ, {'SEDKIT_METRICS': '1'}):
+                self.assertEqual(par.get_executor().map(metrics_enabled, range(2)), [True, True])
+        finally:
+            metrics.configure(enabled)
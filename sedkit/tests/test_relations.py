@@ -1,7 +1,12 @@
 import copy
+import os
 from pkg_resources import resource_filename
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
+import astropy.table as at
 import astropy.units as q
 import numpy as np
 
@@ -83,6 +88,24 @@ class TestRelation(unittest.TestCase):
         args = {'xparam': 'foo', 'yparam': 'Mbol', 'order': 1}
         self.assertRaises(NameError, r.derive, **args)
 
+    def test_fit(self):
+        """Tests for the fit method"""
+        # Choose the best model on construction
+        r = rel.DwarfSequence(xparam='spt', yparam='Teff', order='best')
+        self.assertIsNotNone(r.model)
+        self.assertTrue(r.derived)
+
+        # Evaluate
+        val, unc = r.evaluate(np.array([45., 65.]))
+        self.assertTrue(np.all(np.isfinite(val)) and np.all(unc > 0))
+
+        # Deriving a polynomial replaces the model
+        r.derive('logL', 'Mbol', 1)
+        self.assertIsNone(r.model)
+
+        # Bad param name
+        self.assertRaises(NameError, r.fit, 'foo', 'Mbol')
+
     def test_add_column(self):
         """Tests for add_column method"""
         # Generate object
@@ -120,6 +143,16 @@ class TestRelation(unittest.TestCase):
         # Evaluate with plot
         self.assertTrue(isinstance(r.evaluate(5, plot=True), tuple))
 
+        # Evaluate arrays with x uncertainties
+        x = np.array([4, 5, 6])
+        vals, uncs = r.evaluate(x, x_unc=0.1)
+        self.assertEqual(vals.shape, x.shape)
+        self.assertTrue(np.allclose(vals[1], r.evaluate(5)[0]))
+        self.assertTrue(np.all(uncs > r.evaluate(x)[1]))
+
+        # Uncertainty matches the fit covariance at the data
+        self.assertTrue(np.allclose(r.evaluate(r.x)[1], r.sig_yi))
+
     def test_plot(self):
         """Test plot method"""
         # Generate object
@@ -129,4 +162,75 @@ class TestRelation(unittest.TestCase):
         fig = r.plot()
 
         # Explicit params
-        fig = r.plot('logL', 'Mbol')
\ No newline at end of file
+        fig = r.plot('logL', 'Mbol')
+
+class TestSpectralTypeRadiusFile(unittest.TestCase):
+    """Tests for the precomputed SpectralTypeRadius relation"""
+    def setUp(self):
+        # Use a temporary cache directory
+        self.tmpdir = tempfile.mkdtemp()
+        self.old_cache = os.environ.get('SEDKIT_CACHE')
+        os.environ['SEDKIT_CACHE'] = self.tmpdir
+
+        # Make a relation from fake source data
+        spts = {'AFGK': np.arange(31., 64.), 'MLTY': np.arange(66., 98.)}
+        source = {grp: at.Table([spt.astype(str), spt, 1.5 - spt / 100., np.ones_like(spt) * 0.05], names=rel.SPT_RADIUS_COLUMNS) for grp, spt in spts.items()}
+        self.relation = rel.SpectralTypeRadius.__new__(rel.SpectralTypeRadius)
+        self.relation.name = 'Test'
+        self.relation.source = source
+        self.relation.generate((2, 2))
+
+    def tearDown(self):
+        if self.old_cache is None:
+            del os.environ['SEDKIT_CACHE']
+        else:
+            os.environ['SEDKIT_CACHE'] = self.old_cache
+        shutil.rmtree(self.tmpdir)
+
+    def test_load(self):
+        """Test that the saved relation is loaded without refitting"""
+        self.relation.save(os.path.join(self.tmpdir, rel.SPT_RADIUS_FILE))
+
+        # Same orders, without any catalog queries
+        with mock.patch.object(rel.transport, 'request', side_effect=IOError('No network')):
+            loaded = rel.SpectralTypeRadius(orders=(2, 2))
+        self.assertTrue(np.allclose(loaded.MLTY['coeffs'], self.relation.MLTY['coeffs']))
+        self.assertEqual(loaded.get_radius(70), self.relation.get_radius(70))
+
+        # Different orders are refit from the stored source data
+        loaded = rel.SpectralTypeRadius(orders=(1, 1))
+        self.assertEqual(loaded.AFGK['order'], 1)
+        self.assertEqual(len(loaded.AFGK['coeffs']), 2)
+
+    def test_get_radius_array(self):
+        """Test that get_radius works on arrays"""
+        spts = [35, 'M5', 70.5]
+        rad, unc = self.relation.get_radius(spts, spt_unc=0.5)
+        self.assertEqual(rad.shape, (3,))
+        self.assertEqual(rad[2], self.relation.get_radius(70.5)[0])
+        self.assertTrue(unc[2] >= self.relation.get_radius(70.5)[1])
+
+        # Out of bounds
+        self.assertRaises(ValueError, self.relation.get_radius, [35, 104])
+
+    @unittest.skipUnless(os.path.isfile(resource_filename('sedkit', 'data/{}'.format(rel.SPT_RADIUS_FILE))), 'The packaged relation has not been built')
+    def test_packaged(self):
+        """Test that the packaged relation is loaded without any catalog queries"""
+        with mock.patch.object(rel.transport, 'request', side_effect=IOError('No network')):
+            relation = rel.SpectralTypeRadius()
+
+        rad, unc = relation.get_radius(70)
+        self.assertTrue(rad.value > 0)
+
+        # Nothing is written to the cache
+        self.assertEqual(os.listdir(self.tmpdir), [])
+
+    def test_main(self):
+        """Test that the relation is built from the command line"""
+        with mock.patch.object(rel, 'build_spt_radius', return_value='foo.json') as build:
+            rel.main(['foo.json', '--orders', '4', '2'])
+        build.assert_called_once_with('foo.json', orders=(4, 2))
+
+        # The output path is required
+        with mock.patch('sys.stderr'):
+            self.assertRaises(SystemExit, rel.main, [])
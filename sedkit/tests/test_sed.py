@@ -1,5 +1,8 @@
 import unittest
+from unittest import mock
 import copy
+import os
+import pickle
 from pkg_resources import resource_filename
 
 import numpy as np
@@ -168,6 +171,46 @@ class TestSED(unittest.TestCase):
         # Radius from age
         s.radius_from_age()
 
+    def test_tails(self):
+        """Test that fbol includes the analytic blackbody tails"""
+        s = copy.copy(self.sed)
+        s.add_photometry('2MASS.J', 10.5, 0.05)
+        s.add_photometry('2MASS.H', 10.1, 0.05)
+        s.add_photometry('2MASS.Ks', 9.9, 0.05)
+        s.make_sed()
+
+        # fbol is the data plus the Rayleigh Jeans tail
+        self.assertIsInstance(s.rj, sp.PlanckTail)
+        self.assertEqual(s.rj.wave_min, s.max_phot)
+        data = s._data_SED.integrate()[0]
+        self.assertAlmostEqual((s.fbol[0]/(data + s.rj.integrate()[0])).value, 1)
+
+        # ...and the Wein tail if there is one
+        s.make_wein_tail(teff=3000*q.K)
+        self.assertIsInstance(s.wein, sp.PlanckTail)
+        self.assertEqual(s.wein.wave_max, s.min_phot)
+        s._calculate_sed()
+        s.get_fbol()
+        data = s._data_SED.integrate()[0]
+        tails = s.wein.integrate()[0] + s.rj.integrate()[0]
+        self.assertAlmostEqual((s.fbol[0]/(data + tails)).value, 1)
+
+        # The sampled SED is only made for plotting
+        self.assertIsNone(s._app_SED)
+        self.assertGreater(len(s.app_SED.wave), len(s._data_SED.wave))
+
+        # The tail of a blackbody spectrum is normalized to it exactly
+        s = sed.SED(verbose=False)
+        wave = np.linspace(1, 5, 300)
+        flux = 1E-20 * sed.u.planck(wave, 3000.) * q.erg / q.s / q.cm**2 / q.AA
+        s.add_spectrum([wave * q.um, flux, flux / 100.])
+        s.make_sed()
+        self.assertAlmostEqual(s.rj.norm / 1E-20, 1, places=3)
+        self.assertAlmostEqual(s._tail_norm(3000 * q.K, 0.0001 * q.um, 1.1 * q.um, to_spec=True) / 1E-20, 1, places=3)
+
+        # ...and left alone without data in range
+        self.assertEqual(s._tail_norm(3000 * q.K, 0.0001 * q.um, 0.5 * q.um, to_spec=True), 1.)
+
     def test_plot(self):
         """Test plotting method"""
         s = copy.copy(self.sed)
@@ -177,6 +220,32 @@ class TestSED(unittest.TestCase):
 
         fig = s.plot(integral=True)
 
+    def test_headless(self):
+        """Test that figures are only made when plotting and are never
+        shown or rendered when headless"""
+        s = copy.copy(self.sed)
+        self.assertIsNone(s.fig)
+        f = resource_filename('sedkit', 'data/L3_photometry.txt')
+        s.add_photometry_file(f)
+        s.make_sed()
+        self.assertIsNone(s.fig)
+
+        with mock.patch.dict(os.environ, {'SEDKIT_HEADLESS': '1'}):
+
+            # Export the data without rendering
+            files = s.export_files(plot=True)
+            self.assertFalse(any(name.endswith('.png') for name in files))
+            self.assertIsNone(s.fig)
+
+            # Plot without showing
+            with mock.patch('bokeh.plotting.show') as bkshow:
+                fig = s.plot()
+            self.assertIs(fig, s.fig)
+            self.assertFalse(bkshow.called)
+
+        # The figure is not pickled
+        self.assertIsNone(pickle.loads(pickle.dumps(s)).fig)
+
     def test_no_photometry(self):
         """Test that a purely photometric SED can be creted"""
         s = copy.copy(self.sed)
@@ -242,6 +311,7 @@ class TestSED(unittest.TestCase):
         s.fit_blackbody()
 
         self.assertTrue(isinstance(s.Teff_bb, (int, float)))
+        self.assertTrue(s.Teff_bb_unc > 0)
 
 def test_VegaSED():
     """Test the VegaSED class"""
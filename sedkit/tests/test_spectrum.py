@@ -202,3 +202,88 @@ class TestVega(unittest.TestCase):
         """Test that it loaded properly"""
         self.assertEqual(self.spec.name, 'Vega')
         self.assertIsNotNone(self.spec.data)
+
+
+class TestBlackbodyGrid(unittest.TestCase):
+    """Tests for the BlackbodyGrid class"""
+    def setUp(self):
+        """Setup the tests"""
+        self.wave = np.linspace(0.5, 10, 1000)*q.um
+        self.teff = np.array([1500., 3000., 6000.])*q.K
+        self.grid = sp.BlackbodyGrid(self.wave, (self.teff, 100*q.K), radius=(1*q.Rsun, 0.1*q.Rsun), distance=(10*q.pc, 1*q.pc))
+
+    def test_data(self):
+        """Test that the grid matches the Blackbody class"""
+        self.assertEqual(self.grid.flux.shape, (3, 1000))
+        self.assertEqual(self.grid.flux.dtype, np.float64)
+        bb = sp.Blackbody(self.wave, self.teff[1], radius=1*q.Rsun, distance=10*q.pc)
+        self.assertTrue(np.allclose(self.grid.flux[1], bb.flux, rtol=1E-6))
+        self.assertTrue(np.all(self.grid.unc > 0))
+
+        # No uncertainties
+        self.assertIsNone(sp.BlackbodyGrid(self.wave, self.teff).unc)
+
+        # Bad units
+        self.assertRaises(TypeError, sp.BlackbodyGrid, self.wave.value, self.teff)
+        self.assertRaises(TypeError, sp.BlackbodyGrid, self.wave, self.teff.value*q.m)
+
+    def test_views(self):
+        """Test that the spectra share the memory of the grid"""
+        spec = self.grid[2]
+        self.assertIsInstance(spec, sp.Spectrum)
+        self.assertTrue(np.shares_memory(spec.flux, self.grid.flux))
+        self.assertEqual(len(list(self.grid)), 3)
+        self.assertRaises(TypeError, self.grid.__getitem__, slice(0, 2))
+
+    def test_integrate(self):
+        """Test that all the temperatures are integrated at once"""
+        vals, uncs = self.grid.integrate()
+        for spec, val, unc in zip(self.grid, vals, uncs):
+            self.assertAlmostEqual((val/spec.integrate()[0]).value, 1, places=5)
+            self.assertAlmostEqual((unc/spec.integrate()[1]).value, 1, places=5)
+
+    def test_synthetic_photometry(self):
+        """Test that all the temperatures are measured at once"""
+        bp = Filter('2MASS.H')
+        flx, unc = self.grid.synthetic_flux(bp)
+        mags, mag_uncs = self.grid.synthetic_magnitude(bp)
+        for n, spec in enumerate(self.grid):
+            self.assertAlmostEqual((flx[n]/spec.synthetic_flux(bp)[0]).value, 1)
+            self.assertAlmostEqual(mags[n], spec.synthetic_magnitude(bp)[0])
+
+        # No overlap
+        self.assertEqual(self.grid.synthetic_flux(Filter('WISE.W4')), (None, None))
+
+
+class TestPlanckTail(unittest.TestCase):
+    """Tests for the PlanckTail class"""
+    def setUp(self):
+        """Setup the tests"""
+        self.tail = sp.PlanckTail((3000*q.K, 100*q.K), 2., 5*q.um, np.inf*q.um)
+
+    def test_planck_integral(self):
+        """Test that the analytic integral matches the numeric one"""
+        # The whole curve is sigma*T**4
+        total = u.planck_integral(0*q.um, np.inf*q.um, 3000*q.K)
+        sigma = (5.670374E-5*q.erg/q.s/q.cm**2/q.K**4)*(3000*q.K)**4
+        self.assertAlmostEqual((total/sigma).decompose().value, 1, places=5)
+
+        # A finite range
+        bb = sp.Blackbody(np.linspace(1, 3, 20000)*q.um, 3000*q.K)
+        num = bb.integrate()[0]
+        ana = u.planck_integral(1*q.um, 3*q.um, 3000*q.K)
+        self.assertAlmostEqual((ana/num).decompose().value, 1, places=4)
+
+    def test_integrate(self):
+        """Test that the tail is integrated to infinity"""
+        val, unc = self.tail.integrate()
+        self.assertAlmostEqual(val.value, 2*u.planck_integral(5*q.um, np.inf*q.um, 3000*q.K).value)
+        self.assertTrue(0 < unc.value < val.value)
+
+    def test_spectrum(self):
+        """Test that the sampled tail is made on demand"""
+        spec = self.tail.spectrum
+        self.assertEqual(spec.size, 500)
+        self.assertAlmostEqual(spec.wave[0], 5)
+        self.assertAlmostEqual(spec.wave[-1], 1000)
+        self.assertTrue(self.tail.spectrum is spec)
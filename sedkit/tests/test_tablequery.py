@@ -0,0 +1,42 @@
+"""A suite of tests for the tablequery.py module"""
+import unittest
+
+import astropy.table as at
+import numpy as np
+
+from .. import tablequery as tq
+
+
+class TestQuery(unittest.TestCase):
+    """Tests for the Query class"""
+    def setUp(self):
+        """Setup the tests"""
+        self.table = at.Table([[1., 2., np.nan, 4.], ['M5', 'L2', 'm9', 'T6']], names=('Teff', 'spt'))
+
+    def test_alternatives(self):
+        """Test that alternatives are OR'd and conditions are AND'd"""
+        query = tq.Query(Teff='<2|>=4', spt='M*')
+        self.assertEqual(list(query.mask(self.table)), [True, False, False, False])
+
+        query = tq.Query(spt='m*|T*')
+        self.assertEqual(len(query.filter(self.table)), 3)
+
+    def test_no_eval(self):
+        """Test that conditions are not evaluated as code"""
+        self.assertEqual(len(tq.Query(spt='__import__("os")').filter(self.table)), 0)
+        self.assertRaises(ValueError, tq.Query, Teff='=>3')
+        self.assertRaises(ValueError, tq.Query(spt='>M5').mask, self.table)
+
+    def test_pandas(self):
+        """Test that pandas tables are filtered natively"""
+        table = self.table.to_pandas()
+        filtered = tq.Query(Teff=('>1', '!=4')).filter(table)
+        self.assertEqual(list(filtered['spt']), ['L2'])
+        self.assertEqual(list(filtered.index), [0])
+
+    def test_sorted_index(self):
+        """Test that sorted indexes give the same results as a scan"""
+        index = tq.SortedIndex(self.table['Teff'])
+        for cond in ['<2', '<=2', '>2', '>=2', '==2', '!=2', 3, '>0|<1']:
+            query = tq.Query(Teff=cond)
+            self.assertEqual(list(query.mask(self.table, indexes={'Teff': index})), list(query.mask(self.table)))
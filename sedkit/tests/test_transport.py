@@ -0,0 +1,105 @@
+"""A suite of tests for the transport.py module"""
+import copy
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import astropy.units as q
+from astropy.coordinates import SkyCoord
+
+from .. import sed
+from .. import transport as tr
+
+
+class Service:
+    """A stand-in service which counts its queries"""
+    def __init__(self):
+        self.queries = 0
+
+    def query_object(self, name, radius=None):
+        self.queries += 1
+        return {'name': name, 'radius': radius}
+
+
+class Simbad:
+    """A stand-in Simbad which finds nothing"""
+    def __init__(self):
+        self.queries = 0
+
+    def query_object(self, name):
+        self.queries += 1
+
+
+class TestTransport(unittest.TestCase):
+    """Tests for the transports"""
+    def setUp(self):
+        """Register a stand-in service and save the settings"""
+        self.settings = copy.copy(tr.SETTINGS)
+        self.fixtures = tempfile.mkdtemp()
+        self.service = Service()
+        self.patch = mock.patch.dict(tr.SERVICES, {'test': self.service})
+        self.patch.start()
+
+    def tearDown(self):
+        """Restore the settings"""
+        self.patch.stop()
+        tr.SETTINGS.update(self.settings)
+        shutil.rmtree(self.fixtures)
+
+    def test_failures(self):
+        """Test that failures and latency are injected"""
+        transport = tr.Transport(latency=(0.01, 0.02), failure_rate=0.5, seed=1)
+        failures = 0
+        start = time.time()
+        for n in range(10):
+            try:
+                transport.request('test', 'query_object', 'foo')
+            except ConnectionError:
+                failures += 1
+        self.assertGreaterEqual(time.time() - start, 0.1)
+        self.assertEqual(failures + self.service.queries, 10)
+        self.assertTrue(0 < failures < 10)
+
+        # Bad settings
+        self.assertRaises(ValueError, tr.Transport, failure_rate=2)
+        self.assertRaises(ValueError, tr.Transport().request, 'foo', 'query_object')
+
+    def test_record_replay(self):
+        """Test that responses are recorded once and replayed"""
+        recorder = tr.configure('record', fixtures=self.fixtures)
+        self.assertIsInstance(recorder, tr.Recorder)
+        coords = SkyCoord(ra=10 * q.deg, dec=20 * q.deg)
+        for n in range(2):
+            response = tr.request('test', 'query_object', coords, radius=5 * q.arcsec)
+        self.assertEqual(self.service.queries, 1)
+
+        # Replay without the service
+        replay = tr.configure('replay')
+        with mock.patch.dict(tr.SERVICES, {'test': None}):
+            self.assertEqual(tr.request('test', 'query_object', coords, radius=5 * q.arcsec)['radius'], response['radius'])
+            self.assertRaises(IOError, tr.request, 'test', 'query_object', 'foo')
+        self.assertIs(tr.get_transport(), replay)
+
+        # Environment variables
+        with mock.patch.dict(os.environ, {'SEDKIT_TRANSPORT': 'live', 'SEDKIT_LATENCY': '0.1,0.2'}):
+            self.assertEqual(tr.settings()[0:3:2], ('live', (0.1, 0.2)))
+        with mock.patch.dict(os.environ, {'SEDKIT_FAILURE_RATE': 'foo'}):
+            self.assertRaises(ValueError, tr.get_transport)
+        self.assertRaises(ValueError, tr.configure, 'foo')
+
+    def test_SED(self):
+        """Test that an SED is built from replayed Simbad responses"""
+        simbad = Simbad()
+        tr.configure('record', fixtures=self.fixtures)
+        with mock.patch.dict(tr.SERVICES, {'simbad': simbad}):
+            sed.SED('foo', verbose=False)
+        self.assertEqual(simbad.queries, 1)
+
+        # Replay
+        tr.configure('replay')
+        with mock.patch.dict(tr.SERVICES, {'simbad': None}):
+            self.assertEqual(sed.SED('foo', verbose=False).name, 'foo')
+        self.assertRaises(IOError, sed.SED, 'bar', verbose=False)
@@ -2,6 +2,8 @@
 import copy
 from pkg_resources import resource_filename
 import pytest
+import subprocess
+import sys
 import unittest
 
 import astropy.units as q
@@ -12,6 +14,11 @@ from svo_filters import Filter
 from .. import utilities as u
 
 
+# The slowest acceptable import of sedkit [us], about three times its
+# import time with the plotting and query packages deferred
+IMPORT_TIME_LIMIT = 3000000
+
+
 def test_equivalent():
     """Test for equivalent function"""
     # Positive tests
@@ -26,6 +33,23 @@ def test_equivalent():
     assert not u.equivalent([2*q.um, 2], q.Jy)
 
 
+def test_import_time():
+    """Test that importing sedkit is fast and does not import the plotting,
+    catalog query, dust map, file or table packages"""
+    heavy = ['astropy.modeling', 'astroquery', 'bokeh', 'dustmaps', 'h5py', 'pandas', 'scipy.optimize', 'svo_filters']
+    code = "import sys, sedkit; print(','.join(m for m in {} if m in sys.modules))".format(heavy)
+    args = [sys.executable] + (['-X', 'importtime'] if sys.version_info >= (3, 7) else []) + ['-c', code]
+    proc = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == '', 'Imported {}'.format(proc.stdout.strip())
+
+    # Check the cumulative import time of sedkit in microseconds
+    times = [line.split('|') for line in proc.stderr.splitlines() if line.startswith('import time:')]
+    total = [int(cumulative) for _, cumulative, name in times if name.strip() == 'sedkit']
+    if total:
+        assert total[0] < IMPORT_TIME_LIMIT, 'Imported sedkit in {} us'.format(total[0])
+
+
 def test_isnumber():
     """Test for isnumber function"""
     # Positive test
@@ -107,6 +131,20 @@ class TestSpectres(unittest.TestCase):
         self.assertEqual(len(binned), 3)
 
 
+def test_LazyImport():
+    """Test that objects are imported on first use"""
+    lazy = u.LazyImport('fractions', 'Fraction', setup=lambda cls: cls)
+    assert not lazy.loaded
+    half = lazy(1, 2)
+    assert lazy.loaded
+    assert isinstance(half, lazy)
+    assert isinstance(half, (int, lazy))
+    assert lazy.from_float(0.5) == half
+
+    # Modules
+    assert u.LazyImport('fractions').Fraction(1, 2) == half
+
+
 def test_idx_exclude():
     """Test the idx_exclude function"""
     arr = np.arange(10)
@@ -192,6 +230,10 @@ class TestFilterTable(unittest.TestCase):
         self.assertEqual(len(u.filter_table(table, c='m*')), 2)
         self.assertEqual(len(u.filter_table(table, c='*w')), 2)
 
+        # Alternatives
+        self.assertEqual(len(u.filter_table(table, a='<2|>2')), 2)
+        self.assertEqual(len(u.filter_table(table.to_pandas(), c='meow|c*')), 2)
+
 
 def test_finalize_spec():
     """Test finalize_spec function"""
@@ -274,3 +316,30 @@ def test_str2Q():
     """Test str2Q function"""
     qnt = u.str2Q('um', target='A')
     qnt = u.str2Q(None)
+
+
+def test_read_cached(tmpdir, monkeypatch):
+    """Test that packaged data files are read through the binary cache"""
+    monkeypatch.setenv('SEDKIT_CACHE', str(tmpdir))
+
+    # Table with masked values
+    file = resource_filename('sedkit', 'data/dwarf_sequence.txt')
+    cold = u.read_table(file, fill_values=[('...', np.nan)])
+    assert len(tmpdir.join('data').listdir()) == 1
+    warm = u.read_table(file, fill_values=[('...', np.nan)])
+    assert warm.colnames == cold.colnames
+    assert all(warm['logL'].mask == cold['logL'].mask)
+    assert [type(col) for col in warm.itercols()] == [type(col) for col in cold.itercols()]
+    assert list(warm['SpT']) == list(cold['SpT'])
+
+    # Array
+    file = resource_filename('sedkit', 'data/STScI_Vega.txt')
+    cold = u.read_array(file, unpack=True)
+    warm = u.read_array(file, unpack=True)
+    assert np.array_equal(cold, warm)
+    assert len(tmpdir.join('data').listdir()) == 2
+
+    # Stale cache files are ignored
+    cached = [f for f in tmpdir.join('data').listdir() if 'Vega' in f.basename][0]
+    np.savez(str(cached), __checksum__=np.array('foo'), data=np.ones(3))
+    assert u.read_array(file, unpack=True).shape == cold.shape
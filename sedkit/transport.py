@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A module to send sedkit's catalog and dust map queries through one
+pluggable transport, which can query the live services, record their
+responses to fixture files, or replay the recorded responses with no
+network access. The transport is set in code with `configure` or with the
+SEDKIT_TRANSPORT, SEDKIT_FIXTURES, SEDKIT_LATENCY and SEDKIT_FAILURE_RATE
+environment variables, e.g. to benchmark or test on an isolated machine.
+"""
+import hashlib
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
+
+import astropy.units as q
+from astropy.coordinates import SkyCoord
+import numpy as np
+
+from . import utilities as u
+
+
+# The supported transport modes
+MODES = ['live', 'record', 'replay']
+
+# The settings of the shared transport
+SETTINGS = {'mode': 'live', 'fixtures': None, 'latency': 0., 'failure_rate': 0., 'seed': None}
+
+# The clients of the services, by name
+SERVICES = {}
+
+# The shared transport, which is made on first use
+_TRANSPORT = None
+
+
+class Transport:
+    """A transport which sends requests to the registered services, with
+    optional latency and failure injection"""
+    def __init__(self, latency=0., failure_rate=0., seed=None):
+        """Initialize the transport
+
+        Parameters
+        ----------
+        latency: float, sequence
+            The time to wait before each response, or the (min, max) range
+            of a random wait [s]
+        failure_rate: float
+            The fraction of requests which fail with a ConnectionError
+        seed: int (optional)
+            The seed of the random latency and failures
+        """
+        if not 0 <= failure_rate <= 1:
+            raise ValueError("{}: failure_rate must be between 0 and 1.".format(failure_rate))
+
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.settings = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """The settings"""
+        return '<{} with {} request(s)>'.format(type(self).__name__, self.requests)
+
+    def request(self, service, method, *args, **kwargs):
+        """Send a request to a service
+
+        Parameters
+        ----------
+        service: str
+            The name of the registered service
+        method: str (optional)
+            The method of the service client, or None to call the client
+
+        Returns
+        -------
+        object
+            The response
+        """
+        # Draw the latency and failure
+        with self._lock:
+            self.requests += 1
+            latency = self._random.uniform(*self.latency) if isinstance(self.latency, (tuple, list)) else self.latency
+            failed = self._random.random() < self.failure_rate
+
+        if latency > 0:
+            time.sleep(latency)
+
+        if failed:
+            raise ConnectionError("Injected failure of {} request.".format(describe(service, method)))
+
+        return self.send(service, method, *args, **kwargs)
+
+    def send(self, service, method, *args, **kwargs):
+        """Get the response to a request from the live service
+
+        Parameters
+        ----------
+        service: str
+            The name of the registered service
+        method: str (optional)
+            The method of the service client, or None to call the client
+
+        Returns
+        -------
+        object
+            The response
+        """
+        if service not in SERVICES:
+            raise ValueError("{}: Please use one of the registered services {}".format(service, sorted(SERVICES)))
+
+        client = SERVICES[service]
+        func = client if method is None else getattr(client, method)
+
+        return func(*args, **kwargs)
+
+
+class Recorder(Transport):
+    """A transport which queries each request live once and saves the
+    response to a fixture file, which is used for repeat requests"""
+    def __init__(self, fixtures=None, **kwargs):
+        """Initialize the recorder
+
+        Parameters
+        ----------
+        fixtures: str (optional)
+            The directory of fixture files, default is the 'fixtures'
+            directory of the sedkit cache
+        """
+        super().__init__(**kwargs)
+        self.fixtures = fixtures or u.cache_dir('fixtures')
+        os.makedirs(self.fixtures, exist_ok=True)
+
+    def send(self, service, method, *args, **kwargs):
+        """Get the recorded response, querying and recording it if needed"""
+        filepath = fixture_path(self.fixtures, service, method, args, kwargs)
+        if os.path.isfile(filepath):
+            return read_fixture(filepath)
+
+        response = super().send(service, method, *args, **kwargs)
+
+        # Write to a temporary file so concurrent readers never see part of one
+        fd, tmpfile = tempfile.mkstemp(dir=self.fixtures, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump({'request': describe(service, method, args, kwargs), 'response': response}, f)
+        os.replace(tmpfile, filepath)
+
+        return response
+
+
+class Replay(Transport):
+    """A transport which serves recorded responses without any network
+    access, failing with an IOError for requests which were not recorded"""
+    def __init__(self, fixtures=None, **kwargs):
+        """Initialize the replay
+
+        Parameters
+        ----------
+        fixtures: str (optional)
+            The directory of fixture files, default is the 'fixtures'
+            directory of the sedkit cache
+        """
+        super().__init__(**kwargs)
+        self.fixtures = fixtures or u.cache_dir('fixtures')
+
+    def send(self, service, method, *args, **kwargs):
+        """Get the recorded response"""
+        filepath = fixture_path(self.fixtures, service, method, args, kwargs)
+        if not os.path.isfile(filepath):
+            raise IOError("No recorded response to {} in {}".format(describe(service, method, args, kwargs), self.fixtures))
+
+        return read_fixture(filepath)
+
+
+def configure(mode=None, fixtures=None, latency=None, failure_rate=None, seed=None):
+    """Set the shared transport, which the environment variables override
+
+    Parameters
+    ----------
+    mode: str (optional)
+        Query the 'live' services, 'record' the responses or 'replay' them
+    fixtures: str (optional)
+        The directory of fixture files
+    latency: float, sequence (optional)
+        The time to wait before each response, or the (min, max) range of
+        a random wait [s]
+    failure_rate: float (optional)
+        The fraction of requests which fail with a ConnectionError
+    seed: int (optional)
+        The seed of the random latency and failures
+
+    Returns
+    -------
+    sedkit.transport.Transport
+        The shared transport
+    """
+    if mode is not None and mode not in MODES:
+        raise ValueError("{}: Please use one of the modes {}".format(mode, MODES))
+
+    new = [('mode', mode), ('fixtures', fixtures), ('latency', latency), ('failure_rate', failure_rate), ('seed', seed)]
+    SETTINGS.update({key: val for key, val in new if val is not None})
+
+    return get_transport()
+
+
+def describe(service, method, args=(), kwargs=None):
+    """Describe a request
+
+    Parameters
+    ----------
+    service: str
+        The name of the service
+    method: str (optional)
+        The method of the service client
+    args: sequence
+        The arguments
+    kwargs: dict
+        The keyword arguments
+
+    Returns
+    -------
+    str
+        The description
+    """
+    call = service if method is None else '{}.{}'.format(service, method)
+    params = [freeze(arg) for arg in args] + ['{}={}'.format(key, freeze(val)) for key, val in sorted((kwargs or {}).items())]
+
+    return '{}({})'.format(call, ', '.join(params)) if args or kwargs else call
+
+
+def fixture_path(fixtures, service, method, args, kwargs):
+    """Get the path to the fixture file of a request
+
+    Parameters
+    ----------
+    fixtures: str
+        The directory of fixture files
+    service: str
+        The name of the service
+    method: str (optional)
+        The method of the service client
+    args: sequence
+        The arguments
+    kwargs: dict
+        The keyword arguments
+
+    Returns
+    -------
+    str
+        The path to the file
+    """
+    key = hashlib.sha1(describe(service, method, args, kwargs).encode('utf-8')).hexdigest()[:16]
+
+    return os.path.join(fixtures, '{}-{}-{}.pkl'.format(service, method or 'call', key))
+
+
+def freeze(val):
+    """Represent an argument of a request the same way in every session
+
+    Parameters
+    ----------
+    val: object
+        The argument
+
+    Returns
+    -------
+    str
+        The representation
+    """
+    if isinstance(val, SkyCoord):
+        if val.isscalar:
+            return 'SkyCoord({:.8f}, {:.8f}, {})'.format(val.icrs.ra.deg, val.icrs.dec.deg, '' if val.distance.unit == q.one else val.distance)
+        return 'SkyCoord([{}])'.format(', '.join(freeze(coord) for coord in val))
+
+    if isinstance(val, q.Quantity):
+        return '{!r} {}'.format(np.round(val.value, 10).tolist(), val.unit.to_string())
+
+    if isinstance(val, (list, tuple)):
+        return '[{}]'.format(', '.join(freeze(i) for i in val))
+
+    if isinstance(val, dict):
+        return '{{{}}}'.format(', '.join('{}: {}'.format(key, freeze(val[key])) for key in sorted(val)))
+
+    return repr(val)
+
+
+def get_transport():
+    """Get the shared transport
+
+    Returns
+    -------
+    sedkit.transport.Transport
+        The transport set by the current settings
+    """
+    global _TRANSPORT
+
+    # Make the shared transport again if the settings have changed
+    current = settings()
+    if _TRANSPORT is None or _TRANSPORT.settings != current:
+        mode, fixtures, latency, failure_rate, seed = current
+        kwargs = {'latency': latency, 'failure_rate': failure_rate, 'seed': seed}
+        if mode == 'live':
+            _TRANSPORT = Transport(**kwargs)
+        else:
+            _TRANSPORT = (Recorder if mode == 'record' else Replay)(fixtures=fixtures, **kwargs)
+        _TRANSPORT.settings = current
+
+    return _TRANSPORT
+
+
+def read_fixture(filepath):
+    """Read the response in a fixture file
+
+    Parameters
+    ----------
+    filepath: str
+        The path to the fixture file
+
+    Returns
+    -------
+    object
+        The response
+    """
+    with open(filepath, 'rb') as f:
+        return pickle.load(f)['response']
+
+
+def register(service, client):
+    """Register the client of a service
+
+    Parameters
+    ----------
+    service: str
+        The name of the service
+    client: object
+        The client, whose methods are called by name, or a function
+    """
+    SERVICES[service] = client
+
+
+def request(service, method, *args, **kwargs):
+    """Send a request to a service with the shared transport
+
+    Parameters
+    ----------
+    service: str
+        The name of the registered service
+    method: str (optional)
+        The method of the service client, or None to call the client
+
+    Returns
+    -------
+    object
+        The response
+    """
+    return get_transport().request(service, method, *args, **kwargs)
+
+
+def settings():
+    """Get the settings of the shared transport, overridden by the
+    SEDKIT_TRANSPORT, SEDKIT_FIXTURES, SEDKIT_LATENCY and
+    SEDKIT_FAILURE_RATE environment variables
+
+    Returns
+    -------
+    tuple
+        The mode, fixtures directory, latency, failure rate and seed
+    """
+    mode = os.environ.get('SEDKIT_TRANSPORT') or SETTINGS['mode']
+    if mode not in MODES:
+        raise ValueError("{}: Please use one of the modes {}".format(mode, MODES))
+
+    try:
+        latency = os.environ.get('SEDKIT_LATENCY')
+        latency = SETTINGS['latency'] if latency is None else tuple(float(i) for i in latency.split(',')) if ',' in latency else float(latency)
+        failure_rate = float(os.environ.get('SEDKIT_FAILURE_RATE') or SETTINGS['failure_rate'])
+    except ValueError:
+        raise ValueError("SEDKIT_LATENCY and SEDKIT_FAILURE_RATE must be numbers.")
+
+    latency = tuple(latency) if isinstance(latency, list) else latency
+    fixtures = os.environ.get('SEDKIT_FIXTURES') or SETTINGS['fixtures']
+
+    return mode, fixtures, latency, failure_rate, SETTINGS['seed']
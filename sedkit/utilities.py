@@ -5,25 +5,35 @@
 Some utilities to accompany sedkit
 """
 import copy
+import hashlib
+import importlib
 import itertools
+import math
 import os
 import re
 import warnings
 
 import astropy.constants as ac
 from astropy.io import fits, ascii
-from astropy.modeling.blackbody import blackbody_lambda
-from astropy.modeling import models
 import astropy.table as at
 import astropy.units as q
-import bokeh.palettes as bpal
 import numpy as np
-import pandas as pd
-import scipy.optimize as opt
 
 
 warnings.simplefilter('ignore')
 
+# Bump this when the binary data cache is no longer valid
+DATA_CACHE_VERSION = 1
+
+# The constants of pi * B_lambda(T) in um, K and erg/s/cm2/A
+PLANCK_C1 = (2 * np.pi * ac.h * ac.c**2).to(q.erg / q.s / q.cm**2 / q.AA * q.um**5).value
+PLANCK_C2 = (ac.h * ac.c / ac.k_B).to(q.um * q.K).value
+
+# The (power, coefficient) terms of the Bernoulli series of planck_fraction,
+# B_k / (k! (k+3)) x^(k+3) with the Bernoulli numbers B_k
+PLANCK_SERIES = [(k + 3, bk / (math.factorial(k) * (k + 3))) for k, bk in
+                 [(0, 1.), (1, -1 / 2.), (2, 1 / 6.), (4, -1 / 30.), (6, 1 / 42.), (8, -1 / 30.), (10, 5 / 66.), (12, -691 / 2730.), (14, 7 / 6.)]]
+
 # Valid dtypes for units
 UNITS = q.core.PrefixUnit, q.core.Unit, q.core.CompositeUnit, q.quantity.Quantity, q.core.IrreducibleUnit
 
@@ -45,7 +55,88 @@ PHOT_ALIASES = {'2MASS_J': '2MASS.J', '2MASS_H': '2MASS.H',
                 'FourStar_J3': 'FourStar.J3', 'HST_F125W': 'WFC3_IR.F125W'}
 
 
-@models.custom_model
+class LazyImport:
+    """A module, or an object in one, which is only imported when it is
+    first used so that plotting and network packages do not slow down
+    importing sedkit"""
+    def __init__(self, module, attr=None, setup=None):
+        """Initialize the reference
+
+        Parameters
+        ----------
+        module: str
+            The name of the module
+        attr: str (optional)
+            The name of the object in the module
+        setup: callable (optional)
+            A function of the imported object which configures it and
+            returns the object to use
+        """
+        self._module = module
+        self._attr = attr
+        self._setup = setup
+        self._obj = None
+
+    def __call__(self, *args, **kwargs):
+        """Call the imported object"""
+        return self.load()(*args, **kwargs)
+
+    def __dir__(self):
+        """List the attributes of the imported object"""
+        return dir(self.load())
+
+    def __getattr__(self, attr):
+        """Get an attribute of the imported object"""
+        if attr in ['_module', '_attr', '_setup', '_obj']:
+            raise AttributeError(attr)
+
+        return getattr(self.load(), attr)
+
+    def __instancecheck__(self, obj):
+        """Check if an object is an instance of the imported class"""
+        return isinstance(obj, self.load())
+
+    def __repr__(self):
+        """The reference"""
+        name = self._module if self._attr is None else '{}.{}'.format(self._module, self._attr)
+        return '<LazyImport {}{}>'.format(name, '' if self._obj is None else ' (loaded)')
+
+    @property
+    def loaded(self):
+        """Whether the object has been imported"""
+        return self._obj is not None
+
+    def load(self):
+        """Import the object the first time it is needed
+
+        Returns
+        -------
+        object
+            The module or object
+        """
+        if self._obj is None:
+            obj = importlib.import_module(self._module)
+            if self._attr is not None:
+                obj = getattr(obj, self._attr)
+            if self._setup is not None:
+                obj = self._setup(obj)
+            self._obj = obj
+
+        return self._obj
+
+
+# Plotting packages
+bpal = LazyImport('bokeh.palettes')
+bkp = LazyImport('bokeh.plotting')
+
+# Modeling and optimization packages
+blackbody_lambda = LazyImport('astropy.modeling.blackbody', 'blackbody_lambda')
+opt = LazyImport('scipy.optimize')
+
+# The table query engine, which imports pandas
+Query = LazyImport('sedkit.tablequery', 'Query')
+
+
 def blackbody(wavelength, temperature=2000):
     """
     Generate a blackbody of the given temperature at the given wavelengths
@@ -69,6 +160,32 @@ def blackbody(wavelength, temperature=2000):
     return blackbody_lambda(wavelength, temperature).value / max_val
 
 
+# The blackbody model is made the first time it is used
+blackbody = LazyImport('astropy.modeling.models', 'custom_model', setup=lambda custom_model, func=blackbody: custom_model(func))
+
+
+def cache_dir(*subdirs):
+    """
+    Get the path to the sedkit cache directory, creating it if necessary.
+    Set the SEDKIT_CACHE environment variable to use a different location.
+
+    Parameters
+    ----------
+    subdirs: str
+        The names of the subdirectories to append
+
+    Returns
+    -------
+    str
+        The path to the directory
+    """
+    root = os.environ.get('SEDKIT_CACHE', os.path.join(os.path.expanduser('~'), '.sedkit', 'cache'))
+    path = os.path.join(root, *subdirs)
+    os.makedirs(path, exist_ok=True)
+
+    return path
+
+
 def color_gen(colormap='viridis', key=None, n=10):
     """Color generator for Bokeh plots
 
@@ -230,101 +347,16 @@ def filter_table(table, **kwargs):
     value: str, float, int, sequence
         The criteria to filter by,
         which can be single valued like 1400
-        or a range with operators [<, <=, >, >=],
-        e.g. ('>1200', '<=1400')
+        or a range with operators [<, <=, >, >=, ==, !=],
+        e.g. ('>1200', '<=1400'), a wildcard like 'M*',
+        or alternatives like '<1200|>1400'
 
     Returns
     -------
     astropy.table.Table, pandas.DataFrame
         The filtered table
     """
-    pandas = False
-    if isinstance(table, pd.DataFrame):
-        pandas = True
-        table = at.Table.from_pandas(table)
-
-    for param, value in kwargs.items():
-
-        # Check it is a valid column
-        if param not in table.colnames:
-            raise KeyError("No column named {}".format(param))
-
-        # Wildcard case
-        if isinstance(value, str) and '*' in value:
-
-            # Get column data
-            data = np.array(table[param])
-
-            if not value.startswith('*'):
-                value = '^' + value
-            if not value.endswith('*'):
-                value = value + '$'
-
-            # Strip souble quotes
-            value = value.replace("'", '').replace('"', '').replace('*', '(.*)')
-
-            # Regex
-            reg = re.compile(value, re.IGNORECASE)
-            keep = list(filter(reg.findall, data))
-
-            # Get indexes
-            idx = np.where([i in keep for i in data])
-
-            # Filter table
-            table = table[idx]
-
-        else:
-
-            # Make single value string into conditions
-            if isinstance(value, str):
-
-                # Check for operator
-                if any([value.startswith(o) for o in ['<', '>', '=']]):
-                    value = [value]
-
-                # Assume eqality if no operator
-                else:
-                    value = ['== ' + value]
-
-            # Turn numbers into strings
-            if isinstance(value, (int, float)) or (isinstance(value, str) and isnumber(value)):
-                value = ["== {}".format(value)]
-
-            # Iterate through multiple conditions
-            for cond in value:
-
-                # Equality
-                if cond.startswith('='):
-                    v = cond.replace('=', '')
-                    table = table[table[param] == eval(v)]
-
-                # Less than or equal
-                elif cond.startswith('<='):
-                    v = cond.replace('<=', '')
-                    table = table[table[param] <= eval(v)]
-
-                # Less than
-                elif cond.startswith('<'):
-                    v = cond.replace('<', '')
-                    table = table[table[param] < eval(v)]
-
-                # Greater than or equal
-                elif cond.startswith('>='):
-                    v = cond.replace('>=', '')
-                    table = table[table[param] >= eval(v)]
-
-                # Greater than
-                elif cond.startswith('>'):
-                    v = cond.replace('>', '')
-                    table = table[table[param] > eval(v)]
-
-                else:
-                    raise ValueError("'{}' operator not understood.".format(cond))
-
-    if pandas:
-        table = table.to_pandas()
-
-    return table
+    return Query(**kwargs).filter(table)
 
 
 def finalize_spec(spec, wave_units=q.um, flux_units=q.erg / q.s / q.cm**2 / q.AA):
@@ -415,7 +447,8 @@ def flux2mag(flx, bandpass):
     unit = flx.unit
 
     # Set uncertainty
-    unc = unc or np.nan * unit
+    if unc is None or (np.ndim(unc) == 0 and getattr(unc, 'value', unc) == 0):
+        unc = np.nan * unit
 
     # Convert energy units to photon counts
     flx = (flx * (eff / (ac.h * ac.c)).to(1 / q.erg)).to(unit / q.erg)
@@ -602,6 +635,20 @@ def group_spectra(spectra):
     return groups
 
 
+def headless():
+    """
+    Check if sedkit is running headless, in which case figures are only
+    made when a plot method is called and are never shown or rendered.
+    Set the SEDKIT_HEADLESS environment variable to 1 to run headless.
+
+    Returns
+    -------
+    bool
+        Whether to skip showing and rendering figures
+    """
+    return os.environ.get('SEDKIT_HEADLESS', '').lower() in ['1', 'true', 'yes']
+
+
 def idx_exclude(x, exclude):
     """
     Return the indexes of the array that exclude the given ranges
@@ -742,6 +789,273 @@ def pi2pc(dist, unc_lower=None, unc_upper=None, pi_unit=q.mas, dist_unit=q.pc, p
         return val, low
 
 
+def planck(wave, teff, derivative=False):
+    """
+    Evaluate the flux of a blackbody, pi * B_lambda(T), in plain floats,
+    broadcasting the wavelengths against the temperatures
+
+    Parameters
+    ----------
+    wave: float, array-like
+        The wavelengths [um]
+    teff: float, array-like
+        The temperatures [K]
+    derivative: bool
+        Also return the derivative with respect to temperature
+
+    Returns
+    -------
+    np.ndarray, sequence
+        The flux density [erg/s/cm2/A] and its derivative [erg/s/cm2/A/K]
+    """
+    wave = np.asarray(wave, dtype=float)
+    teff = np.asarray(teff, dtype=float)
+    x = PLANCK_C2 / (wave * teff)
+
+    # Overflows at short wavelengths are just zero flux
+    with np.errstate(over='ignore'):
+        flux = PLANCK_C1 / wave**5 / np.expm1(x)
+
+    if not derivative:
+        return flux
+
+    # dB/dT = B x e^x / (T (e^x - 1))
+    with np.errstate(over='ignore', invalid='ignore'):
+        dflux = np.nan_to_num(flux * x / -np.expm1(-x) / teff)
+
+    return flux, dflux
+
+
+def planck_fraction(x):
+    """
+    Calculate the fraction of the flux of a blackbody emitted at
+    wavelengths longer than hc/(x kT), i.e. (15/pi^4) times the integral of
+    t^3/(e^t - 1) from 0 to x, from its Bernoulli series for small x and
+    its exponential series for large x
+
+    Parameters
+    ----------
+    x: float, array-like
+        The dimensionless frequency hc/(lambda kT)
+
+    Returns
+    -------
+    np.ndarray
+        The fraction of the bolometric flux
+    """
+    x = np.asarray(x, dtype=float)
+    frac = np.ones_like(x)
+    small = x < 2
+    xs = x[small]
+    xl = x[~small & np.isfinite(x)]
+
+    # sum_k B_k x^(k+3) / (k! (k+3)) with the Bernoulli numbers B_k
+    frac[small] = sum(coeff * xs**power for power, coeff in PLANCK_SERIES) * 15 / np.pi**4
+
+    # 1 - sum_n e^(-nx) (x^3/n + 3x^2/n^2 + 6x/n^3 + 6/n^4)
+    n = np.arange(1, 21)[:, None]
+    tail = np.sum(np.exp(-n * xl) * (xl**3 / n + 3 * xl**2 / n**2 + 6 * xl / n**3 + 6 / n**4), axis=0)
+    frac[~small & np.isfinite(x)] = 1 - tail * 15 / np.pi**4
+
+    return frac
+
+
+def planck_integral(wave_min, wave_max, teff, units=q.erg / q.s / q.cm**2):
+    """
+    Integrate the flux of a blackbody, pi * B_lambda(T), between two
+    wavelengths analytically
+
+    Parameters
+    ----------
+    wave_min: astropy.units.quantity.Quantity
+        The lower wavelength limit, which can be zero
+    wave_max: astropy.units.quantity.Quantity
+        The upper wavelength limit, which can be infinite
+    teff: astropy.units.quantity.Quantity
+        The temperature
+    units: astropy.units.quantity.Quantity
+        The target units for the integral
+
+    Returns
+    -------
+    astropy.units.quantity.Quantity
+        The integrated flux
+    """
+    # Convert the limits to dimensionless frequencies
+    scale = PLANCK_C2 / teff.to(q.K).value
+    with np.errstate(divide='ignore'):
+        x_min = scale / np.asarray(wave_max.to(q.um).value, dtype=float)
+        x_max = scale / np.asarray(wave_min.to(q.um).value, dtype=float)
+
+    total = (ac.sigma_sb * teff**4).to(units)
+
+    return total * (planck_fraction(x_max) - planck_fraction(x_min))
+
+
+def _cached_file(filepath, reader, **kwargs):
+    """
+    Get the path to the binary cache of a data file read with the given
+    reader and arguments, and the checksum of the data file
+
+    Parameters
+    ----------
+    filepath: str
+        The path to the data file
+    reader: str
+        The name of the reader
+
+    Returns
+    -------
+    tuple
+        The path to the cached file and the checksum of the data file
+    """
+    with open(filepath, 'rb') as f:
+        checksum = hashlib.sha1(f.read()).hexdigest()
+    key = repr((os.path.abspath(filepath), reader, sorted(kwargs.items()), DATA_CACHE_VERSION)).encode()
+    cached = os.path.join(cache_dir('data'), '{}_{}.npz'.format(os.path.basename(filepath), hashlib.sha1(key).hexdigest()))
+
+    return cached, checksum
+
+
+def _load_cached(cached, checksum):
+    """
+    Load a binary cache file if it matches the checksum of the data file
+
+    Parameters
+    ----------
+    cached: str
+        The path to the cached file
+    checksum: str
+        The checksum of the data file
+
+    Returns
+    -------
+    dict, None
+        The arrays in the file, or None if it is missing or stale
+    """
+    if not os.path.isfile(cached):
+        return None
+
+    try:
+        with np.load(cached, allow_pickle=False) as npz:
+            if str(npz['__checksum__']) == checksum:
+                return {key: npz[key] for key in npz.files}
+    except (IOError, ValueError, KeyError):
+        pass
+
+    return None
+
+
+def _save_cached(cached, checksum, arrays):
+    """
+    Write a binary cache file
+
+    Parameters
+    ----------
+    cached: str
+        The path to the cached file
+    checksum: str
+        The checksum of the data file
+    arrays: dict
+        The arrays to save
+    """
+    # Write to a temporary file first so a partial write is never loaded
+    tmp = '{}.{}.tmp.npz'.format(cached[:-4], os.getpid())
+    try:
+        np.savez(tmp, __checksum__=np.array(checksum), **arrays)
+        os.replace(tmp, cached)
+    except (IOError, OSError, ValueError):
+        if os.path.isfile(tmp):
+            os.remove(tmp)
+
+
+def read_array(filepath, cache=True, **kwargs):
+    """
+    Read a numeric data file with np.genfromtxt, caching it in binary form
+    in the sedkit cache directory for faster loading next time
+
+    Parameters
+    ----------
+    filepath: str
+        The path to the data file
+    cache: bool
+        Use the binary cache
+
+    Returns
+    -------
+    np.ndarray
+        The data
+    """
+    if not cache:
+        return np.genfromtxt(filepath, **kwargs)
+
+    # Load the cached file...
+    cached, checksum = _cached_file(filepath, 'genfromtxt', **kwargs)
+    arrays = _load_cached(cached, checksum)
+    if arrays is not None:
+        return arrays['data']
+
+    # ...or read the data file and cache it
+    data = np.genfromtxt(filepath, **kwargs)
+    _save_cached(cached, checksum, {'data': data})
+
+    return data
+
+
+def read_table(filepath, cache=True, **kwargs):
+    """
+    Read an ASCII table with astropy.io.ascii, caching it in binary form in
+    the sedkit cache directory for faster loading next time
+
+    Parameters
+    ----------
+    filepath: str
+        The path to the data file
+    cache: bool
+        Use the binary cache
+
+    Returns
+    -------
+    astropy.table.Table
+        The table
+    """
+    if not cache:
+        return ascii.read(filepath, **kwargs)
+
+    # Load the cached file...
+    cached, checksum = _cached_file(filepath, 'ascii', **kwargs)
+    arrays = _load_cached(cached, checksum)
+    if arrays is not None and 'table_masked' in arrays:
+        data, units = arrays['data'], arrays['units']
+        masks = dict(zip(arrays.get('masked', []), arrays.get('mask', [])))
+        columns = []
+        for name, unit in zip(data.dtype.names, units):
+            unit = str(unit) or None
+            if name in masks:
+                columns.append(at.MaskedColumn(data[name], name=name, mask=masks[name], unit=unit))
+            else:
+                columns.append(at.Column(data[name], name=name, unit=unit))
+
+        return at.Table(columns, masked=bool(arrays['table_masked']))
+
+    # ...or read the data file and cache it as a single structured array
+    table = ascii.read(filepath, **kwargs)
+    if all(col.dtype.kind != 'O' for col in table.itercols()):
+        arrays = {'data': np.asarray(table.as_array()), 'units': np.array([str(col.unit or '') for col in table.itercols()]),
+                  'table_masked': np.array(table.masked)}
+
+        # Save the mask of each masked column, as astropy>=4 tables of
+        # MaskedColumns are not themselves masked
+        masked = [col.name for col in table.itercols() if isinstance(col, at.MaskedColumn)]
+        if masked:
+            arrays['masked'] = np.array(masked)
+            arrays['mask'] = np.array([np.ma.getmaskarray(table[name]) for name in masked]).reshape(len(masked), len(table))
+
+        _save_cached(cached, checksum, arrays)
+
+    return table
+
+
 def scrub(raw_data, fill_value=None):
     """
     For input data [w, f, e] or [w, f] returns the list with negative, and
@@ -780,6 +1094,19 @@ def scrub(raw_data, fill_value=None):
     return data
 
 
+def show(fig):
+    """
+    Show a bokeh figure unless running headless
+
+    Parameters
+    ----------
+    fig: bokeh.plotting.figure.Figure
+        The figure to show
+    """
+    if not headless():
+        bkp.show(fig)
+
+
 def spectres(new_spec_wavs, old_spec_wavs, spec_fluxes, spec_errs=None):
     """
     Function for resampling spectra (and optionally associated uncertainties)
@@ -27,7 +27,8 @@ setup(
     ],
     keywords='astrophysics',
     packages=find_packages(exclude=['contrib', 'docs', 'tests*']),
-    install_requires=['numpy','astropy','bokeh','pysynphot','scipy','astroquery','dustmaps', 'pandas', 'svo_filters'],
+    install_requires=['numpy','astropy','bokeh','pysynphot','scipy','astroquery','dustmaps', 'h5py', 'pandas', 'svo_filters'],
     include_package_data=True,
+    package_data={'sedkit': ['data/spt_radius.json']},
 
 )
\ No newline at end of file